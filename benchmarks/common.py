@@ -0,0 +1,103 @@
+"""
+Shared pieces for the benchmarks.
+
+Everything here runs against a real, but bare, Home Assistant core; the
+registries and restore state are loaded from an empty config directory and
+nothing talks to the network.
+"""
+
+import importlib
+import inspect
+import json
+import pathlib
+import platform
+import sys
+from types import MappingProxyType
+
+REPOSITORY = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPOSITORY))
+
+from homeassistant import loader
+from homeassistant.config_entries import ConfigEntries, ConfigEntry
+from homeassistant.const import __version__ as HA_VERSION
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import (
+    area_registry as ar,
+    device_registry as dr,
+    entity_registry as er,
+    restore_state as rs,
+)
+
+from custom_components.virtual import VIRTUAL_PLATFORMS
+from custom_components.virtual.const import *
+
+
+async def async_start_hass(config_dir: str) -> HomeAssistant:
+    """Start a bare core with the registries our setup touches."""
+    hass = HomeAssistant(config_dir)
+    if hasattr(loader, "async_setup"):
+        loader.async_setup(hass)
+    hass.config.skip_pip = True
+
+    await ar.async_load(hass)
+    await dr.async_load(hass)
+    await er.async_load(hass)
+    await rs.async_load(hass)
+
+    hass.config_entries = ConfigEntries(hass, {})
+    await hass.config_entries.async_initialize()
+
+    # What `async_setup` would have done.
+    hass.data[COMPONENT_DOMAIN] = {}
+    hass.data[COMPONENT_CONFIG] = {
+        CONF_YAML_CONFIG: False,
+        CONF_TIMER_RESOLUTION: DEFAULT_TIMER_RESOLUTION,
+        CONF_ANIMATION_FRAME_RATE: DEFAULT_ANIMATION_FRAME_RATE,
+    }
+    return hass
+
+
+def make_config_entry(group_name: str, file_name: str) -> ConfigEntry:
+    """Make a virtual config entry, whichever core version we have."""
+    wanted = {
+        "domain": COMPONENT_DOMAIN,
+        "title": group_name,
+        "data": {ATTR_GROUP_NAME: group_name, ATTR_FILE_NAME: file_name},
+        "source": "user",
+        "version": 1,
+        "minor_version": 1,
+        "options": {},
+        "unique_id": None,
+        "discovery_keys": MappingProxyType({}),
+        "subentries_data": None,
+    }
+    parameters = inspect.signature(ConfigEntry).parameters
+    return ConfigEntry(**{key: value for key, value in wanted.items() if key in parameters})
+
+
+def platform_module(platform_name):
+    return importlib.import_module(f"custom_components.{COMPONENT_DOMAIN}.{platform_name}")
+
+
+def percentiles(samples: list[float], points=(50, 90, 99)) -> dict:
+    """Nearest rank percentiles, `samples` in seconds, results in ms."""
+    if not samples:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(samples)
+    return {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))] * 1e3
+        for point in points
+    }
+
+
+def write_results(file_name: str, benchmark: str, results) -> None:
+    """Save results with enough context to compare runs."""
+    with open(file_name, "w") as results_file:
+        json.dump({
+            "benchmark": benchmark,
+            "python": platform.python_version(),
+            "home_assistant": HA_VERSION,
+            "platforms": [str(name) for name in VIRTUAL_PLATFORMS],
+            "results": results,
+        }, results_file, indent=4)
+    print(f"results written to {file_name}")
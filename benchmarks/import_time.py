@@ -0,0 +1,136 @@
+"""
+Check how long importing the virtual package takes.
+
+Imports `custom_components.virtual`, and optionally some of its platforms, in
+a fresh interpreter with `-X importtime` and reports what the import cost and
+which modules cost the most. By default the Home Assistant modules that are
+always loaded before an integration are imported first, so only our share is
+counted, pass `--cold` to count everything. Exits with an error if the median
+cost is over the budget or has grown too much since a saved baseline. Needs
+Home Assistant installed, run it from the top of the repository:
+
+    python benchmarks/import_time.py --platforms sensor switch --budget 150
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import subprocess
+import sys
+
+REPOSITORY = pathlib.Path(__file__).resolve().parents[1]
+
+PACKAGE = "custom_components.virtual"
+
+# Loaded by the core before it sets up any integration.
+PRELOAD = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.device_registry",
+    "homeassistant.helpers.entity",
+    "homeassistant.helpers.entity_platform",
+    "homeassistant.helpers.restore_state",
+    "homeassistant.helpers.service",
+)
+
+# In milliseconds, generous so only real regressions trip it.
+DEFAULT_BUDGET = 150
+DEFAULT_TOLERANCE = 25
+TOP_MODULES = 15
+
+
+def _import_once(modules: list[str], cold: bool) -> dict[str, tuple[int, int]]:
+    """Import `modules` in a new interpreter, return self and cumulative us by module."""
+    preload = "" if cold else "".join(f"import {module}; " for module in PRELOAD)
+    code = preload + "".join(f"import {module}; " for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPOSITORY, capture_output=True, text=True, check=False,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"import failed:\n{result.stderr}")
+
+    # Modules are listed as they finish importing, so anything listed before
+    # the last preloaded module was imported for the preload.
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2].strip()
+        if not cold and name in PRELOAD:
+            times = {}
+            continue
+        times[name] = (own, cumulative)
+    return times
+
+
+def _cost(times: dict[str, tuple[int, int]], modules: list[str]) -> float:
+    """What the asked for modules cost, in ms, counting each import once."""
+    return sum(times.get(module, (0, 0))[1] for module in modules) / 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--platforms", nargs="*", default=[], help="platform modules to import too")
+    parser.add_argument("--runs", type=int, default=5, help="how many fresh interpreters to time")
+    parser.add_argument("--cold", action="store_true", help="count the Home Assistant imports as well")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="fail above this many ms")
+    parser.add_argument("--baseline", help="fail if slower than the results saved in this file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="percent slower than the baseline that is allowed")
+    parser.add_argument("--output", default="import_time.json", help="where to write the results")
+    args = parser.parse_args()
+
+    modules = [PACKAGE] + [f"{PACKAGE}.{platform}" for platform in args.platforms]
+    runs = [_import_once(modules, args.cold) for _ in range(args.runs)]
+    costs = [_cost(times, modules) for times in runs]
+    cost = statistics.median(costs)
+
+    # The costliest modules, by their own time, from the median run.
+    median_run = runs[costs.index(sorted(costs)[len(costs) // 2])]
+    top = sorted(
+        ((own / 1e3, name) for name, (own, _cumulative) in median_run.items()),
+        reverse=True,
+    )[:TOP_MODULES]
+
+    print(f"import {' '.join(modules)}")
+    print(f"median {cost:.1f}ms over {args.runs} runs, min {min(costs):.1f}ms, max {max(costs):.1f}ms")
+    print(f"{'module':<56} {'self':>10}")
+    for own, name in top:
+        print(f"{name:<56} {own:8.1f}ms")
+
+    with open(args.output, "w") as results_file:
+        json.dump({
+            "benchmark": "import_time",
+            "python": sys.version.split()[0],
+            "cold": args.cold,
+            "modules": modules,
+            "median_ms": cost,
+            "runs_ms": costs,
+            "top_ms": {name: own for own, name in top},
+        }, results_file, indent=4)
+    print(f"results written to {args.output}")
+
+    failed = False
+    if cost > args.budget:
+        print(f"FAIL: {cost:.1f}ms is over the {args.budget:g}ms budget")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["median_ms"]
+        if cost > baseline * (1 + args.tolerance / 100):
+            print(f"FAIL: {cost:.1f}ms is more than {args.tolerance:g}% over the {baseline:.1f}ms baseline")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
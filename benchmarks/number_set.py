@@ -0,0 +1,75 @@
+"""
+Measure how fast virtual numbers can be set.
+
+Compares the old path, where every set hopped to the executor just to assign
+an attribute, with the current in-loop set that also publishes the state.
+Needs Home Assistant installed, run it from the top of the repository:
+
+    python benchmarks/number_set.py --count 10000
+"""
+
+import argparse
+import asyncio
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from homeassistant.core import HomeAssistant
+
+from custom_components.virtual.number import NUMBER_SCHEMA, VirtualNumber
+
+
+def _make_number(hass, index):
+    number = VirtualNumber(NUMBER_SCHEMA({
+        "name": f"Benchmark Number {index}",
+        "min": 0,
+        "max": 1000000,
+        "persistent": False,
+    }), False)
+    number.hass = hass
+    number._create_state(number._config)
+    number._update_attributes()
+    return number
+
+
+async def _legacy_set(hass, number, value):
+    """What `async_set_native_value` used to do."""
+    def _set(new_value):
+        number._attr_native_value = new_value
+    await hass.async_add_executor_job(_set, value)
+
+
+async def _run(count):
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        number = _make_number(hass, 0)
+
+        start = time.perf_counter()
+        for value in range(count):
+            await _legacy_set(hass, number, value)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for value in range(count):
+            await number.async_set_native_value(value)
+        in_loop = time.perf_counter() - start
+
+        await hass.async_stop(force=True)
+
+    print(f"sets:            {count}")
+    print(f"executor hop:    {count / legacy:12.0f} sets/s  ({legacy * 1e6 / count:8.2f} us/set)")
+    print(f"in loop + write: {count / in_loop:12.0f} sets/s  ({in_loop * 1e6 / count:8.2f} us/set)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=10000, help="number of sets to time")
+    args = parser.parse_args()
+    asyncio.run(_run(args.count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Measure steady state throughput of virtual entities.
+
+A group with `--entities` of each kind is set up through a real config entry
+and then driven through the service layer:
+
+- `set`; `virtual.set` on sensors
+- `turn_on`; `virtual.turn_on` and `virtual.turn_off` on binary sensors
+- `set_available`; `virtual.set_available` on switches
+- `move`; `virtual.move` by GPS on device trackers
+- `light_turn_on`; `light.turn_on` with brightness and colour
+- `lock_storm`; `lock.lock` and `lock.unlock` faster than locks can change
+- `cover_tick` and `cover_analytic`; every cover opening at once
+
+Service scenarios report latency percentiles, timed scenarios report state
+writes per second. Every scenario reports the CPU time the event loop used.
+Needs Home Assistant installed, run it from the top of the repository:
+
+    python benchmarks/runtime.py --entities 100 --calls 10000 --output runtime.json
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from common import (
+    async_start_hass,
+    make_config_entry,
+    percentiles,
+    write_results,
+)
+
+from homeassistant.components.light import ATTR_BRIGHTNESS, ATTR_HS_COLOR
+from homeassistant.const import (
+    ATTR_ENTITY_ID,
+    ATTR_LATITUDE,
+    ATTR_LONGITUDE,
+    CONF_PLATFORM,
+    EVENT_STATE_CHANGED,
+    Platform,
+)
+from homeassistant.util.yaml import dump
+
+from custom_components.virtual.const import *
+
+
+GROUP_NAME = "benchmark"
+LOCKING_TIME = 1
+
+
+def _write_config(file_name, count):
+    entities = []
+    for index in range(count):
+        entities += [
+            {CONF_PLATFORM: "sensor", CONF_NAME: f"Runtime Sensor {index}"},
+            {CONF_PLATFORM: "binary_sensor", CONF_NAME: f"Runtime Binary Sensor {index}"},
+            {CONF_PLATFORM: "switch", CONF_NAME: f"Runtime Switch {index}"},
+            {CONF_PLATFORM: "device_tracker", CONF_NAME: f"Runtime Tracker {index}"},
+            {CONF_PLATFORM: "light", CONF_NAME: f"Runtime Light {index}",
+             "support_brightness": True, "support_color": True},
+            {CONF_PLATFORM: "lock", CONF_NAME: f"Runtime Lock {index}", "locking_time": LOCKING_TIME},
+            {CONF_PLATFORM: "cover", CONF_NAME: f"Runtime Tick Cover {index}",
+             CONF_INITIAL_VALUE: "closed", CONF_OPEN_CLOSE_MODE: OPEN_CLOSE_MODE_TICK},
+            {CONF_PLATFORM: "cover", CONF_NAME: f"Runtime Analytic Cover {index}",
+             CONF_INITIAL_VALUE: "closed", CONF_OPEN_CLOSE_MODE: OPEN_CLOSE_MODE_ANALYTIC},
+        ]
+    with open(file_name, "w") as config_file:
+        config_file.write(dump({
+            ATTR_VERSION: 1,
+            ATTR_DEVICES: {f"Runtime Device {index}": [entity] for index, entity in enumerate(entities)}
+        }))
+
+
+def _entity_ids(hass, domain, prefix):
+    return sorted(
+        entity_id for entity_id in hass.states.async_entity_ids(domain)
+        if entity_id.startswith(f"{domain}.{prefix}")
+    )
+
+
+class _StateWrites(object):
+    """Count state writes for some entities."""
+
+    def __init__(self, hass, entity_ids):
+        self._entity_ids = set(entity_ids)
+        self.count = 0
+        self._unsub = hass.bus.async_listen(EVENT_STATE_CHANGED, self._changed)
+
+    def _changed(self, event):
+        if event.data[ATTR_ENTITY_ID] in self._entity_ids:
+            self.count += 1
+
+    def stop(self):
+        self._unsub()
+
+
+async def _time_calls(hass, calls, entity_ids, settle=0):
+    """Make the calls one at a time, waiting for each to finish."""
+    writes = _StateWrites(hass, entity_ids)
+    latencies = []
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for domain, service, data in calls:
+        start = time.perf_counter()
+        await hass.services.async_call(domain, service, data, blocking=True)
+        latencies.append(time.perf_counter() - start)
+    if settle:
+        await asyncio.sleep(settle)
+    await hass.async_block_till_done()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    writes.stop()
+    return {
+        "calls": len(calls),
+        "calls_per_second": len(calls) / wall,
+        "latency_ms": percentiles(latencies),
+        "state_writes": writes.count,
+        "loop_cpu_seconds": cpu,
+        "loop_cpu_ms_per_call": cpu * 1e3 / len(calls),
+    }
+
+
+async def _time_movers(hass, entity_ids, duration):
+    """Open every cover and watch them move."""
+    writes = _StateWrites(hass, entity_ids)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    await hass.services.async_call("cover", "open_cover", {ATTR_ENTITY_ID: entity_ids}, blocking=True)
+    await asyncio.sleep(duration)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    writes.stop()
+    await hass.services.async_call("cover", "stop_cover", {ATTR_ENTITY_ID: entity_ids}, blocking=True)
+    await hass.async_block_till_done()
+    return {
+        "movers": len(entity_ids),
+        "seconds": wall,
+        "state_writes": writes.count,
+        "state_writes_per_second": writes.count / wall,
+        "loop_cpu_seconds": cpu,
+        "loop_busy_fraction": cpu / wall,
+    }
+
+
+async def _run(args):
+    rng = random.Random(args.seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        file_name = os.path.join(config_dir, "virtual.yaml")
+        _write_config(file_name, args.entities)
+
+        hass = await async_start_hass(config_dir)
+        await hass.config_entries.async_add(make_config_entry(GROUP_NAME, file_name))
+        await hass.async_block_till_done()
+
+        sensors = _entity_ids(hass, "sensor", "runtime_sensor")
+        binary_sensors = _entity_ids(hass, "binary_sensor", "runtime_binary_sensor")
+        switches = _entity_ids(hass, "switch", "runtime_switch")
+        trackers = _entity_ids(hass, "device_tracker", "runtime_tracker")
+        lights = _entity_ids(hass, "light", "runtime_light")
+        locks = _entity_ids(hass, "lock", "runtime_lock")
+        tick_covers = _entity_ids(hass, "cover", "runtime_tick_cover")
+        analytic_covers = _entity_ids(hass, "cover", "runtime_analytic_cover")
+
+        results["set"] = await _time_calls(hass, [
+            (COMPONENT_DOMAIN, "set", {ATTR_ENTITY_ID: sensors[call % len(sensors)], "value": str(call)})
+            for call in range(args.calls)
+        ], sensors)
+
+        results["turn_on"] = await _time_calls(hass, [
+            (COMPONENT_DOMAIN, "turn_on" if (call // len(binary_sensors)) % 2 == 0 else "turn_off",
+             {ATTR_ENTITY_ID: binary_sensors[call % len(binary_sensors)]})
+            for call in range(args.calls)
+        ], binary_sensors)
+
+        results["set_available"] = await _time_calls(hass, [
+            (COMPONENT_DOMAIN, "set_available",
+             {ATTR_ENTITY_ID: switches[call % len(switches)], "value": (call // len(switches)) % 2 == 1})
+            for call in range(args.calls)
+        ], switches)
+
+        results["move"] = await _time_calls(hass, [
+            (COMPONENT_DOMAIN, "move", {
+                ATTR_ENTITY_ID: rng.choice(trackers),
+                "gps": {ATTR_LATITUDE: 51.5 + rng.uniform(-0.1, 0.1), ATTR_LONGITUDE: rng.uniform(-0.2, 0.2)},
+            })
+            for _ in range(args.calls)
+        ], trackers)
+
+        results["light_turn_on"] = await _time_calls(hass, [
+            ("light", "turn_on", {
+                ATTR_ENTITY_ID: rng.choice(lights),
+                ATTR_BRIGHTNESS: rng.randint(1, 255),
+                ATTR_HS_COLOR: (rng.uniform(0, 360), rng.uniform(0, 100)),
+            })
+            for _ in range(args.calls)
+        ], lights)
+
+        results["lock_storm"] = await _time_calls(hass, [
+            ("lock", rng.choice(("lock", "unlock")), {ATTR_ENTITY_ID: rng.choice(locks)})
+            for _ in range(args.calls)
+        ], locks, settle=LOCKING_TIME + 0.5)
+
+        results["cover_tick"] = await _time_movers(hass, tick_covers, args.duration)
+        results["cover_analytic"] = await _time_movers(hass, analytic_covers, args.duration)
+
+        await hass.async_stop(force=True)
+
+    for name, result in results.items():
+        if "latency_ms" in result:
+            latency = result["latency_ms"]
+            print(f"{name:<15} {result['calls_per_second']:10.0f} calls/s  "
+                  f"p50 {latency['p50']:7.3f}ms  p90 {latency['p90']:7.3f}ms  p99 {latency['p99']:7.3f}ms  "
+                  f"cpu {result['loop_cpu_ms_per_call']:7.3f}ms/call")
+        else:
+            print(f"{name:<15} {result['state_writes_per_second']:10.0f} writes/s  "
+                  f"loop busy {result['loop_busy_fraction'] * 100:5.1f}%")
+
+    write_results(args.output, "runtime", {"entities": args.entities, "calls": args.calls, "scenarios": results})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entities", type=int, default=100, help="entities of each kind")
+    parser.add_argument("--calls", type=int, default=10000, help="service calls per scenario")
+    parser.add_argument("--duration", type=float, default=5, help="seconds to watch covers move")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", default="runtime.json", help="where to write the results")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Measure how virtual group setup scales.
+
+For each size a config file is generated with entities spread across every
+virtual platform, then a group is set up one phase at a time:
+
+- `yaml_parse`; reading `virtual.yaml`
+- `load_first`; `BlendedCfg.async_load` on first boot, creating meta data
+- `meta_merge`; `BlendedCfg.async_load` once meta data exists, less parsing
+- `registry`; creating the devices in the device registry
+- `validation`; each platform's `async_setup_entry`, schemas and entities
+- `entity_add`; adding the entities to Home Assistant
+- `import_yaml`; `UpgradeCfg.async_import_yaml` of an old style config
+
+A second pass, with `tracemalloc` running, records peak and retained memory
+per entity. Needs Home Assistant installed, run it from the top of the
+repository:
+
+    python benchmarks/startup.py --sizes 100 1000 10000 50000 --output startup.json
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+import voluptuous as vol
+
+from common import (
+    async_start_hass,
+    make_config_entry,
+    platform_module,
+    write_results,
+)
+
+from homeassistant.const import CONF_PLATFORM, Platform
+from homeassistant.helpers.entity_platform import EntityPlatform
+from homeassistant.util.yaml import dump
+
+from custom_components.virtual import (
+    VIRTUAL_PLATFORMS,
+    _async_get_or_create_virtual_device_in_registry,
+)
+from custom_components.virtual.cfg import BlendedCfg, UpgradeCfg, _load_user_data
+from custom_components.virtual.const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+GROUP_NAME = "benchmark"
+
+# Platforms the old YAML import understands.
+IMPORT_PLATFORMS = [
+    Platform.BINARY_SENSOR, Platform.DEVICE_TRACKER, Platform.FAN, Platform.LIGHT,
+    Platform.LOCK, Platform.SENSOR, Platform.SWITCH
+]
+
+
+def _entity_config(platform_name, index):
+    config = {CONF_PLATFORM: str(platform_name), CONF_NAME: f"Benchmark {platform_name} {index}"}
+    if platform_name == Platform.SENSOR:
+        config.update({CONF_CLASS: "temperature", "unit_of_measurement": "°C", CONF_INITIAL_VALUE: "21"})
+    elif platform_name == Platform.BINARY_SENSOR:
+        config.update({CONF_CLASS: "motion"})
+    elif platform_name == Platform.NUMBER:
+        config.update({CONF_MIN: 0, CONF_MAX: 100, CONF_INITIAL_VALUE: "50"})
+    return config
+
+
+def _check_entity_configs():
+    """Make sure every platform accepts what we generate before timing anything."""
+    for platform_name in VIRTUAL_PLATFORMS:
+        config = _entity_config(platform_name, 0)
+        config.pop(CONF_PLATFORM)
+        schema = getattr(platform_module(platform_name), f"{str(platform_name).upper()}_SCHEMA")
+        try:
+            schema(config)
+        except vol.Invalid as e:
+            raise SystemExit(f"generated {platform_name} config is invalid: {e}")
+
+
+def _write_config(file_name, size, per_device):
+    devices = {}
+    for index in range(size):
+        platform_name = VIRTUAL_PLATFORMS[index % len(VIRTUAL_PLATFORMS)]
+        devices.setdefault(f"Benchmark Device {index // per_device}", []).append(
+            _entity_config(platform_name, index)
+        )
+    with open(file_name, "w") as config_file:
+        config_file.write(dump({ATTR_VERSION: 1, ATTR_DEVICES: devices}))
+
+
+def _old_config(size):
+    config = {}
+    for index in range(size):
+        platform_name = IMPORT_PLATFORMS[index % len(IMPORT_PLATFORMS)]
+        if platform_name == Platform.DEVICE_TRACKER:
+            config.setdefault(platform_name, [{CONF_PLATFORM: COMPONENT_DOMAIN, "devices": []}])
+            config[platform_name][0]["devices"].append(f"Benchmark Tracker {index}")
+            continue
+        config.setdefault(platform_name, []).append({
+            CONF_PLATFORM: COMPONENT_DOMAIN, CONF_NAME: f"Benchmark {platform_name} {index}"
+        })
+    return config
+
+
+class _Phases(object):
+
+    def __init__(self):
+        self.times = {}
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def stop(self, name):
+        self.times[name] = time.perf_counter() - self._start
+
+
+async def _async_setup_group(config_dir, size, per_device, phases):
+    """Set up a group the way `async_setup_entry` does, a phase at a time."""
+    file_name = os.path.join(config_dir, "virtual.yaml")
+    _write_config(file_name, size, per_device)
+
+    hass = await async_start_hass(config_dir)
+    entry = make_config_entry(GROUP_NAME, file_name)
+    # Known to the registries, but we do the setting up.
+    hass.config_entries._entries[entry.entry_id] = entry
+
+    phases.start()
+    await _load_user_data(file_name)
+    phases.stop("yaml_parse")
+
+    phases.start()
+    await BlendedCfg(hass, entry.data).async_load()
+    phases.stop("load_first")
+
+    phases.start()
+    vcfg = BlendedCfg(hass, entry.data)
+    await vcfg.async_load()
+    phases.stop("meta_merge")
+    phases.times["meta_merge"] = max(0.0, phases.times["meta_merge"] - phases.times["yaml_parse"])
+
+    phases.start()
+    for device in vcfg.devices:
+        await _async_get_or_create_virtual_device_in_registry(hass, entry, device)
+    phases.stop("registry")
+
+    hass.data[COMPONENT_DOMAIN][GROUP_NAME] = {
+        ATTR_ENTITIES: vcfg.entities,
+        ATTR_DEVICES: vcfg.devices,
+        ATTR_FILE_NAME: file_name,
+    }
+
+    phases.start()
+    entities = {}
+    for platform_name in VIRTUAL_PLATFORMS:
+        entities[platform_name] = []
+        await platform_module(platform_name).async_setup_entry(hass, entry, entities[platform_name].extend)
+    phases.stop("validation")
+
+    phases.start()
+    for platform_name in VIRTUAL_PLATFORMS:
+        entity_platform = EntityPlatform(
+            hass=hass,
+            logger=_LOGGER,
+            domain=str(platform_name),
+            platform_name=COMPONENT_DOMAIN,
+            platform=platform_module(platform_name),
+            scan_interval=timedelta(seconds=30),
+            entity_namespace=None,
+        )
+        entity_platform.config_entry = entry
+        await entity_platform.async_add_entities(entities[platform_name])
+    phases.stop("entity_add")
+
+    return hass
+
+
+async def _async_import_yaml(config_dir, size, phases):
+    hass = await async_start_hass(config_dir)
+    config = _old_config(size)
+    phases.start()
+    await UpgradeCfg.async_import_yaml(hass, config)
+    phases.stop("import_yaml")
+    await hass.async_stop(force=True)
+
+
+async def _run_size(size, per_device, memory):
+    result = {"entities": size, "entities_per_device": per_device}
+
+    phases = _Phases()
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await _async_setup_group(config_dir, size, per_device, phases)
+        await hass.async_stop(force=True)
+    with tempfile.TemporaryDirectory() as config_dir:
+        await _async_import_yaml(config_dir, size, phases)
+    result["seconds"] = phases.times
+    result["setup_seconds"] = sum(
+        seconds for name, seconds in phases.times.items() if name not in ("load_first", "import_yaml")
+    )
+
+    if memory:
+        with tempfile.TemporaryDirectory() as config_dir:
+            gc.collect()
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            hass = await _async_setup_group(config_dir, size, per_device, _Phases())
+            gc.collect()
+            retained, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            await hass.async_stop(force=True)
+        result["peak_bytes_per_entity"] = (peak - baseline) / size
+        result["retained_bytes_per_entity"] = (retained - baseline) / size
+
+    return result
+
+
+def _print_result(result):
+    print(f"{result['entities']} entities:")
+    for name, seconds in result["seconds"].items():
+        print(f"  {name:<12} {seconds * 1e3:12.1f} ms  ({seconds * 1e6 / result['entities']:8.1f} us/entity)")
+    if "peak_bytes_per_entity" in result:
+        print(f"  peak         {result['peak_bytes_per_entity']:12.0f} bytes/entity")
+        print(f"  retained     {result['retained_bytes_per_entity']:12.0f} bytes/entity")
+
+
+async def _run(args):
+    results = []
+    for size in args.sizes:
+        result = await _run_size(size, args.per_device, not args.no_memory)
+        _print_result(result)
+        results.append(result)
+    write_results(args.output, "startup", results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000],
+                        help="entity counts to set up")
+    parser.add_argument("--per-device", type=int, default=1, help="entities per device")
+    parser.add_argument("--no-memory", action="store_true", help="skip the memory pass")
+    parser.add_argument("--output", default="startup.json", help="where to write the results")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    _check_entity_configs()
+    asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure zone lookups for virtual GPS moves.
+
+Compares checking every zone, which is what Home Assistant does for each GPS
+update, with the grid index the device tracker now uses. Both must pick the
+same zone for every move. Needs Home Assistant installed, run it from the top
+of the repository:
+
+    python benchmarks/zone_index.py --zones 1000 --moves 10000
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from custom_components.virtual.zones import ZoneIndex, _distance
+
+
+def _make_zones(count, rng):
+    # Spread the zones over a city sized area, roughly 50km across.
+    return [
+        (f"zone.benchmark_{index}",
+         51.5 + rng.uniform(-0.25, 0.25),
+         -0.1 + rng.uniform(-0.4, 0.4),
+         rng.uniform(50, 1000))
+        for index in range(count)
+    ]
+
+
+def _make_moves(count, rng):
+    return [
+        (51.5 + rng.uniform(-0.3, 0.3), -0.1 + rng.uniform(-0.5, 0.5), rng.choice((0, 0, 10, 50, 200)))
+        for _ in range(count)
+    ]
+
+
+def _linear(zones, latitude, longitude, accuracy):
+    """Check every zone, like `homeassistant.components.zone.async_active_zone`."""
+    closest = None
+    closest_distance = None
+    for zone in zones:
+        distance = _distance(latitude, longitude, zone[1], zone[2])
+        if distance - accuracy >= zone[3]:
+            continue
+        if (closest is None or distance < closest_distance or
+                (distance == closest_distance and zone[3] < closest[3])):
+            closest = zone
+            closest_distance = distance
+    return closest[0] if closest is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--zones", type=int, default=1000, help="number of zones")
+    parser.add_argument("--moves", type=int, default=10000, help="number of GPS moves to resolve")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    zones = _make_zones(args.zones, rng)
+    moves = _make_moves(args.moves, rng)
+
+    start = time.perf_counter()
+    index = ZoneIndex(zones)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [_linear(zones, *move) for move in moves]
+    linear = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = [index.resolve(*move) for move in moves]
+    indexed = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(expected, found) if a != b)
+    in_zone = sum(1 for zone in found if zone is not None)
+
+    print(f"zones:        {args.zones}")
+    print(f"moves:        {args.moves} ({in_zone} inside a zone)")
+    print(f"index build:  {build * 1e3:10.2f} ms")
+    print(f"linear scan:  {args.moves / linear:10.0f} moves/s  ({linear * 1e6 / args.moves:8.2f} us/move)")
+    print(f"grid index:   {args.moves / indexed:10.0f} moves/s  ({indexed * 1e6 / args.moves:8.2f} us/move)")
+    print(f"mismatches:   {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,7 +5,7 @@ This component provides support for virtual components.
 
 import logging
 import voluptuous as vol
-import asyncio
+import time
 
 import homeassistant.helpers.config_validation as cv
 import homeassistant.helpers.device_registry as dr
@@ -14,28 +14,44 @@ from homeassistant.helpers.issue_registry import (
     async_create_issue,
     IssueSeverity
 )
-from homeassistant.helpers.service import verify_domain_control
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.config_entries import ConfigEntry, SOURCE_IMPORT
 from homeassistant.const import ATTR_ENTITY_ID, CONF_SOURCE, Platform
 from homeassistant.core import (
     DOMAIN as HOMEASSISTANT_DOMAIN,
     HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
     callback
 )
 from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.event import async_call_later
 
 from .const import *
 from .cfg import BlendedCfg, UpgradeCfg
+from .history import async_get_history, async_stop_history
+from .metrics import async_get_metrics, async_stop_metrics
+from .monitor import LOOP_MONITOR_SCHEMA, async_start_loop_monitor, record_job
+from .scheduler import async_stop_timer_wheel
+from .services import async_get_services, async_stop_services
+from .tracing import SPAN_LOOKUP, TRACE_SCHEMA, async_start_tracer, trace_span
 
 
-__version__ = '0.9.3'
+__version__ = '0.9.4'
 
 _LOGGER = logging.getLogger(__name__)
 
 CONFIG_SCHEMA = vol.Schema({
         COMPONENT_DOMAIN: vol.Schema({
             vol.Optional(CONF_YAML_CONFIG, default=False): cv.boolean,
+            vol.Optional(CONF_TIMER_RESOLUTION, default=DEFAULT_TIMER_RESOLUTION):
+                vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
+            vol.Optional(CONF_ANIMATION_FRAME_RATE, default=DEFAULT_ANIMATION_FRAME_RATE):
+                vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False, max=50)),
+            vol.Optional(CONF_METRICS_SENSORS, default=False): cv.boolean,
+            vol.Optional(CONF_TRACE): TRACE_SCHEMA,
+            vol.Optional(CONF_LOOP_MONITOR): LOOP_MONITOR_SCHEMA,
         }),
     },
     extra=vol.ALLOW_EXTRA,
@@ -47,6 +63,32 @@ SERVICE_SCHEMA = vol.Schema({
     vol.Required('value'): cv.boolean,
 })
 
+SERVICE_PROFILE_START = 'profile_start'
+SERVICE_PROFILE_STOP = 'profile_stop'
+PROFILE_START_SCHEMA = vol.Schema({
+    vol.Optional('duration', default=60): vol.All(vol.Coerce(float), vol.Range(min=1, max=3600)),
+})
+PROFILE_STOP_SCHEMA = vol.Schema({})
+
+SERVICE_GET_HISTORY = 'get_history'
+GET_HISTORY_SCHEMA = vol.All(
+    vol.Schema({
+        vol.Optional(ATTR_ENTITY_ID): cv.comp_entity_ids,
+        vol.Optional(ATTR_GROUP_NAME): cv.string,
+    }),
+    cv.has_at_least_one_key(ATTR_ENTITY_ID, ATTR_GROUP_NAME),
+)
+
+SERVICE_DUMP = 'dump'
+
+SERVICE_SNAPSHOT = 'snapshot'
+SERVICE_RESTORE_SNAPSHOT = 'restore_snapshot'
+SNAPSHOT_SCHEMA = vol.Schema({
+    vol.Required(ATTR_GROUP_NAME): cv.string,
+    vol.Optional(ATTR_SNAPSHOT_NAME, default=DEFAULT_SNAPSHOT_NAME): cv.string,
+    vol.Optional(ATTR_FILE_NAME): cv.string,
+})
+
 VIRTUAL_PLATFORMS = [
     Platform.BINARY_SENSOR,
     Platform.COVER,
@@ -61,6 +103,20 @@ VIRTUAL_PLATFORMS = [
 ]
 
 
+def _group_platforms(hass, entities) -> list[Platform]:
+    """The platforms a group has entities for, in setup order.
+
+    The diagnostic sensors live on the sensor platform so groups always get
+    it if they are enabled.
+    """
+    platforms = [platform for platform in VIRTUAL_PLATFORMS if platform in entities]
+    if Platform.SENSOR not in platforms and (
+        hass.data[COMPONENT_CONFIG].get(CONF_METRICS_SENSORS, False) or COMPONENT_MONITOR in hass.data
+    ):
+        platforms.append(Platform.SENSOR)
+    return platforms
+
+
 def str_to_bool(value) -> bool:
     value = value.lower()
     if value in ["y", "yes", "t", "true", "on", "1"]:
@@ -79,9 +135,31 @@ async def async_setup(hass, config):
     # Set up hass data if necessary
     if COMPONENT_DOMAIN not in hass.data:
         hass.data[COMPONENT_DOMAIN] = {}
-        hass.data[COMPONENT_SERVICES] = {}
         hass.data[COMPONENT_CONFIG] = {}
 
+    # Shared timer settings.
+    hass.data[COMPONENT_CONFIG][CONF_TIMER_RESOLUTION] = config.get(COMPONENT_DOMAIN, {}).get(
+        CONF_TIMER_RESOLUTION, DEFAULT_TIMER_RESOLUTION
+    )
+    hass.data[COMPONENT_CONFIG][CONF_ANIMATION_FRAME_RATE] = config.get(COMPONENT_DOMAIN, {}).get(
+        CONF_ANIMATION_FRAME_RATE, DEFAULT_ANIMATION_FRAME_RATE
+    )
+    hass.data[COMPONENT_CONFIG][CONF_METRICS_SENSORS] = config.get(COMPONENT_DOMAIN, {}).get(
+        CONF_METRICS_SENSORS, False
+    )
+
+    # Tracing is opt-in.
+    if config.get(COMPONENT_DOMAIN, {}).get(CONF_TRACE, None) is not None:
+        async_start_tracer(hass, config[COMPONENT_DOMAIN][CONF_TRACE])
+
+    # So is the loop monitor.
+    if config.get(COMPONENT_DOMAIN, {}).get(CONF_LOOP_MONITOR, None) is not None:
+        async_start_loop_monitor(hass, config[COMPONENT_DOMAIN][CONF_LOOP_MONITOR])
+
+    # The bulk dump can also be read over the websocket.
+    from .dump import async_setup_websocket
+    async_setup_websocket(hass)
+
     # See if yaml support was enabled.
     if not config.get(COMPONENT_DOMAIN, {}).get(CONF_YAML_CONFIG, False):
 
@@ -124,13 +202,9 @@ async def async_setup(hass, config):
         _LOGGER.debug("setting up old virtual components")
         hass.data[COMPONENT_CONFIG][CONF_YAML_CONFIG] = True
 
-        @verify_domain_control(hass, COMPONENT_DOMAIN)
-        async def async_virtual_service_set_available(call) -> None:
-            """Call virtual service handler."""
-            _LOGGER.info("{} service called".format(call.service))
-            await async_virtual_set_availability_service(hass, call)
-
-        hass.services.async_register(COMPONENT_DOMAIN, SERVICE_AVAILABILE, async_virtual_service_set_available)
+        async_get_services(hass).async_register_entity_service(
+            SERVICE_AVAILABILE, None, async_virtual_set_availability_service, SERVICE_SCHEMA
+        )
 
     return True
 
@@ -150,52 +224,79 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Set up hass data if necessary
     if COMPONENT_DOMAIN not in hass.data:
         hass.data[COMPONENT_DOMAIN] = {}
-        hass.data[COMPONENT_SERVICES] = {}
         hass.data[COMPONENT_CONFIG] = {}
 
+    # We're back before the shared state was stopped.
+    cancel = hass.data.pop(COMPONENT_TEARDOWN, None)
+    if cancel is not None:
+        cancel()
+
     # Get the config.
     _LOGGER.debug(f"creating new cfg")
+    metrics = async_get_metrics(hass).group(entry.data[ATTR_GROUP_NAME])
+    started = time.monotonic()
     vcfg = BlendedCfg(hass, entry.data)
     await vcfg.async_load()
+    metrics.setup_phases["load"] = time.monotonic() - started
+    record_job(hass, f"setup {entry.data[ATTR_GROUP_NAME]} load", metrics.setup_phases["load"])
 
     # create the devices.
     _LOGGER.debug("creating the devices")
+    started = time.monotonic()
     for device in vcfg.devices:
         _LOGGER.debug(f"creating-device={device}")
         await _async_get_or_create_virtual_device_in_registry(hass, entry, device)
-    await asyncio.sleep(1)
-
-    # Delete orphaned devices.
-    for switch, device in vcfg.orphaned_entities.items():
-        _LOGGER.debug(f"deleting {switch}/{device}")
-        await _async_delete_virtual_device_from_registry(hass, entry, device)
+    metrics.setup_phases["devices"] = time.monotonic() - started
+    record_job(hass, f"setup {entry.data[ATTR_GROUP_NAME]} devices", metrics.setup_phases["devices"])
 
     # Update the component data.
+    from .handover import async_get_handover
+    handover = async_get_handover(hass)
+    platforms = _group_platforms(hass, vcfg.entities)
     hass.data[COMPONENT_DOMAIN].update({
         entry.data[ATTR_GROUP_NAME]: {
             ATTR_ENTITIES: vcfg.entities,
             ATTR_DEVICES: vcfg.devices,
-            ATTR_FILE_NAME: entry.data[ATTR_FILE_NAME]
+            ATTR_FILE_NAME: entry.data[ATTR_FILE_NAME],
+            ATTR_HANDOVER: handover.async_take(entry.data[ATTR_GROUP_NAME]),
         }
     })
     _LOGGER.debug(f"update hass data {hass.data[COMPONENT_DOMAIN]}")
 
-    # Create the entities.
-    _LOGGER.debug("creating the entities")
-    await hass.config_entries.async_forward_entry_setups(entry, VIRTUAL_PLATFORMS)
-
-    # Install service handler.
-    @verify_domain_control(hass, COMPONENT_DOMAIN)
-    async def async_virtual_service_set_available(call) -> None:
-        """Call virtual service handler."""
-        _LOGGER.info(f"{call.service} service called")
-        await async_virtual_set_availability_service(hass, call)
-
-    if not hasattr(hass.data[COMPONENT_SERVICES], COMPONENT_DOMAIN):
-        _LOGGER.debug("installing handlers")
-        hass.data[COMPONENT_SERVICES][COMPONENT_DOMAIN] = 'installed'
-        hass.services.async_register(COMPONENT_DOMAIN, SERVICE_AVAILABILE,
-                                     async_virtual_service_set_available, schema=SERVICE_SCHEMA)
+    # Create the entities. The entry remembers the platforms so we unload
+    # exactly what we set up, even if the file has changed since.
+    _LOGGER.debug(f"creating the entities on {platforms}")
+    started = time.monotonic()
+    entry.runtime_data = platforms
+    await hass.config_entries.async_forward_entry_setups(entry, platforms)
+    metrics.setup_phases["platforms"] = time.monotonic() - started
+    record_job(hass, f"setup {entry.data[ATTR_GROUP_NAME]} platforms", metrics.setup_phases["platforms"])
+
+    # Anything not picked up belongs to entities that have gone.
+    hass.data[COMPONENT_DOMAIN][entry.data[ATTR_GROUP_NAME]].pop(ATTR_HANDOVER, None)
+
+    # Clear out what was removed from the file now the entities are up.
+    if vcfg.orphaned_entities:
+        from .orphans import async_clean_orphans
+        entry.async_create_background_task(
+            hass,
+            async_clean_orphans(hass, entry, vcfg.orphaned_entities, vcfg.devices),
+            f"{COMPONENT_DOMAIN} {entry.data[ATTR_GROUP_NAME]} orphans",
+        )
+
+    # Install the services, they are only registered once.
+    services = async_get_services(hass)
+    services.async_register_entity_service(SERVICE_AVAILABILE, None,
+                                           async_virtual_set_availability_service, SERVICE_SCHEMA)
+    services.async_register(SERVICE_PROFILE_START, async_virtual_profile_service, PROFILE_START_SCHEMA)
+    services.async_register(SERVICE_PROFILE_STOP, async_virtual_profile_service, PROFILE_STOP_SCHEMA)
+    services.async_register(SERVICE_GET_HISTORY, async_virtual_get_history_service, GET_HISTORY_SCHEMA,
+                            supports_response=SupportsResponse.ONLY)
+    from .dump import DUMP_SERVICE_SCHEMA
+    services.async_register(SERVICE_DUMP, async_virtual_dump_service, DUMP_SERVICE_SCHEMA,
+                            supports_response=SupportsResponse.ONLY)
+    services.async_register(SERVICE_SNAPSHOT, async_virtual_snapshot_service, SNAPSHOT_SCHEMA)
+    services.async_register(SERVICE_RESTORE_SNAPSHOT, async_virtual_snapshot_service, SNAPSHOT_SCHEMA)
 
     return True
 
@@ -204,43 +305,131 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     _LOGGER.debug(f"unloading virtual group {entry.data[ATTR_GROUP_NAME]}")
     # _LOGGER.debug(f"before hass={hass.data[COMPONENT_DOMAIN]}")
-    unload_ok = await hass.config_entries.async_unload_platforms(entry, VIRTUAL_PLATFORMS)
+    platforms = getattr(entry, "runtime_data", None) or []
+
+    # Keep our state in case this is a reload.
+    from .handover import async_get_handover
+    if not hass.is_stopping:
+        async_get_handover(hass).async_save(entry.data[ATTR_GROUP_NAME])
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, platforms)
     if unload_ok:
         _LOGGER.debug("unloaded ok")
-        hass.data[COMPONENT_DOMAIN].pop(entry.data[ATTR_GROUP_NAME])
+        hass.data[COMPONENT_DOMAIN].pop(entry.data[ATTR_GROUP_NAME], None)
+        if not hass.data[COMPONENT_DOMAIN]:
+            # A reload comes straight back, so keep the shared state for a
+            # while rather than losing the metrics and history.
+            if hass.is_stopping:
+                await _async_stop_shared(hass)
+            else:
+                _LOGGER.debug("last group unloaded, stopping shared state soon")
+                hass.data[COMPONENT_TEARDOWN] = async_call_later(hass, HANDOVER_TIMEOUT, _async_stop_shared)
         # _LOGGER.debug(f"ocfg={ocfg}")
+    else:
+        async_get_handover(hass).async_discard(entry.data[ATTR_GROUP_NAME])
     # _LOGGER.debug(f"after hass={hass.data[COMPONENT_DOMAIN]}")
 
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """The group is gone, it won't want its state or counters back."""
+    from .handover import async_get_handover
+    async_get_handover(hass).async_discard(entry.data[ATTR_GROUP_NAME])
+    if COMPONENT_METRICS in hass.data:
+        async_get_metrics(hass).async_remove_group(entry.data[ATTR_GROUP_NAME])
+    if COMPONENT_TEARDOWN in hass.data and not hass.data.get(COMPONENT_DOMAIN):
+        await _async_stop_shared(hass)
+
+
+async def _async_stop_shared(hass: HomeAssistant, _now=None) -> None:
+    """Stop everything the groups share, once none are left."""
+    cancel = hass.data.pop(COMPONENT_TEARDOWN, None)
+    if cancel is not None and _now is None:
+        cancel()
+    if hass.data.get(COMPONENT_DOMAIN):
+        return
+
+    _LOGGER.debug("no groups left, stopping timers")
+    async_stop_services(hass)
+    async_stop_metrics(hass)
+    async_stop_history(hass)
+    # These are only loaded if something used them.
+    if COMPONENT_PROFILER in hass.data:
+        from .profiler import async_stop_profiler
+        await async_stop_profiler(hass)
+    if COMPONENT_ANIMATION in hass.data:
+        from .animation import async_stop_light_animator
+        async_stop_light_animator(hass)
+    if COMPONENT_ROUTES in hass.data:
+        from .route import async_stop_route_manager
+        async_stop_route_manager(hass)
+    if COMPONENT_ZONES in hass.data:
+        from .zones import async_stop_zone_resolver
+        async_stop_zone_resolver(hass)
+    async_stop_timer_wheel(hass)
+
+
 def get_entity_configs(hass, group_name, domain):
     return hass.data.get(COMPONENT_DOMAIN, {}).get(group_name, {}).get(ATTR_ENTITIES, {}).get(domain, [])
 
 
 def get_entity_from_domain(hass, domain, entity_id):
-    component = hass.data.get(domain)
-    if component is None:
-        raise HomeAssistantError("{} component not set up".format(domain))
+    with trace_span(hass, "entity_lookup", SPAN_LOOKUP, entity_id=entity_id):
+        component = hass.data.get(domain)
+        if component is None:
+            raise HomeAssistantError("{} component not set up".format(domain))
 
-    entity = component.get_entity(entity_id)
-    if entity is None:
-        raise HomeAssistantError("{} not found".format(entity_id))
+        entity = component.get_entity(entity_id)
+        if entity is None:
+            raise HomeAssistantError("{} not found".format(entity_id))
 
-    return entity
+        return entity
 
 
-async def async_virtual_set_availability_service(hass, call):
+async def async_virtual_set_availability_service(hass, call, entity_ids):
     value = call.data['value']
     if type(value) is not bool:
         value = str_to_bool(value)
 
-    for entity_id in call.data['entity_id']:
+    for entity_id in entity_ids:
         domain = entity_id.split(".")[0]
         _LOGGER.info("{} set_avilable(value={})".format(entity_id, value))
         get_entity_from_domain(hass, domain, entity_id).set_available(value)
 
 
+async def async_virtual_profile_service(hass, call):
+    from .profiler import async_get_profiler
+    if call.service == SERVICE_PROFILE_START:
+        async_get_profiler(hass).async_start(call.data['duration'])
+    else:
+        await async_get_profiler(hass).async_stop()
+
+
+async def async_virtual_get_history_service(hass, call: ServiceCall) -> ServiceResponse:
+    """Return the recent history of the asked for entities."""
+    return {
+        ATTR_ENTITIES: async_get_history(hass).query(
+            call.data.get(ATTR_ENTITY_ID, []), call.data.get(ATTR_GROUP_NAME)
+        )
+    }
+
+
+async def async_virtual_dump_service(hass, call: ServiceCall) -> ServiceResponse:
+    """Return the native state of the asked for entities."""
+    from .dump import async_dump
+    return async_dump(hass, call.data)
+
+
+async def async_virtual_snapshot_service(hass, call):
+    from .snapshot import async_get_snapshots
+    snapshots = async_get_snapshots(hass)
+    args = (call.data[ATTR_GROUP_NAME], call.data[ATTR_SNAPSHOT_NAME], call.data.get(ATTR_FILE_NAME))
+    if call.service == SERVICE_SNAPSHOT:
+        await snapshots.async_snapshot(*args)
+    else:
+        await snapshots.async_restore(*args)
+
+
 async def _async_get_or_create_virtual_device_in_registry(
         hass: HomeAssistant, entry: ConfigEntry, device
 ) -> None:
@@ -254,16 +443,3 @@ async def _async_get_or_create_virtual_device_in_registry(
         sw_version=__version__
     )
 
-
-async def _async_delete_virtual_device_from_registry(
-        hass: HomeAssistant, _entry: ConfigEntry, device
-) -> None:
-    registery = dr.async_get(hass)
-    device_in_registry = registery.async_get_device(
-        identifiers={(COMPONENT_DOMAIN, device[ATTR_DEVICE_ID])},
-    )
-    if device_in_registry:
-        _LOGGER.debug(f"found something to delete! {device_in_registry.id}")
-        registery.async_remove_device(device_in_registry.id)
-    else:
-        _LOGGER.info(f"have orphaned device in meta {device[ATTR_DEVICE_ID]}")
@@ -0,0 +1,194 @@
+"""
+Provides light transitions and effects for the virtual component.
+
+All animating lights share one animator. Each frame the animator works out
+the new brightness and colour of every fading light in one pass and then
+publishes them, so lots of lights fading together only cost one timer
+callback per frame. Frames are driven from the shared timer wheel.
+"""
+
+import logging
+from collections.abc import Callable
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+from .monitor import loop_backoff
+from .scheduler import async_get_timer_wheel
+
+
+_LOGGER = logging.getLogger(__name__)
+
+EFFECT_RAINBOW = "rainbow"
+RAINBOW_PERIOD = 10.0
+
+
+class _Transition(object):
+    """A fade from one set of light values to another.
+
+    Each of brightness, hs_color and color_temp_kelvin is either `None`, we
+    aren't changing it, or a `(start, delta)` pair.
+    """
+
+    __slots__ = ("start", "duration", "brightness", "hs_color", "color_temp_kelvin", "finished")
+
+    def __init__(self, start, duration, brightness, hs_color, color_temp_kelvin, finished):
+        self.start = start
+        self.duration = duration
+        self.brightness = brightness
+        self.hs_color = hs_color
+        self.color_temp_kelvin = color_temp_kelvin
+        self.finished = finished
+
+
+class _Effect(object):
+    """A never ending effect, for now only rainbow."""
+
+    __slots__ = ("start", "hue", "saturation")
+
+    def __init__(self, start, hue, saturation):
+        self.start = start
+        self.hue = hue
+        self.saturation = saturation
+
+
+def _pair(start, end):
+    if start is None or end is None or start == end:
+        return None
+    return start, end - start
+
+
+def _hue_pair(start, end):
+    if start is None or end is None or start == end:
+        return None
+    # Take the short way round the colour wheel.
+    delta = (end[0] - start[0] + 180.0) % 360.0 - 180.0
+    return start, (delta, end[1] - start[1])
+
+
+class VirtualLightAnimator(object):
+    """Run transitions and effects for every animating virtual light."""
+
+    def __init__(self, hass: HomeAssistant, frame_rate: float = DEFAULT_ANIMATION_FRAME_RATE):
+        self._hass = hass
+        self._frame_interval = 1.0 / frame_rate
+
+        self._transitions: dict = {}
+        self._effects: dict = {}
+        self._handle = None
+
+    @property
+    def active_animations(self) -> int:
+        return len(self._transitions) + len(self._effects)
+
+    @callback
+    def async_start_transition(self, light, duration: float, start: tuple, end: tuple,
+                               finished: Callable[[], None] | None = None) -> None:
+        """Fade `light` from `start` to `end` values over `duration` seconds.
+
+        `start` and `end` are `(brightness, hs_color, color_temp_kelvin)`.
+        """
+        self.async_cancel_transition(light)
+        self._transitions[light] = _Transition(
+            self._hass.loop.time(), duration,
+            _pair(start[0], end[0]),
+            _hue_pair(start[1], end[1]),
+            _pair(start[2], end[2]),
+            finished
+        )
+        self._schedule()
+
+    @callback
+    def async_cancel_transition(self, light) -> None:
+        self._transitions.pop(light, None)
+
+    @callback
+    def async_start_effect(self, light, effect: str, hs_color) -> None:
+        if effect != EFFECT_RAINBOW:
+            self.async_cancel_effect(light)
+            return
+        hue, saturation = hs_color if hs_color is not None else (0.0, 100.0)
+        self._effects[light] = _Effect(self._hass.loop.time(), hue, saturation)
+        self._schedule()
+
+    @callback
+    def async_cancel_effect(self, light) -> None:
+        self._effects.pop(light, None)
+
+    @callback
+    def async_cancel(self, light) -> None:
+        self.async_cancel_transition(light)
+        self.async_cancel_effect(light)
+
+    @callback
+    def async_stop(self) -> None:
+        _LOGGER.debug(f"stopping animator with {self.active_animations} animations")
+        if self._handle is not None:
+            self._handle()
+        self._handle = None
+        self._transitions = {}
+        self._effects = {}
+
+    def _schedule(self) -> None:
+        if self._handle is None and (self._transitions or self._effects):
+            self._handle = async_get_timer_wheel(self._hass).async_call_later(
+                self._frame_interval * loop_backoff(self._hass), self._frame
+            )
+
+    @callback
+    def _frame(self, _now) -> None:
+        self._handle = None
+        now = self._hass.loop.time()
+
+        # Work out every frame first...
+        frames = {}
+        finished = []
+        for light, transition in self._transitions.items():
+            progress = min(1.0, (now - transition.start) / transition.duration)
+            brightness = hs_color = color_temp_kelvin = None
+            if transition.brightness is not None:
+                start, delta = transition.brightness
+                brightness = round(start + delta * progress)
+            if transition.hs_color is not None:
+                start, (hue_delta, saturation_delta) = transition.hs_color
+                hs_color = ((start[0] + hue_delta * progress) % 360.0, start[1] + saturation_delta * progress)
+            if transition.color_temp_kelvin is not None:
+                start, delta = transition.color_temp_kelvin
+                color_temp_kelvin = round(start + delta * progress)
+            frames[light] = [brightness, hs_color, color_temp_kelvin]
+            if progress >= 1.0:
+                finished.append(light)
+
+        for light, effect in self._effects.items():
+            hue = (effect.hue + 360.0 * (now - effect.start) / RAINBOW_PERIOD) % 360.0
+            frames.setdefault(light, [None, None, None])[1] = (hue, effect.saturation)
+
+        # ... then publish them.
+        for light, (brightness, hs_color, color_temp_kelvin) in frames.items():
+            light.async_apply_animation_frame(brightness, hs_color, color_temp_kelvin)
+
+        for light in finished:
+            transition = self._transitions.pop(light)
+            if transition.finished is not None:
+                transition.finished()
+
+        self._schedule()
+
+
+@callback
+def async_get_light_animator(hass: HomeAssistant) -> VirtualLightAnimator:
+    """Return the shared light animator, creating it if needed."""
+    animator = hass.data.get(COMPONENT_ANIMATION)
+    if animator is None:
+        frame_rate = hass.data.get(COMPONENT_CONFIG, {}).get(CONF_ANIMATION_FRAME_RATE, DEFAULT_ANIMATION_FRAME_RATE)
+        _LOGGER.debug(f"creating light animator, frame_rate={frame_rate}")
+        animator = hass.data[COMPONENT_ANIMATION] = VirtualLightAnimator(hass, frame_rate)
+    return animator
+
+
+@callback
+def async_stop_light_animator(hass: HomeAssistant) -> None:
+    """Stop and forget the shared light animator."""
+    animator = hass.data.pop(COMPONENT_ANIMATION, None)
+    if animator is not None:
+        animator.async_stop()
@@ -20,6 +20,9 @@ from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
 from . import get_entity_from_domain, get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .publish import PUBLISH_POLICY_SCHEMA
+from .services import async_get_services
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -30,9 +33,11 @@ DEFAULT_BINARY_SENSOR_VALUE = "off"
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_BINARY_SENSOR_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 BINARY_SENSOR_SCHEMA = vol.Schema(virtual_schema(DEFAULT_BINARY_SENSOR_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 
 SERVICE_ON = "turn_on"
@@ -44,30 +49,12 @@ SERVICE_SCHEMA = vol.Schema({
 
 
 def setup_services(hass: HomeAssistant) -> None:
-
-    async def async_virtual_service(call):
-        """Call virtual service handler."""
-        _LOGGER.debug(f"{call.service} service called")
-        if call.service == SERVICE_ON:
-            await async_virtual_on_service(hass, call)
-        if call.service == SERVICE_OFF:
-            await async_virtual_off_service(hass, call)
-        if call.service == SERVICE_TOGGLE:
-            await async_virtual_toggle_service(hass, call)
-
-    # Build up services...
-    if not hasattr(hass.data[COMPONENT_SERVICES], PLATFORM_DOMAIN):
-        _LOGGER.debug("installing binary_service handlers")
-        hass.data[COMPONENT_SERVICES][PLATFORM_DOMAIN] = 'installed'
-        hass.services.async_register(
-            COMPONENT_DOMAIN, SERVICE_ON, async_virtual_service, schema=SERVICE_SCHEMA,
-        )
-        hass.services.async_register(
-            COMPONENT_DOMAIN, SERVICE_OFF, async_virtual_service, schema=SERVICE_SCHEMA,
-        )
-        hass.services.async_register(
-            COMPONENT_DOMAIN, SERVICE_TOGGLE, async_virtual_service, schema=SERVICE_SCHEMA,
-        )
+    services = async_get_services(hass)
+    services.async_register_entity_service(SERVICE_ON, PLATFORM_DOMAIN, async_virtual_on_service, SERVICE_SCHEMA)
+    services.async_register_entity_service(SERVICE_OFF, PLATFORM_DOMAIN, async_virtual_off_service, SERVICE_SCHEMA)
+    services.async_register_entity_service(
+        SERVICE_TOGGLE, PLATFORM_DOMAIN, async_virtual_toggle_service, SERVICE_SCHEMA
+    )
 
 
 async def async_setup_platform(hass, config, async_add_entities, _discovery_info=None):
@@ -97,6 +84,11 @@ async def async_setup_entry(
 class VirtualBinarySensor(VirtualEntity, BinarySensorEntity):
     """An implementation of a Virtual Binary Sensor."""
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_is_on",)
+
+    # We only change through the services and they write the state.
+    _attr_should_poll = False
+
     def __init__(self, config, old_style: bool):
         """Initialize a Virtual Binary Sensor."""
         super().__init__(config, PLATFORM_DOMAIN, old_style)
@@ -123,16 +115,19 @@ class VirtualBinarySensor(VirtualEntity, BinarySensorEntity):
             ) if value is not None
         })
 
+    @traced_operation
     def turn_on(self) -> None:
         _LOGGER.debug(f"turning {self.name} on")
         self._attr_is_on = True
-        self.async_schedule_update_ha_state()
+        self._publish(True)
 
+    @traced_operation
     def turn_off(self) -> None:
         _LOGGER.debug(f"turning {self.name} off")
         self._attr_is_on = False
-        self.async_schedule_update_ha_state()
+        self._publish(False)
 
+    @traced_operation
     def toggle(self) -> None:
         if self.is_on:
             self.turn_off()
@@ -140,19 +135,19 @@ class VirtualBinarySensor(VirtualEntity, BinarySensorEntity):
             self.turn_on()
 
 
-async def async_virtual_on_service(hass, call):
-    for entity_id in call.data['entity_id']:
+async def async_virtual_on_service(hass, call, entity_ids):
+    for entity_id in entity_ids:
         _LOGGER.debug(f"turning on {entity_id}")
         get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id).turn_on()
 
 
-async def async_virtual_off_service(hass, call):
-    for entity_id in call.data['entity_id']:
+async def async_virtual_off_service(hass, call, entity_ids):
+    for entity_id in entity_ids:
         _LOGGER.debug(f"turning off {entity_id}")
         get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id).turn_off()
 
 
-async def async_virtual_toggle_service(hass, call):
-    for entity_id in call.data['entity_id']:
+async def async_virtual_toggle_service(hass, call, entity_ids):
+    for entity_id in entity_ids:
         _LOGGER.debug(f"toggling {entity_id}")
         get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id).toggle()
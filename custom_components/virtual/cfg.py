@@ -14,11 +14,11 @@ There are 2 pieces:
   layout.
 """
 
-import aiofiles
 import asyncio
 import copy
 import logging
 import json
+import time
 import voluptuous as vol
 import uuid
 from datetime import timedelta
@@ -35,6 +35,7 @@ from homeassistant.util.yaml import parse_yaml, dump
 
 from .const import *
 from .entity import virtual_schema
+from .metrics import async_get_metrics
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -61,10 +62,18 @@ def _fix_value(value):
     return value
 
 
+def _aio_open(file_name, mode):
+    """Open a file with aiofiles, imported here as we only need it when we
+    read or write the configuration.
+    """
+    import aiofiles
+    return aiofiles.open(file_name, mode)
+
+
 async def _async_load_json(file_name):
     _LOGGER.debug("_async_load_yaml1 file_name for %s", file_name)
     try:
-        async with aiofiles.open(file_name, 'r') as meta_file:
+        async with _aio_open(file_name, 'r') as meta_file:
             _LOGGER.debug("_async_load_yaml2 file_name for %s", file_name)
             contents = await meta_file.read()
             _LOGGER.debug("_async_load_yaml3 file_name for %s", file_name)
@@ -77,7 +86,7 @@ async def _async_load_json(file_name):
 async def _async_save_json(file_name, data):
     _LOGGER.debug("_async_save_yaml1 file_name for %s", file_name)
     try:
-        async with aiofiles.open(file_name, 'w') as meta_file:
+        async with _aio_open(file_name, 'w') as meta_file:
             data = json.dumps(data, indent=4)
             await meta_file.write(data)
     except Exception as e:
@@ -87,7 +96,7 @@ async def _async_save_json(file_name, data):
 async def _async_load_yaml(file_name):
     _LOGGER.debug("_async_load_yaml1 file_name for %s", file_name)
     try:
-        async with aiofiles.open(file_name, 'r') as meta_file:
+        async with _aio_open(file_name, 'r') as meta_file:
             _LOGGER.debug("_async_load_yaml2 file_name for %s", file_name)
             contents = await meta_file.read()
             _LOGGER.debug("_async_load_yaml3 file_name for %s", file_name)
@@ -100,7 +109,7 @@ async def _async_load_yaml(file_name):
 async def _async_save_yaml(file_name, data):
     _LOGGER.debug("_async_save_yaml1 file_name for %s", file_name)
     try:
-        async with aiofiles.open(file_name, 'w') as meta_file:
+        async with _aio_open(file_name, 'w') as meta_file:
             data = dump(data)
             await meta_file.write(data)
     except Exception as e:
@@ -111,7 +120,9 @@ async def _load_meta_data(hass, group_name: str):
     """Read in meta data for a particular group.
     """
     async with _meta_lock:
+        started = time.monotonic()
         data = await _async_load_json(default_meta_file(hass))
+        async_get_metrics(hass).group(group_name).meta_reads.add(time.monotonic() - started)
         return data.get(ATTR_DEVICES, {}).get(group_name, {})
 
 
@@ -119,10 +130,13 @@ async def _save_meta_data(hass, group_name, meta_data):
     """Save meta data for a particular group name.
     """
     async with _meta_lock:
+        metrics = async_get_metrics(hass).group(group_name)
 
         # Read in current meta data
+        started = time.monotonic()
         devices = await _async_load_json(default_meta_file(hass))
         devices = devices.get(ATTR_DEVICES, {})
+        metrics.meta_reads.add(time.monotonic() - started)
 
         # Update (or add) the group piece.
         _LOGGER.debug(f"meta before {devices}")
@@ -132,10 +146,12 @@ async def _save_meta_data(hass, group_name, meta_data):
         _LOGGER.debug(f"meta after {devices}")
 
         # Write it back out.
+        started = time.monotonic()
         await _async_save_json(default_meta_file(hass), {
             ATTR_VERSION: 1,
             ATTR_DEVICES: devices
         })
+        metrics.meta_writes.add(time.monotonic() - started)
 
 
 async def _delete_meta_data(hass, group_name):
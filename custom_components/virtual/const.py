@@ -3,6 +3,18 @@
 COMPONENT_DOMAIN = "virtual"
 COMPONENT_SERVICES = "virtual-services"
 COMPONENT_CONFIG = "virtual-config"
+COMPONENT_TIMER = "virtual-timer"
+COMPONENT_ANIMATION = "virtual-animation"
+COMPONENT_ROUTES = "virtual-routes"
+COMPONENT_ZONES = "virtual-zones"
+COMPONENT_PROFILER = "virtual-profiler"
+COMPONENT_METRICS = "virtual-metrics"
+COMPONENT_TRACER = "virtual-tracer"
+COMPONENT_MONITOR = "virtual-monitor"
+COMPONENT_HISTORY = "virtual-history"
+COMPONENT_SNAPSHOTS = "virtual-snapshots"
+COMPONENT_HANDOVER = "virtual-handover"
+COMPONENT_TEARDOWN = "virtual-teardown"
 COMPONENT_MANUFACTURER = "twrecked"
 COMPONENT_MODEL = "virtual"
 
@@ -12,28 +24,49 @@ ATTR_DEVICE_ID = "device_id"
 ATTR_ENTITIES = "entities"
 ATTR_FILE_NAME = "file_name"
 ATTR_GROUP_NAME = "group_name"
+ATTR_HANDOVER = "handover"
 ATTR_PARENT_ID = "parent_id"
 ATTR_PERSISTENT = 'persistent'
+ATTR_SNAPSHOT_NAME = "name"
 ATTR_UNIQUE_ID = 'unique_id'
 ATTR_VALUE = "value"
 ATTR_VERSION = "version"
 
+CONF_ANIMATION_FRAME_RATE = "animation_frame_rate"
 CONF_CLASS = "class"
+CONF_HISTORY = "history"
 CONF_INITIAL_AVAILABILITY = "initial_availability"
 CONF_INITIAL_VALUE = "initial_value"
+CONF_LOOP_MONITOR = "loop_monitor"
 CONF_MAX = "max"
+CONF_METRICS_SENSORS = "metrics_sensors"
 CONF_MIN = "min"
 CONF_NAME = "name"
 CONF_OPEN_CLOSE_DURATION = "open_close_duration"
+CONF_OPEN_CLOSE_MODE = "open_close_mode"
+CONF_OPEN_CLOSE_PUBLISH_INTERVAL = "open_close_publish_interval"
 CONF_OPEN_CLOSE_TICK = "open_close_tick"
 CONF_PERSISTENT = "persistent"
+CONF_TIMER_RESOLUTION = "timer_resolution"
+CONF_TRACE = "trace"
 CONF_YAML_CONFIG = "yaml_config"
 
+DEFAULT_ANIMATION_FRAME_RATE = 10
 DEFAULT_AVAILABILITY = True
+DEFAULT_HISTORY = 0
 DEFAULT_PERSISTENT = True
+DEFAULT_SNAPSHOT_NAME = "default"
+DEFAULT_TIMER_RESOLUTION = 0.1
+
+# How long, in seconds, a reloading group has to come back and pick up its
+# state.
+HANDOVER_TIMEOUT = 60
 
 IMPORTED_GROUP_NAME = "imported"
 
+OPEN_CLOSE_MODE_ANALYTIC = "analytic"
+OPEN_CLOSE_MODE_TICK = "tick"
+
 
 def default_config_file(hass) -> str:
     return hass.config.path("virtual.yaml")
@@ -41,3 +74,7 @@ def default_config_file(hass) -> str:
 
 def default_meta_file(hass) -> str:
     return hass.config.path(".storage/virtual.meta.json")
+
+
+def default_tracker_state_file(hass) -> str:
+    return hass.config.path(".storage/virtual.restore_state")
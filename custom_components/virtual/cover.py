@@ -23,8 +23,12 @@ from .const import *
 from .entity import (
     VirtualOpenableEntity,
     virtual_schema,
+    open_close_mode,
     positive_tick,
+    publish_interval,
 )
+from .publish import PUBLISH_POLICY_SCHEMA
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -37,11 +41,17 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_COVER_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_OPEN_CLOSE_DURATION, default=10): cv.positive_int,
     vol.Optional(CONF_OPEN_CLOSE_TICK, default=1): positive_tick,
+    vol.Optional(CONF_OPEN_CLOSE_MODE, default=OPEN_CLOSE_MODE_TICK): open_close_mode,
+    vol.Optional(CONF_OPEN_CLOSE_PUBLISH_INTERVAL): publish_interval,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 COVER_SCHEMA = vol.Schema(virtual_schema(DEFAULT_COVER_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_OPEN_CLOSE_DURATION, default=10): cv.positive_int,
     vol.Optional(CONF_OPEN_CLOSE_TICK, default=1): positive_tick,
+    vol.Optional(CONF_OPEN_CLOSE_MODE, default=OPEN_CLOSE_MODE_TICK): open_close_mode,
+    vol.Optional(CONF_OPEN_CLOSE_PUBLISH_INTERVAL): publish_interval,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 
 
@@ -85,20 +95,24 @@ class VirtualCover(VirtualOpenableEntity, CoverEntity):
 
     @property
     def current_cover_position(self) -> int | None:
-        return self._current_position
+        return self._position()
 
+    @traced_operation
     async def async_open_cover(self, **kwargs: Any) -> None:
         _LOGGER.info(f"opening {self.name}")
         self._set_position(100)
 
+    @traced_operation
     async def async_close_cover(self, **kwargs: Any) -> None:
         _LOGGER.info(f"closing {self.name}")
         self._set_position(0)
 
+    @traced_operation
     async def async_stop_cover(self, **kwargs: Any) -> None:
         _LOGGER.info(f"stopping {self.name}")
         self._stop()
 
+    @traced_operation
     async def async_set_cover_position(self, **kwargs: Any) -> None:
         _LOGGER.info(f"setting {self.name} position {kwargs['position']}")
         self._set_position(kwargs['position'])
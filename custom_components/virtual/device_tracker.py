@@ -3,8 +3,9 @@ This component provides support for a virtual device tracker.
 
 """
 
-import aiofiles
+import asyncio
 import logging
+import os
 import voluptuous as vol
 import json
 from collections.abc import Callable
@@ -19,17 +20,25 @@ from homeassistant.components.zone import ATTR_RADIUS
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     ATTR_ENTITY_ID,
+    ATTR_GPS_ACCURACY,
     ATTR_LATITUDE,
     ATTR_LONGITUDE,
-    CONF_DEVICES
+    CONF_DEVICES,
+    EVENT_HOMEASSISTANT_STOP,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
 from homeassistant.helpers.event import async_track_state_change_event
 
 from . import get_entity_from_domain, get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .route import async_get_route_manager, parse_gpx
+from .scheduler import async_get_timer_wheel
+from .services import async_get_services
+from .tracing import traced_operation
+from .zones import async_get_zone_resolver
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -39,10 +48,15 @@ DEPENDENCIES = [COMPONENT_DOMAIN]
 CONF_LOCATION = 'location'
 CONF_GPS = 'gps'
 CONF_GPS_ACCURACY = 'gps_accuracy'
+CONF_GPX = 'gpx'
+CONF_INTERVAL = 'interval'
+CONF_SPEED = 'speed'
+CONF_WAYPOINTS = 'waypoints'
 DEFAULT_DEVICE_TRACKER_VALUE = 'home'
 DEFAULT_LOCATION = 'home'
 
-STATE_FILE = "/config/.storage/virtual.restore_state"
+DEFAULT_ROUTE_INTERVAL = 5
+STATE_WRITE_DELAY = 1
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_DEVICES, default=[]): cv.ensure_list
@@ -63,42 +77,79 @@ SERVICE_SCHEMA = vol.Schema({
     vol.Optional(CONF_GPS_ACCURACY): cv.positive_int,
 })
 
-tracker_states = {}
-
-async def _async_load_json(file_name):
+SERVICE_FOLLOW_ROUTE = "follow_route"
+ROUTE_SERVICE_SCHEMA = vol.All(vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.comp_entity_ids,
+    vol.Exclusive(CONF_WAYPOINTS, "route"): vol.All(cv.ensure_list, [{
+        vol.Required(ATTR_LATITUDE): cv.latitude,
+        vol.Required(ATTR_LONGITUDE): cv.longitude,
+    }]),
+    vol.Exclusive(CONF_GPX, "route"): cv.string,
+    vol.Required(CONF_SPEED): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
+    vol.Optional(CONF_INTERVAL, default=DEFAULT_ROUTE_INTERVAL): vol.All(
+        vol.Coerce(float), vol.Range(min=0, min_included=False)
+    ),
+    vol.Optional(CONF_GPS_ACCURACY, default=0): cv.positive_int,
+}), cv.has_at_least_one_key(CONF_WAYPOINTS, CONF_GPX))
+
+
+class VirtualTrackerStateWriter(object):
+    """Save the old style tracker locations.
+
+    Moves are collected and written out together a short time after the
+    first one, the write happens in the executor and replaces the file
+    atomically. Writes are done one at a time, a flush at shutdown can land
+    while the debounced write is still running and they share the temp file.
+    """
+
+    def __init__(self, hass: HomeAssistant, file_name: str, states: dict):
+        self._hass = hass
+        self._file_name = file_name
+        self._states = states
+        self._handle = None
+        self._lock = asyncio.Lock()
+
+    @callback
+    def async_update(self, entity_id: str, state: str) -> None:
+        self._states[entity_id] = state
+        self._schedule()
+
+    @callback
+    def _schedule(self) -> None:
+        if self._handle is None:
+            self._handle = async_get_timer_wheel(self._hass).async_call_later(
+                STATE_WRITE_DELAY, self._async_write_later
+            )
+
+    async def _async_write_later(self, _now) -> None:
+        self._handle = None
+        await self.async_write()
+
+    async def async_write(self) -> None:
+        if self._handle is not None:
+            self._handle()
+            self._handle = None
+        async with self._lock:
+            _LOGGER.debug(f"writing {len(self._states)} tracker states")
+            await self._hass.async_add_executor_job(_write_json, self._file_name, dict(self._states))
+
+
+def _read_json(file_name):
     try:
-        async with aiofiles.open(file_name, 'r') as state_file:
-            contents = await state_file.read()
-            return json.loads(contents)
-    except Exception as e:
+        with open(file_name, 'r') as state_file:
+            return json.load(state_file)
+    except Exception:
         return {}
 
 
-def _write_state():
-    global tracker_states
+def _write_json(file_name, data):
+    temp_name = f"{file_name}.tmp"
     try:
-        with open(STATE_FILE, 'w') as f:
-            json.dump(tracker_states, f)
-    except:
-        pass
-
-def _state_changed(event):
-    entity_id = event.data.get('entity_id', None)
-    new_state = event.data.get('new_state', None)
-    if entity_id is None or new_state is None:
-        _LOGGER.info(f'state changed error')
-        return
-
-    # update database
-    _LOGGER.info(f"moving {entity_id} to {new_state.state}")
-    global tracker_states
-    tracker_states[entity_id] = new_state.state
-    _write_state()
-
-
-def _shutting_down(event):
-    _LOGGER.info(f'shutting down {event}')
-    _write_state()
+        with open(temp_name, 'w') as state_file:
+            json.dump(data, state_file)
+        os.replace(temp_name, file_name)
+    except Exception as e:
+        _LOGGER.info(f"failed to write tracker states {e}")
 
 
 async def async_setup_scanner(hass, config, async_see, _discovery_info=None):
@@ -109,9 +160,11 @@ async def async_setup_scanner(hass, config, async_see, _discovery_info=None):
     _LOGGER.debug("setting up old device trackers...")
 
     # Read in the last known states.
-    old_tracker_states = await _async_load_json(STATE_FILE)
+    state_file = default_tracker_state_file(hass)
+    old_tracker_states = await hass.async_add_executor_job(_read_json, state_file)
 
     new_tracker_states = {}
+    all_see_args = []
     for device in config[CONF_DEVICES]:
         if not isinstance(device, dict):
             device = {
@@ -130,21 +183,40 @@ async def async_setup_scanner(hass, config, async_see, _discovery_info=None):
         else:
             _LOGGER.info(f"setting ephemeral {entity_id} to {location}")
 
-        see_args = {
+        all_see_args.append({
             "dev_id": name,
             "source_type": COMPONENT_DOMAIN,
             "location_name": location,
-        }
-        hass.async_create_task(async_see(**see_args))
+        })
+
+    # Place all the devices in one go.
+    async def _async_see_all():
+        await asyncio.gather(*[async_see(**see_args) for see_args in all_see_args])
+    hass.async_create_task(_async_see_all())
+
+    writer = VirtualTrackerStateWriter(hass, state_file, new_tracker_states)
+
+    @callback
+    def _state_changed(event):
+        entity_id = event.data.get('entity_id', None)
+        new_state = event.data.get('new_state', None)
+        if entity_id is None or new_state is None:
+            _LOGGER.info(f'state changed error')
+            return
+
+        _LOGGER.info(f"moving {entity_id} to {new_state.state}")
+        writer.async_update(entity_id, new_state.state)
+
+    async def _async_shutting_down(event):
+        _LOGGER.info(f'shutting down {event}')
+        await writer.async_write()
 
     # Start listening if there are persistent entities.
-    global tracker_states
-    tracker_states = new_tracker_states
-    if tracker_states:
-        async_track_state_change_event(hass, tracker_states.keys(), _state_changed)
-        hass.bus.async_listen("homeassistant_stop", _shutting_down)
+    if new_tracker_states:
+        async_track_state_change_event(hass, list(new_tracker_states.keys()), _state_changed)
+        hass.bus.async_listen(EVENT_HOMEASSISTANT_STOP, _async_shutting_down)
     else:
-        _write_state()
+        await writer.async_write()
 
     return True
 
@@ -162,24 +234,18 @@ async def async_setup_entry(
         entities.append(VirtualDeviceTracker(entity))
     async_add_entities(entities)
 
-    async def async_virtual_service(call):
-        """Call virtual service handler."""
-        _LOGGER.debug(f"{call.service} service called")
-        if call.service == SERVICE_MOVE:
-            await async_virtual_move_service(hass, call)
-
-    # Build up services...
-    if not hasattr(hass.data[COMPONENT_SERVICES], PLATFORM_DOMAIN):
-        _LOGGER.debug("installing handlers")
-        hass.data[COMPONENT_SERVICES][PLATFORM_DOMAIN] = 'installed'
-        hass.services.async_register(
-            COMPONENT_DOMAIN, SERVICE_MOVE, async_virtual_service, schema=SERVICE_SCHEMA,
-        )
+    services = async_get_services(hass)
+    services.async_register_entity_service(SERVICE_MOVE, PLATFORM_DOMAIN, async_virtual_move_service, SERVICE_SCHEMA)
+    services.async_register_entity_service(
+        SERVICE_FOLLOW_ROUTE, PLATFORM_DOMAIN, async_virtual_follow_route_service, ROUTE_SERVICE_SCHEMA
+    )
 
 
 class VirtualDeviceTracker(TrackerEntity, VirtualEntity):
     """Represent a tracked device."""
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_location", "_coords", "_gps_accuracy")
+
     def __init__(self, config):
         """Initialize a Virtual Device Tracker."""
 
@@ -197,6 +263,11 @@ class VirtualDeviceTracker(TrackerEntity, VirtualEntity):
         _LOGGER.debug(f"{self._attr_name}, available={self._attr_available}")
         _LOGGER.debug(f"{self._attr_name}, entity={self.entity_id}")
 
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop following any route."""
+        async_get_route_manager(self.hass).async_stop(self)
+        await super().async_will_remove_from_hass()
+
     def _create_state(self, config):
         _LOGGER.debug(f"device_tracker-create=config={config}")
         super()._create_state(config)
@@ -223,6 +294,10 @@ class VirtualDeviceTracker(TrackerEntity, VirtualEntity):
             self._location = state.state
             self._coords = {}
 
+    def _apply_snapshot(self, snapshot) -> None:
+        async_get_route_manager(self.hass).async_stop(self)
+        super()._apply_snapshot(snapshot)
+
     @property
     def location_name(self) -> str | None:
         """Return a location name for the current location of the device."""
@@ -248,22 +323,28 @@ class VirtualDeviceTracker(TrackerEntity, VirtualEntity):
     def location_accuracy(self) -> int:
         return self._gps_accuracy
 
+    @traced_operation
     def move_to_location(self, new_location):
         _LOGGER.debug(f"{self._attr_name} moving to {new_location}")
         self._location = new_location
         self._coords = {}
         self.async_schedule_update_ha_state()
 
+    @traced_operation
     def move_to_coords(self, new_coords, accuracy):
         _LOGGER.debug(f"{self._attr_name} moving via GPS to {new_coords} ({accuracy}m)")
-        self._location = None
+        # Work out the zone ourselves, it's much quicker than letting Home
+        # Assistant check every zone.
+        self._location = async_get_zone_resolver(self.hass).async_location_name(
+            new_coords[ATTR_LATITUDE], new_coords[ATTR_LONGITUDE], accuracy
+        )
         self._coords = new_coords
         self._gps_accuracy = accuracy
         self.async_schedule_update_ha_state()
 
 
-async def async_virtual_move_service(hass, call):
-    for entity_id in call.data['entity_id']:
+async def async_virtual_move_service(hass, call, entity_ids):
+    for entity_id in entity_ids:
         _LOGGER.debug(f"moving {entity_id} --> {call.data}")
 
         entity = get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id)
@@ -273,6 +354,8 @@ async def async_virtual_move_service(hass, call):
 
         location = call.data.get(CONF_LOCATION, None)
         coords = call.data.get(CONF_GPS, None)
+        if location is not None or coords is not None:
+            async_get_route_manager(hass).async_stop(entity)
         if location is not None:
             entity.move_to_location(location)
         elif coords is not None:
@@ -281,3 +364,25 @@ async def async_virtual_move_service(hass, call):
         else:
             _LOGGER.debug(f"not moving {entity_id}")
 
+
+async def async_virtual_follow_route_service(hass, call, entity_ids):
+    gpx = call.data.get(CONF_GPX, None)
+    if gpx is not None:
+        gpx = hass.config.path(gpx)
+        if not hass.config.is_allowed_path(gpx):
+            raise HomeAssistantError(f"{gpx} is not an allowed path")
+        waypoints = await hass.async_add_executor_job(parse_gpx, gpx)
+    else:
+        waypoints = [
+            (waypoint[ATTR_LATITUDE], waypoint[ATTR_LONGITUDE]) for waypoint in call.data[CONF_WAYPOINTS]
+        ]
+
+    # Speed is given in km/h.
+    speed = call.data[CONF_SPEED] / 3.6
+    manager = async_get_route_manager(hass)
+    for entity_id in entity_ids:
+        _LOGGER.debug(f"routing {entity_id} through {len(waypoints)} points")
+        entity = get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id)
+        manager.async_follow(
+            entity, waypoints, speed, call.data[CONF_INTERVAL], call.data[CONF_GPS_ACCURACY]
+        )
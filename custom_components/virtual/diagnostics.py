@@ -0,0 +1,38 @@
+"""
+Provides diagnostics for virtual groups.
+
+"""
+
+import logging
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import *
+from .metrics import async_get_metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the group's counters and how it is configured."""
+    group_name = entry.data[ATTR_GROUP_NAME]
+    group = hass.data.get(COMPONENT_DOMAIN, {}).get(group_name, {})
+    metrics = async_get_metrics(hass)
+    monitor = hass.data.get(COMPONENT_MONITOR)
+
+    return {
+        "group": {
+            ATTR_GROUP_NAME: group_name,
+            ATTR_FILE_NAME: entry.data[ATTR_FILE_NAME],
+            "devices": len(group.get(ATTR_DEVICES, [])),
+            "configured_entities": {
+                str(platform): len(configs) for platform, configs in group.get(ATTR_ENTITIES, {}).items()
+            },
+        },
+        "metrics": metrics.group(group_name).as_dict(),
+        "shared": metrics.shared(),
+        "loop_monitor": monitor.as_dict() if monitor is not None else None,
+    }
@@ -0,0 +1,122 @@
+"""
+Provides a bulk dump of virtual entities.
+
+The `virtual.dump` service and the `virtual/dump` websocket command return
+the state, attributes and configuration of many entities at once, read
+straight from the entity objects, so numbers stay numbers and nothing has to
+go through the state machine. Entities can be picked by group, platform or
+device and the result cut down to just the fields and attributes needed.
+"""
+
+import logging
+from datetime import timedelta
+
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+from .metrics import async_get_metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_ATTRIBUTES = "attributes"
+ATTR_CAPABILITIES = "capabilities"
+ATTR_CONFIG = "config"
+ATTR_FIELDS = "fields"
+ATTR_PLATFORM = "platform"
+ATTR_STATE = "state"
+
+DUMP_FIELDS = (
+    ATTR_PLATFORM,
+    ATTR_GROUP_NAME,
+    ATTR_DEVICE_ID,
+    ATTR_AVAILABLE,
+    ATTR_STATE,
+    ATTR_ATTRIBUTES,
+    ATTR_CAPABILITIES,
+    ATTR_CONFIG,
+)
+
+# Shared by the service and the websocket command.
+DUMP_SCHEMA = {
+    vol.Optional(ATTR_GROUP_NAME): cv.string,
+    vol.Optional(ATTR_PLATFORM): cv.string,
+    vol.Optional(ATTR_DEVICE_ID): cv.string,
+    vol.Optional(ATTR_FIELDS): vol.All(cv.ensure_list, [vol.In(DUMP_FIELDS)]),
+    vol.Optional(ATTR_ATTRIBUTES): vol.All(cv.ensure_list, [cv.string]),
+}
+DUMP_SERVICE_SCHEMA = vol.Schema(DUMP_SCHEMA)
+
+
+def _config(config: dict) -> dict:
+    return {
+        name: value.total_seconds() if isinstance(value, timedelta) else value
+        for name, value in config.items()
+    }
+
+
+def _dump_entity(entity, group_name: str, fields, attributes) -> dict:
+    dump = {}
+    if ATTR_PLATFORM in fields:
+        dump[ATTR_PLATFORM] = entity.platform.domain
+    if ATTR_GROUP_NAME in fields:
+        dump[ATTR_GROUP_NAME] = group_name
+    if ATTR_DEVICE_ID in fields:
+        dump[ATTR_DEVICE_ID] = entity._config.get(ATTR_DEVICE_ID)
+    if ATTR_AVAILABLE in fields:
+        dump[ATTR_AVAILABLE] = entity.available
+    if ATTR_STATE in fields:
+        # Numbers and typed sensors hold their value before any unit
+        # conversion or formatting, everything else is its state.
+        dump[ATTR_STATE] = entity.native_value if hasattr(entity, "native_value") else entity.state
+    if ATTR_ATTRIBUTES in fields:
+        native = entity._native_attributes()
+        if attributes is not None:
+            native = {name: native[name] for name in attributes if name in native}
+        dump[ATTR_ATTRIBUTES] = native
+    if ATTR_CAPABILITIES in fields:
+        dump[ATTR_CAPABILITIES] = dict(entity.capability_attributes or {})
+    if ATTR_CONFIG in fields:
+        dump[ATTR_CONFIG] = _config(entity._config)
+    return dump
+
+
+@callback
+def async_dump(hass: HomeAssistant, options: dict) -> dict:
+    """Dump every entity matching `options`, keyed by entity id."""
+    wanted_group = options.get(ATTR_GROUP_NAME)
+    wanted_platform = options.get(ATTR_PLATFORM)
+    wanted_device = options.get(ATTR_DEVICE_ID)
+    fields = set(options.get(ATTR_FIELDS) or DUMP_FIELDS)
+    attributes = options.get(ATTR_ATTRIBUTES)
+
+    entities = {}
+    for group_name, group_entities in async_get_metrics(hass).group_entities().items():
+        if wanted_group is not None and group_name != wanted_group:
+            continue
+        for entity in group_entities:
+            if wanted_platform is not None and entity.platform.domain != wanted_platform:
+                continue
+            if wanted_device is not None and entity._config.get(ATTR_DEVICE_ID) != wanted_device:
+                continue
+            entities[entity.entity_id] = _dump_entity(entity, group_name, fields, attributes)
+    return {ATTR_ENTITIES: entities}
+
+
+@websocket_api.websocket_command({
+    vol.Required("type"): f"{COMPONENT_DOMAIN}/dump",
+    **DUMP_SCHEMA,
+})
+@websocket_api.require_admin
+@callback
+def websocket_dump(hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict) -> None:
+    connection.send_result(msg["id"], async_dump(hass, msg))
+
+
+@callback
+def async_setup_websocket(hass: HomeAssistant) -> None:
+    websocket_api.async_register_command(hass, websocket_dump)
@@ -4,8 +4,9 @@ This component provides support for a virtual sensor.
 This class adds persistence to an entity.
 """
 
+import copy
 import logging
-import pprint
+import math
 
 import voluptuous as vol
 
@@ -18,16 +19,23 @@ from homeassistant.const import (
 )
 from homeassistant.core import callback
 from homeassistant.helpers.entity import DeviceInfo
-from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.util import slugify
 
 from .const import *
+from .history import HistoryBuffer, async_get_history
+from .metrics import async_get_metrics
+from .monitor import loop_backoff
+from .publish import VirtualPublishPolicy
+from .scheduler import async_get_timer_wheel
+from .tracing import SPAN_STATE_WRITE, trace_span, traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
 
 positive_tick = vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False))
+publish_interval = vol.All(vol.Coerce(float), vol.Range(min=0))
+open_close_mode = vol.In([OPEN_CLOSE_MODE_TICK, OPEN_CLOSE_MODE_ANALYTIC])
 
 def virtual_schema(default_initial_value: str, extra_attrs):
     schema = {
@@ -35,6 +43,7 @@ def virtual_schema(default_initial_value: str, extra_attrs):
         vol.Optional(CONF_INITIAL_VALUE, default=default_initial_value): cv.string,
         vol.Optional(CONF_INITIAL_AVAILABILITY, default=DEFAULT_AVAILABILITY): cv.boolean,
         vol.Optional(CONF_PERSISTENT, default=DEFAULT_PERSISTENT): cv.boolean,
+        vol.Optional(CONF_HISTORY, default=DEFAULT_HISTORY): vol.All(vol.Coerce(int), vol.Range(min=0, max=10000)),
         vol.Optional(ATTR_DEVICE_ID, default="NOTYET"): cv.string,
         vol.Optional(ATTR_ENTITY_ID, default="NOTYET"): cv.string,
         vol.Optional(ATTR_UNIQUE_ID, default="NOTYET"): cv.string,
@@ -50,11 +59,21 @@ class VirtualEntity(RestoreEntity):
     # Are we saving/restoring this entity
     _persistent: bool = True
 
+    # Counters for our group, old style entities don't have one.
+    _group_metrics = None
+
+    # Our recent transitions, if we keep them.
+    _history = None
+
+    # What our state is made of, snapshots copy these as they are.
+    _snapshot_attrs: tuple[str, ...] = ("_attr_available",)
+
     def __init__(self, config, domain, old_style : bool = False):
         """Initialize an Virtual Sensor."""
         _LOGGER.debug(f"creating-virtual-{domain}={config}")
         self._config = config
         self._persistent = config.get(CONF_PERSISTENT)
+        self._publish_policy = VirtualPublishPolicy.from_config(self, config)
 
         if old_style:
             # Build name, entity id and unique id. We do this because historically
@@ -102,8 +121,8 @@ class VirtualEntity(RestoreEntity):
 
     def _restore_state(self, state, config):
         _LOGGER.info(f'VirtualEntity {self.unique_id}: restoring state')
-        _LOGGER.debug(f'VirtualEntity:: state={pprint.pformat(state.state)}')
-        _LOGGER.debug(f'VirtualEntity:: attr={pprint.pformat(state.attributes)}')
+        _LOGGER.debug(f'VirtualEntity:: state={state.state!r}')
+        _LOGGER.debug(f'VirtualEntity:: attr={dict(state.attributes)!r}')
         self._attr_available = state.attributes.get(ATTR_AVAILABLE)
 
     def _update_attributes(self):
@@ -116,9 +135,34 @@ class VirtualEntity(RestoreEntity):
                 ATTR_ENTITY_ID: self.entity_id,
                 ATTR_UNIQUE_ID: self.unique_id,
             })
+        if self._publish_policy is not None:
+            self._attr_extra_state_attributes.update(self._publish_policy.attributes())
 
     async def async_added_to_hass(self) -> None:
         await super().async_added_to_hass()
+        group_name = None
+        if self.platform is not None and self.platform.config_entry is not None:
+            group_name = self.platform.config_entry.data[ATTR_GROUP_NAME]
+            self._group_metrics = async_get_metrics(self.hass).async_add_entity(group_name, self)
+
+        # Reloading, take what the old entity had.
+        snapshot, history = None, None
+        if group_name is not None:
+            handover = self.hass.data.get(COMPONENT_DOMAIN, {}).get(group_name, {}).get(ATTR_HANDOVER, {})
+            snapshot, history = handover.pop(self.unique_id, (None, None))
+
+        size = self._config.get(CONF_HISTORY, DEFAULT_HISTORY)
+        if size:
+            if history is None or history.size != size:
+                history = HistoryBuffer(size, group_name)
+            self._history = history
+            async_get_history(self.hass).async_add(self.entity_id, self._history)
+
+        # Only take the state if it was the same kind of entity.
+        if snapshot is not None and snapshot.keys() >= set(self._snapshot_attrs):
+            self._apply_snapshot(snapshot)
+            return
+
         state = await self.async_get_last_state()
         if not self._persistent or not state:
             self._create_state(self._config)
@@ -128,8 +172,61 @@ class VirtualEntity(RestoreEntity):
 
     async def async_will_remove_from_hass(self) -> None:
         """Call when entity is being removed from hass."""
+        if self._publish_policy is not None:
+            self._publish_policy.async_cancel()
+        if self._group_metrics is not None:
+            async_get_metrics(self.hass).async_remove_entity(self)
+            self._group_metrics = None
+        if self._history is not None:
+            async_get_history(self.hass).async_remove(self.entity_id)
+            self._history = None
         await super().async_will_remove_from_hass()
 
+    @callback
+    def _async_write_ha_state(self) -> None:
+        """Every state write ends up here, count and remember them."""
+        if self._group_metrics is not None:
+            self._group_metrics.state_writes += 1
+        with trace_span(self.hass, "state_write", SPAN_STATE_WRITE, entity_id=self.entity_id):
+            super()._async_write_ha_state()
+        if self._history is not None:
+            self._history.add(self.hass.states.get(self.entity_id))
+
+    def _publish(self, value, force: bool = False) -> None:
+        """Write our state, through the publish policy if we have one.
+
+        `value` is what the policy compares against, `force` skips the
+        policy, use it for changes that must always be seen.
+        """
+        if self._publish_policy is None:
+            self.async_write_ha_state()
+        else:
+            self._publish_policy.async_publish(value, force)
+
+    def _native_attributes(self) -> dict:
+        """Our attributes as we would write them, even if we are unavailable."""
+        attributes = dict(self.state_attributes or {})
+        attributes.update(self.extra_state_attributes or {})
+        return attributes
+
+    def _snapshot(self) -> dict:
+        """Our state as we hold it, not as we write it."""
+        return {name: copy.copy(getattr(self, name)) for name in self._snapshot_attrs}
+
+    def _apply_snapshot(self, snapshot: dict) -> None:
+        """Go back to a snapshot, the caller writes the state.
+
+        Anything in progress should be stopped first, subclasses with timers
+        do that before calling us.
+        """
+        if self._publish_policy is not None:
+            self._publish_policy.async_cancel()
+        for name in self._snapshot_attrs:
+            if name in snapshot:
+                setattr(self, name, copy.copy(snapshot[name]))
+        self._update_attributes()
+
+    @traced_operation
     def set_available(self, value):
         self._attr_available = value
         self._update_attributes()
@@ -149,8 +246,16 @@ class VirtualOpenableEntity(VirtualEntity):
     _open_close_duration: int
     _open_close_tick: float
     _open_close_operation_started: bool | None
+    _open_close_mode: str
+    _publish_interval: float | None
+    _motion_start_time: float | None
+    _motion_start_position: float | None
+    _motion_velocity: float | None
+    _motion_end_time: float | None
     _attr_is_closed: bool
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_current_position", "_attr_is_closed")
+
     def __init__(self, config, domain, old_style: bool):
         """Initialize the Virtual openable device."""
         _LOGGER.debug(f"creating-virtual-openable-{domain}={config}")
@@ -159,11 +264,20 @@ class VirtualOpenableEntity(VirtualEntity):
         self._attr_device_class = config.get(CONF_CLASS)
         self._open_close_duration = config.get(CONF_OPEN_CLOSE_DURATION)
         self._open_close_tick = config.get(CONF_OPEN_CLOSE_TICK)
+        self._open_close_mode = config.get(CONF_OPEN_CLOSE_MODE, OPEN_CLOSE_MODE_TICK)
+        self._publish_interval = config.get(CONF_OPEN_CLOSE_PUBLISH_INTERVAL, None)
 
         self._open_close_operation_started = None
         self._current_position = 0
         self._target_position = None
         self._positions_per_tick = None
+        self._tick_scale = 1
+        self._timer_handle = None
+
+        self._motion_start_time = None
+        self._motion_start_position = None
+        self._motion_velocity = None
+        self._motion_end_time = None
 
         _LOGGER.info(f"VirtualOpenable: {self.name} created")
 
@@ -193,16 +307,74 @@ class VirtualOpenableEntity(VirtualEntity):
             ) if value is not None
         })
 
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop any movement before we go."""
+        self._cancel_timer()
+        await super().async_will_remove_from_hass()
+
+    def _snapshot(self) -> dict:
+        snapshot = super()._snapshot()
+        # Where we are now, even part way through a move.
+        snapshot["_current_position"] = self._position()
+        return snapshot
+
+    def _apply_snapshot(self, snapshot: dict) -> None:
+        self._cancel_timer()
+        self._freeze_motion()
+        self._target_position = None
+        self._positions_per_tick = None
+        self._attr_is_opening = False
+        self._attr_is_closing = False
+        super()._apply_snapshot(snapshot)
+
     def _cancel_timer(self) -> None:
         """Cancel the current movement timer if active."""
-        if hasattr(self, '_timer_handle') and self._timer_handle:
+        if self._timer_handle:
             self._timer_handle()
             self._timer_handle = None
 
-    def _stop(self) -> None:
-        _LOGGER.info(f"stopping {self.name} at position {self._current_position}")
+    def _start_timer(self) -> None:
+        """Schedule the next movement tick on the shared timer wheel.
+
+        If the loop is struggling we tick less often but move further each
+        tick, so the move still takes as long.
+        """
+        self._tick_scale = loop_backoff(self.hass)
+        self._timer_handle = async_get_timer_wheel(self.hass).async_call_later(
+            self._open_close_tick * self._tick_scale, self._update_position
+        )
+
+    def _position(self) -> float:
+        """Return the current position.
+
+        In analytic mode the position is worked out from when the move
+        started. It is truncated towards the start of the move so we only
+        reach the target when the move completes.
+        """
+        if self._motion_start_time is None:
+            return self._current_position
+
+        elapsed = self.hass.loop.time() - self._motion_start_time
+        position = self._motion_start_position + self._motion_velocity * elapsed
+        if self._motion_velocity > 0:
+            return min(self._target_position, math.floor(position))
+        return max(self._target_position, math.ceil(position))
+
+    def _freeze_motion(self) -> None:
+        """Fix the analytic position and forget the current move."""
+        if self._motion_start_time is None:
+            return
+        self._current_position = self._position()
+        self._motion_start_time = None
+        self._motion_start_position = None
+        self._motion_velocity = None
+        self._motion_end_time = None
 
+    def _stop(self) -> None:
         self._cancel_timer()
+        self._freeze_motion()
+
+        _LOGGER.info(f"stopping {self.name} at position {self._current_position}")
 
         self._target_position = None
         self._positions_per_tick = None
@@ -211,7 +383,7 @@ class VirtualOpenableEntity(VirtualEntity):
 
         self._attr_is_closed = (self._current_position == 0)
 
-        self.async_write_ha_state()
+        self._publish(self._current_position, force=True)
 
     def _set_direction_flags(self, target_position: float) -> None:
         """Set opening/closing flags based on target position."""
@@ -222,12 +394,13 @@ class VirtualOpenableEntity(VirtualEntity):
             self._attr_is_opening = True
             self._attr_is_closing = False
 
-        self.async_write_ha_state()
+        self._publish(self._current_position, force=True)
 
     def _set_position(self, position: int) -> None:
         _LOGGER.info(f"setting {self.name} position {position}")
 
         self._cancel_timer()
+        self._freeze_motion()
 
         position = max(0, min(100, int(position)))
 
@@ -254,28 +427,96 @@ class VirtualOpenableEntity(VirtualEntity):
             self.async_schedule_update_ha_state(force_refresh=True)
             return
 
+        if self._open_close_mode == OPEN_CLOSE_MODE_ANALYTIC:
+            self._start_motion()
+            return
+
         distance = abs(self._target_position - self._current_position)
         movement_duration = (distance / 100.0) * self._open_close_duration
         total_ticks = max(1, int(movement_duration / self._open_close_tick))
         self._positions_per_tick = distance / total_ticks
 
         self._set_direction_flags(self._target_position)
-        self._timer_handle = async_call_later(self.hass, self._open_close_tick, self._update_position)
+        self._start_timer()
 
     @callback
     def _update_position(self, _now) -> None:
+        self._timer_handle = None
         if self._target_position is None:
             return
 
+        step = self._positions_per_tick * self._tick_scale
         if self._attr_is_closing:
-            next_pos = max(self._target_position, self._current_position - self._positions_per_tick)
+            next_pos = max(self._target_position, self._current_position - step)
         else:
-            next_pos = min(self._target_position, self._current_position + self._positions_per_tick)
+            next_pos = min(self._target_position, self._current_position + step)
 
         self._current_position = next_pos
 
         if self._current_position == self._target_position:
             self._stop()
         else:
-            self.async_write_ha_state()
-            self._timer_handle = async_call_later(self.hass, self._open_close_tick, self._update_position)
+            self._publish(self._current_position)
+            self._start_timer()
+
+    def _start_motion(self) -> None:
+        """Start an analytic move towards the target position.
+
+        Rather than stepping the position we remember where and when we
+        started and how fast we are going. Timers are only used to publish
+        intermediate states and to finish the move.
+        """
+        distance = self._target_position - self._current_position
+        movement_duration = (abs(distance) / 100.0) * self._open_close_duration
+
+        now = self.hass.loop.time()
+        self._motion_start_time = now
+        self._motion_start_position = self._current_position
+        self._motion_velocity = distance / movement_duration
+        self._motion_end_time = now + movement_duration
+
+        self._set_direction_flags(self._target_position)
+        self._schedule_motion_update()
+
+    def _schedule_motion_update(self) -> None:
+        """Work out when we next need to publish and schedule it.
+
+        With no publish interval we publish each time the integer position
+        changes, with an interval of 0 we only publish the start and end of
+        a move.
+        """
+        now = self.hass.loop.time()
+        remaining = max(0.0, self._motion_end_time - now)
+        backoff = loop_backoff(self.hass)
+
+        if self._publish_interval is None:
+            position = self._position()
+            next_position = position + backoff if self._motion_velocity > 0 else position - backoff
+            start_to_next = (next_position - self._motion_start_position) / self._motion_velocity
+            delay = self._motion_start_time + start_to_next - now
+        elif self._publish_interval > 0:
+            delay = self._publish_interval * backoff
+        else:
+            delay = remaining
+
+        self._timer_handle = async_get_timer_wheel(self.hass).async_call_later(
+            max(0.0, min(delay, remaining)), self._update_motion
+        )
+
+    @callback
+    def _update_motion(self, _now) -> None:
+        self._timer_handle = None
+        if self._motion_start_time is None:
+            return
+
+        if self.hass.loop.time() >= self._motion_end_time:
+            self._motion_start_time = None
+            self._motion_start_position = None
+            self._motion_velocity = None
+            self._motion_end_time = None
+            self._current_position = self._target_position
+            self._stop()
+            return
+
+        self._publish(self._position())
+        self._schedule_motion_update()
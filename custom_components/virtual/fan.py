@@ -31,6 +31,7 @@ from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from . import get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -89,6 +90,10 @@ async def async_setup_entry(
 class VirtualFan(VirtualEntity, FanEntity):
     """A demonstration fan component."""
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + (
+        "_attr_current_direction", "_attr_oscillating", "_attr_percentage", "_attr_preset_mode",
+    )
+
     def __init__(self, config, old_style: bool):
         """Initialize the entity."""
         super().__init__(config, PLATFORM_DOMAIN, old_style)
@@ -159,16 +164,19 @@ class VirtualFan(VirtualEntity, FanEntity):
         else:
             raise ValueError(f"Invalid preset mode: {preset_mode}")
 
+    @traced_operation
     async def async_set_percentage(self, percentage: int) -> None:
         """Set the speed of the fan, as a percentage."""
         _LOGGER.debug(f"setting {self.name} pcent to {percentage}")
         self._set_percentage(percentage)
 
+    @traced_operation
     async def async_set_preset_mode(self, preset_mode: str) -> None:
         """Set new preset mode."""
         _LOGGER.debug(f"setting {self.name} mode to {preset_mode}")
         self._set_preset_mode(preset_mode)
 
+    @traced_operation
     async def async_turn_on(
             self,
             percentage: int | None = None,
@@ -185,11 +193,13 @@ class VirtualFan(VirtualEntity, FanEntity):
             percentage = 67
         self._set_percentage(percentage)
 
+    @traced_operation
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn off the entity."""
         _LOGGER.debug(f"turning {self.name} off")
         self._set_percentage(0)
 
+    @traced_operation
     async def async_set_direction(self, direction: str) -> None:
         """Set the direction of the fan."""
         _LOGGER.debug(f"setting direction of {self.name} to {direction}")
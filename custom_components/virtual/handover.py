@@ -0,0 +1,70 @@
+"""
+Provides state handover across group reloads.
+
+When a group unloads, the state of each of its entities is kept in memory,
+keyed by unique id. If the group is set up again soon after, as it is on a
+reload, the new entities take that state instead of going back through the
+restore state data. The states are copies of the values the entities hold,
+nothing is serialised or parsed, and entities that aren't persistent keep
+their state too. History buffers are handed over as they are, so a reload
+doesn't lose the transitions. Entities that are no longer in the file are
+dropped.
+"""
+
+import logging
+import time
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+from .history import HistoryBuffer
+from .metrics import async_get_metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class VirtualHandover(object):
+    """Entity states waiting for their group to be set up again."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._groups: dict[str, tuple[float, dict[str, tuple[dict, HistoryBuffer | None]]]] = {}
+
+    @callback
+    def async_save(self, group_name: str) -> None:
+        """Keep the state and history of the group's entities, call before they
+        unload."""
+        states = {
+            entity.unique_id: (entity._snapshot(), entity._history)
+            for entity in async_get_metrics(self._hass).entities(group_name)
+        }
+        self._groups[group_name] = (time.monotonic(), states)
+        _LOGGER.debug(f"holding {len(states)} states from {group_name}")
+
+    @callback
+    def async_take(self, group_name: str) -> dict[str, tuple[dict, HistoryBuffer | None]]:
+        """Return the states and history buffers kept for the group, by unique
+        id.
+
+        Nothing is returned if the group took too long to come back, its
+        states will already be in the restore state data.
+        """
+        saved, states = self._groups.pop(group_name, (0, {}))
+        if states and time.monotonic() - saved > HANDOVER_TIMEOUT:
+            _LOGGER.debug(f"dropping stale states for {group_name}")
+            return {}
+        return states
+
+    @callback
+    def async_discard(self, group_name: str) -> None:
+        self._groups.pop(group_name, None)
+
+
+@callback
+def async_get_handover(hass: HomeAssistant) -> VirtualHandover:
+    """Return the shared handover, creating it if needed."""
+    handover = hass.data.get(COMPONENT_HANDOVER)
+    if handover is None:
+        handover = hass.data[COMPONENT_HANDOVER] = VirtualHandover(hass)
+    return handover
@@ -0,0 +1,106 @@
+"""
+Provides recent state history for virtual entities.
+
+An entity with `history` set keeps its last few state transitions in a fixed
+size ring, with when they happened and the context that caused them. The
+`get_history` service returns them for a group or a list of entities in one
+call, without going near the recorder database.
+"""
+
+import logging
+
+from homeassistant.core import HomeAssistant, State, callback
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class HistoryBuffer(object):
+    """The last `size` state transitions of one entity.
+
+    Entries are plain tuples in a preallocated list so a busy entity doesn't
+    churn memory.
+    """
+
+    __slots__ = ("group_name", "_entries", "_next", "_count", "_last_state")
+
+    def __init__(self, size: int, group_name: str | None = None):
+        self.group_name = group_name
+        self._entries = [None] * size
+        self._next = 0
+        self._count = 0
+        self._last_state = None
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    def add(self, state: State | None) -> None:
+        """Remember `state` if it is a transition."""
+        if state is None or state.state == self._last_state:
+            return
+        self._last_state = state.state
+        context = state.context
+        self._entries[self._next] = (
+            state.last_changed, state.state, context.id, context.user_id, context.parent_id
+        )
+        self._next = (self._next + 1) % len(self._entries)
+        self._count = min(self._count + 1, len(self._entries))
+
+    def as_list(self) -> list[dict]:
+        """Transitions, oldest first."""
+        size = len(self._entries)
+        entries = []
+        for index in range(self._next - self._count, self._next):
+            changed, state, context_id, user_id, parent_id = self._entries[index % size]
+            entries.append({
+                "last_changed": changed.isoformat(),
+                "state": state,
+                "context": {"id": context_id, "user_id": user_id, "parent_id": parent_id},
+            })
+        return entries
+
+
+class VirtualHistory(object):
+    """Every entity's history buffer, by entity id."""
+
+    def __init__(self):
+        self._buffers: dict[str, HistoryBuffer] = {}
+
+    @callback
+    def async_add(self, entity_id: str, buffer: HistoryBuffer) -> None:
+        self._buffers[entity_id] = buffer
+
+    @callback
+    def async_remove(self, entity_id: str) -> None:
+        self._buffers.pop(entity_id, None)
+
+    def query(self, entity_ids=(), group_name: str | None = None) -> dict[str, list[dict]]:
+        """Transitions for `entity_ids` and every entity in `group_name`.
+
+        Entities without a history are skipped.
+        """
+        buffers = {
+            entity_id: self._buffers[entity_id] for entity_id in entity_ids if entity_id in self._buffers
+        }
+        if group_name is not None:
+            buffers.update({
+                entity_id: buffer for entity_id, buffer in self._buffers.items() if buffer.group_name == group_name
+            })
+        return {entity_id: buffer.as_list() for entity_id, buffer in buffers.items()}
+
+
+@callback
+def async_get_history(hass: HomeAssistant) -> VirtualHistory:
+    """Return the shared history, creating it if needed."""
+    history = hass.data.get(COMPONENT_HISTORY)
+    if history is None:
+        history = hass.data[COMPONENT_HISTORY] = VirtualHistory()
+    return history
+
+
+@callback
+def async_stop_history(hass: HomeAssistant) -> None:
+    hass.data.pop(COMPONENT_HISTORY, None)
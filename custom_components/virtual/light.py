@@ -5,7 +5,6 @@ This component provides support for a virtual light.
 from __future__ import annotations
 
 import logging
-import pprint
 import voluptuous as vol
 from collections.abc import Callable
 from typing import Any
@@ -18,6 +17,7 @@ from homeassistant.components.light import (
     ATTR_EFFECT,
     ATTR_EFFECT_LIST,
     ATTR_HS_COLOR,
+    ATTR_TRANSITION,
     ColorMode,
     DOMAIN as PLATFORM_DOMAIN,
     LightEntity,
@@ -25,14 +25,16 @@ from homeassistant.components.light import (
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import STATE_ON
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from . import get_entity_configs
+from .animation import async_get_light_animator
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -50,6 +52,7 @@ CONF_INITIAL_WHITE_VALUE = "initial_white_value"
 CONF_SUPPORT_EFFECT = "support_effect"
 CONF_INITIAL_EFFECT = "initial_effect"
 CONF_INITIAL_EFFECT_LIST = "initial_effect_list"
+CONF_SUPPORT_TRANSITION = "support_transition"
 
 DEFAULT_LIGHT_VALUE = "on"
 DEFAULT_SUPPORT_BRIGHTNESS = True
@@ -63,6 +66,7 @@ DEFAULT_INITIAL_WHITE_VALUE = 240
 DEFAULT_SUPPORT_EFFECT = False
 DEFAULT_INITIAL_EFFECT = "none"
 DEFAULT_INITIAL_EFFECT_LIST = ["rainbow", "none"]
+DEFAULT_SUPPORT_TRANSITION = False
 
 BASE_SCHEMA = virtual_schema(DEFAULT_LIGHT_VALUE, {
     vol.Optional(CONF_SUPPORT_BRIGHTNESS, default=DEFAULT_SUPPORT_BRIGHTNESS): cv.boolean,
@@ -75,7 +79,8 @@ BASE_SCHEMA = virtual_schema(DEFAULT_LIGHT_VALUE, {
     vol.Optional(CONF_INITIAL_WHITE_VALUE, default=DEFAULT_INITIAL_WHITE_VALUE): cv.byte,
     vol.Optional(CONF_SUPPORT_EFFECT, default=DEFAULT_SUPPORT_EFFECT): cv.boolean,
     vol.Optional(CONF_INITIAL_EFFECT, default=DEFAULT_INITIAL_EFFECT): cv.string,
-    vol.Optional(CONF_INITIAL_EFFECT_LIST, default=DEFAULT_INITIAL_EFFECT_LIST): cv.ensure_list
+    vol.Optional(CONF_INITIAL_EFFECT_LIST, default=DEFAULT_INITIAL_EFFECT_LIST): cv.ensure_list,
+    vol.Optional(CONF_SUPPORT_TRANSITION, default=DEFAULT_SUPPORT_TRANSITION): cv.boolean,
 })
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(BASE_SCHEMA)
@@ -112,6 +117,14 @@ async def async_setup_entry(
 
 class VirtualLight(VirtualEntity, LightEntity):
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + (
+        "_attr_is_on", "_attr_color_mode", "_attr_brightness", "_attr_hs_color",
+        "_attr_color_temp_kelvin", "_attr_effect",
+    )
+
+    # Where the running transition ends up, as snapshot values.
+    _transition_end: dict | None = None
+
     def __init__(self, config, old_style: bool):
         """Initialize a Virtual light."""
         super().__init__(config, PLATFORM_DOMAIN, old_style)
@@ -133,6 +146,35 @@ class VirtualLight(VirtualEntity, LightEntity):
         if config.get(CONF_SUPPORT_EFFECT):
             self._attr_supported_features |= LightEntityFeature.EFFECT
             self._attr_effect_list = self._config.get(CONF_INITIAL_EFFECT_LIST)
+        if config.get(CONF_SUPPORT_TRANSITION):
+            self._attr_supported_features |= LightEntityFeature.TRANSITION
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._update_effect()
+
+    def _snapshot(self) -> dict:
+        # Mid fade we save where the fade is going, not where it's got to.
+        snapshot = super()._snapshot()
+        if self._transition_end is not None:
+            snapshot.update(self._transition_end)
+        return snapshot
+
+    def _apply_snapshot(self, snapshot) -> None:
+        async_get_light_animator(self.hass).async_cancel(self)
+        self._transition_end = None
+        super()._apply_snapshot(snapshot)
+        self._update_effect()
+
+    @callback
+    def _transition_finished(self) -> None:
+        self._transition_end = None
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop any fades or effects."""
+        async_get_light_animator(self.hass).async_cancel(self)
+        self._transition_end = None
+        await super().async_will_remove_from_hass()
 
     def _create_state(self, config):
         super()._create_state(config)
@@ -184,9 +226,48 @@ class VirtualLight(VirtualEntity, LightEntity):
             ) if value is not None
         })
 
+    def _update_effect(self) -> None:
+        """Start or stop the effect animation to match the current state."""
+        animator = async_get_light_animator(self.hass)
+        if self._attr_is_on and self._attr_effect is not None and ColorMode.HS in self._attr_supported_color_modes:
+            animator.async_start_effect(self, self._attr_effect, self._attr_hs_color)
+        else:
+            animator.async_cancel_effect(self)
+
+    @callback
+    def async_apply_animation_frame(self, brightness, hs_color, color_temp_kelvin) -> None:
+        """Publish the next step of a transition or effect."""
+        if brightness is not None:
+            self._attr_brightness = brightness
+        if hs_color is not None:
+            self._attr_hs_color = hs_color
+        if color_temp_kelvin is not None:
+            self._attr_color_temp_kelvin = color_temp_kelvin
+        self._update_attributes()
+        self.async_write_ha_state()
+
+    @traced_operation
     async def async_turn_on(self, **kwargs: Any) -> None:
         """Turn the light on."""
-        _LOGGER.debug(f"turning {self.name} on {pprint.pformat(kwargs)}")
+        _LOGGER.debug(f"turning {self.name} on {kwargs}")
+        animator = async_get_light_animator(self.hass)
+        animator.async_cancel_transition(self)
+
+        # Mid fade we carry on to the brightness the fade was heading for, a
+        # fade off keeps the brightness it started from.
+        restore_brightness = None
+        if self._transition_end is not None:
+            restore_brightness = self._transition_end["_attr_brightness"]
+        self._transition_end = None
+
+        # Fades start from where we are now, or from black if we're off.
+        transition = kwargs.get(ATTR_TRANSITION, None)
+        start = (
+            self._attr_brightness if self._attr_is_on else 0,
+            self._attr_hs_color,
+            self._attr_color_temp_kelvin
+        )
+
         hs_color = kwargs.get(ATTR_HS_COLOR, None)
 
         if hs_color is not None and ColorMode.HS in self._attr_supported_color_modes:
@@ -200,7 +281,7 @@ class VirtualLight(VirtualEntity, LightEntity):
             self._attr_color_temp_kelvin = ct
             self._attr_hs_color = None
 
-        brightness = kwargs.get(ATTR_BRIGHTNESS, None)
+        brightness = kwargs.get(ATTR_BRIGHTNESS, restore_brightness)
         if brightness is not None:
             if self._attr_color_mode == ColorMode.UNKNOWN:
                 self._attr_color_mode = ColorMode.BRIGHTNESS
@@ -213,11 +294,60 @@ class VirtualLight(VirtualEntity, LightEntity):
         if effect is not None and self._attr_supported_features & LightEntityFeature.EFFECT:
             self._attr_effect = effect
 
+        if transition and self._attr_supported_features & LightEntityFeature.TRANSITION:
+            end = (self._attr_brightness, self._attr_hs_color, self._attr_color_temp_kelvin)
+            if start[0] is not None and end[0] is not None:
+                self._attr_brightness = start[0]
+            if start[1] is not None and end[1] is not None:
+                self._attr_hs_color = start[1]
+            if start[2] is not None and end[2] is not None:
+                self._attr_color_temp_kelvin = start[2]
+            self._transition_end = {
+                "_attr_is_on": True,
+                "_attr_brightness": end[0],
+                "_attr_hs_color": end[1],
+                "_attr_color_temp_kelvin": end[2],
+            }
+            animator.async_start_transition(self, transition, start, end, self._transition_finished)
+
         self._attr_is_on = True
+        self._update_effect()
         self._update_attributes()
 
+    @traced_operation
     async def async_turn_off(self, **kwargs: Any) -> None:
         """Turn the light off."""
-        _LOGGER.debug(f"turning {self.name} off {pprint.pformat(kwargs)}")
+        _LOGGER.debug(f"turning {self.name} off {kwargs}")
+        animator = async_get_light_animator(self.hass)
+        animator.async_cancel(self)
+
+        # Mid fade we keep the brightness the fade was heading for, or for a
+        # fade off the one it started from.
+        brightness = self._attr_brightness
+        if self._transition_end is not None and self._transition_end["_attr_brightness"] is not None:
+            brightness = self._transition_end["_attr_brightness"]
+        self._transition_end = None
+
+        transition = kwargs.get(ATTR_TRANSITION, None)
+        if (transition and self._attr_is_on and brightness
+                and self._attr_supported_features & LightEntityFeature.TRANSITION):
+
+            # Fade to black then turn off, we put the brightness back so the
+            # light comes back on at the same level.
+            @callback
+            def _finished() -> None:
+                self._transition_end = None
+                self._attr_is_on = False
+                self._attr_brightness = brightness
+                self._update_attributes()
+                self.async_write_ha_state()
+
+            self._transition_end = {"_attr_is_on": False, "_attr_brightness": brightness}
+            animator.async_start_transition(
+                self, transition, (self._attr_brightness, None, None), (0, None, None), _finished
+            )
+            return
+
         self._attr_is_on = False
+        self._attr_brightness = brightness
         self._update_attributes()
@@ -20,12 +20,13 @@ from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from . import get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .scheduler import async_get_timer_wheel
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -34,6 +35,7 @@ DEPENDENCIES = [COMPONENT_DOMAIN]
 
 CONF_CHANGE_TIME = "locking_time"
 CONF_TEST_JAMMING = "jamming_test"
+CONF_JAMMING_SEED = "jamming_seed"
 
 DEFAULT_LOCK_VALUE = "locked"
 DEFAULT_CHANGE_TIME = timedelta(seconds=0)
@@ -42,10 +44,12 @@ DEFAULT_TEST_JAMMING = 0
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_LOCK_VALUE, {
     vol.Optional(CONF_CHANGE_TIME, default=DEFAULT_CHANGE_TIME): vol.All(cv.time_period, cv.positive_timedelta),
     vol.Optional(CONF_TEST_JAMMING, default=DEFAULT_TEST_JAMMING): cv.positive_int,
+    vol.Optional(CONF_JAMMING_SEED): vol.Coerce(int),
 }))
 LOCK_SCHEMA = vol.Schema(virtual_schema(DEFAULT_LOCK_VALUE, {
     vol.Optional(CONF_CHANGE_TIME, default=DEFAULT_CHANGE_TIME): vol.All(cv.time_period, cv.positive_timedelta),
     vol.Optional(CONF_TEST_JAMMING, default=DEFAULT_TEST_JAMMING): cv.positive_int,
+    vol.Optional(CONF_JAMMING_SEED): vol.Coerce(int),
 }))
 
 
@@ -77,7 +81,14 @@ async def async_setup_entry(
 
 
 class VirtualLock(VirtualEntity, LockEntity):
-    """Representation of a Virtual lock."""
+    """Representation of a Virtual lock.
+
+    A lock with a `locking_time` moves through locking or unlocking before
+    finishing. Only one transition is ever pending, a new command replaces
+    whatever was in progress.
+    """
+
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_is_locked", "_attr_is_jammed")
 
     def __init__(self, hass, config, old_style: bool):
         """Initialize the Virtual lock device."""
@@ -86,7 +97,13 @@ class VirtualLock(VirtualEntity, LockEntity):
         self._hass = hass
         self._change_time = config.get(CONF_CHANGE_TIME)
         self._test_jamming = config.get(CONF_TEST_JAMMING)
-        
+        self._operation_handle = None
+
+        # Each lock gets its own generator so jamming is repeatable. Without a
+        # seed we use the unique id, that keeps runs the same from restart to
+        # restart.
+        self._jamming_random = random.Random(config.get(CONF_JAMMING_SEED, self.unique_id))
+
         _LOGGER.info('VirtualLock: {} created'.format(self.name))
 
     def _create_state(self, config):
@@ -99,8 +116,22 @@ class VirtualLock(VirtualEntity, LockEntity):
 
         self._attr_is_locked = state.state == LockState.LOCKED
 
+    def _apply_snapshot(self, snapshot) -> None:
+        self._cancel_operation()
+        self._attr_is_locking = False
+        self._attr_is_unlocking = False
+        super()._apply_snapshot(snapshot)
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Drop any pending transition."""
+        self._cancel_operation()
+        await super().async_will_remove_from_hass()
+
+    def _jams(self) -> bool:
+        return self._test_jamming > 0 and self._jamming_random.randint(0, self._test_jamming) == 0
+
     def _lock(self) -> None:
-        if self._test_jamming == 0 or random.randint(0, self._test_jamming) > 0:
+        if not self._jams():
             _LOGGER.debug(f"locked {self.name}")
             self._attr_is_locked = True
             self._attr_is_locking = False
@@ -133,33 +164,45 @@ class VirtualLock(VirtualEntity, LockEntity):
     def _jam(self) -> None:
         _LOGGER.debug(f"jamming {self.name}")
         self._attr_is_locked = False
+        self._attr_is_locking = False
+        self._attr_is_unlocking = False
         self._attr_is_jammed = True
 
+    def _cancel_operation(self) -> None:
+        if self._operation_handle is not None:
+            _LOGGER.debug(f"cancelling pending operation on {self.name}")
+            self._operation_handle()
+            self._operation_handle = None
+
     @callback
-    async def _finish_operation(self, _point_in_time) -> None:
+    def _finish_operation(self, _point_in_time) -> None:
+        self._operation_handle = None
         if self.is_locking:
             self._lock()
-        if self.is_unlocking:
+        elif self.is_unlocking:
             self._unlock()
-        self.async_schedule_update_ha_state()
-
-    def _start_operation(self):
-        async_call_later(self.hass, self._change_time, self._finish_operation)
+        self.async_write_ha_state()
 
-    async def async_lock(self, **kwargs: Any) -> None:
+    def _start_operation(self, starting: Callable[[], None], finished: Callable[[], None]) -> None:
+        """Move to a new state, superseding anything still in progress."""
+        self._cancel_operation()
         if self._change_time == DEFAULT_CHANGE_TIME:
-            self._lock()
-        else:
-            self._locking()
-            self._start_operation()
+            finished()
+            return
+        starting()
+        self._operation_handle = async_get_timer_wheel(self.hass).async_call_later(
+            self._change_time, self._finish_operation
+        )
+
+    @traced_operation
+    async def async_lock(self, **kwargs: Any) -> None:
+        self._start_operation(self._locking, self._lock)
 
+    @traced_operation
     async def async_unlock(self, **kwargs: Any) -> None:
-        if self._change_time == DEFAULT_CHANGE_TIME:
-            self._unlock()
-        else:
-            self._unlocking()
-            self._start_operation()
+        self._start_operation(self._unlocking, self._unlock)
 
+    @traced_operation
     async def async_open(self, **kwargs: Any) -> None:
         _LOGGER.debug(f"opening {self.name}")
-        self.unlock()
+        await self.async_unlock()
@@ -0,0 +1,220 @@
+"""
+Provides live counters for virtual groups.
+
+Each group keeps track of its entities, the state writes they make, the
+services called on them, how long those calls took and how long the group
+took to set up and to read and write its meta data. The counters feed the
+diagnostics download and, if enabled, a few diagnostic sensors per group.
+"""
+
+import bisect
+import logging
+import time
+from collections import Counter
+
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, callback
+
+from .const import *
+from .monitor import record_job
+from .tracing import SPAN_SERVICE, trace_span
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the service latency buckets. Anything slower
+# lands in a final overflow bucket.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+METRIC_COALESCED_UPDATES = "coalesced_updates"
+METRIC_ENTITIES = "entities"
+METRIC_META_READS = "meta_reads"
+METRIC_META_WRITES = "meta_writes"
+METRIC_SERVICE_CALLS = "service_calls"
+METRIC_STATE_WRITES = "state_writes"
+METRIC_SUPPRESSED_UPDATES = "suppressed_updates"
+
+
+class LatencyHistogram(object):
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> dict:
+        labels = [f"<={bound * 1e3:g}ms" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1] * 1e3:g}ms"]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else None,
+            "max_ms": self.max * 1e3,
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+
+class _FileTimer(object):
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = None
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": self.total * 1e3,
+            "last_ms": self.last * 1e3 if self.last is not None else None,
+        }
+
+
+class VirtualGroupMetrics(object):
+    """Counters for one group."""
+
+    def __init__(self, group_name: str):
+        self.group_name = group_name
+        self.entities = set()
+        self.services: dict[str, LatencyHistogram] = {}
+        self.state_writes = 0
+        self.meta_reads = _FileTimer()
+        self.meta_writes = _FileTimer()
+        self.setup_phases: dict[str, float] = {}
+        self.orphans: dict[str, int] = {}
+
+    def record_service(self, service: str, seconds: float) -> None:
+        histogram = self.services.get(service)
+        if histogram is None:
+            histogram = self.services[service] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def counters(self) -> dict:
+        coalesced = 0
+        suppressed = 0
+        for entity in self.entities:
+            if entity._publish_policy is not None:
+                coalesced += entity._publish_policy.coalesced
+                suppressed += entity._publish_policy.suppressed
+        return {
+            METRIC_ENTITIES: len(self.entities),
+            METRIC_STATE_WRITES: self.state_writes,
+            METRIC_SERVICE_CALLS: sum(histogram.count for histogram in self.services.values()),
+            METRIC_COALESCED_UPDATES: coalesced,
+            METRIC_SUPPRESSED_UPDATES: suppressed,
+            METRIC_META_READS: self.meta_reads.count,
+            METRIC_META_WRITES: self.meta_writes.count,
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "counters": self.counters(),
+            "entities_per_platform": dict(Counter(entity.platform.domain for entity in self.entities)),
+            "services": {service: histogram.as_dict() for service, histogram in self.services.items()},
+            "meta_reads": self.meta_reads.as_dict(),
+            "meta_writes": self.meta_writes.as_dict(),
+            "setup_phases_ms": {phase: seconds * 1e3 for phase, seconds in self.setup_phases.items()},
+            "orphans_removed": self.orphans,
+        }
+
+
+class VirtualMetrics(object):
+    """Counters for every group."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._groups: dict[str, VirtualGroupMetrics] = {}
+        self._entity_groups: dict[str, VirtualGroupMetrics] = {}
+
+    def group(self, group_name: str) -> VirtualGroupMetrics:
+        metrics = self._groups.get(group_name)
+        if metrics is None:
+            metrics = self._groups[group_name] = VirtualGroupMetrics(group_name)
+        return metrics
+
+    def entities(self, group_name: str) -> set:
+        """The group's live entities."""
+        metrics = self._groups.get(group_name)
+        return metrics.entities if metrics is not None else set()
+
+    def group_entities(self) -> dict[str, set]:
+        """Every group's live entities."""
+        return {group_name: metrics.entities for group_name, metrics in self._groups.items()}
+
+    @callback
+    def async_remove_group(self, group_name: str) -> None:
+        self._groups.pop(group_name, None)
+
+    @callback
+    def async_add_entity(self, group_name: str, entity) -> VirtualGroupMetrics:
+        metrics = self.group(group_name)
+        metrics.entities.add(entity)
+        self._entity_groups[entity.entity_id] = metrics
+        return metrics
+
+    @callback
+    def async_remove_entity(self, entity) -> None:
+        metrics = self._entity_groups.pop(entity.entity_id, None)
+        if metrics is not None:
+            metrics.entities.discard(entity)
+
+    @callback
+    def async_record_service(self, call: ServiceCall, seconds: float) -> None:
+        """Count a call against every group it touched."""
+        entity_ids = call.data.get(ATTR_ENTITY_ID, [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        groups = {self._entity_groups.get(entity_id) for entity_id in entity_ids}
+        groups.discard(None)
+        for metrics in groups:
+            metrics.record_service(call.service, seconds)
+
+    def shared(self) -> dict:
+        """What all the groups share."""
+        timer = self._hass.data.get(COMPONENT_TIMER)
+        routes = self._hass.data.get(COMPONENT_ROUTES)
+        profiler = self._hass.data.get(COMPONENT_PROFILER)
+        return {
+            "active_timers": timer.active_timers if timer is not None else 0,
+            "timer_resolution": timer.resolution if timer is not None else None,
+            "active_routes": routes.active_routes if routes is not None else 0,
+            "profiling": profiler.running if profiler is not None else False,
+        }
+
+
+@callback
+def async_get_metrics(hass: HomeAssistant) -> VirtualMetrics:
+    """Return the shared metrics, creating them if needed."""
+    metrics = hass.data.get(COMPONENT_METRICS)
+    if metrics is None:
+        metrics = hass.data[COMPONENT_METRICS] = VirtualMetrics(hass)
+    return metrics
+
+
+@callback
+def async_stop_metrics(hass: HomeAssistant) -> None:
+    hass.data.pop(COMPONENT_METRICS, None)
+
+
+def timed_service(hass: HomeAssistant, handler):
+    """Wrap a service handler so its calls are counted and traced."""
+    async def _async_timed_service(call: ServiceCall):
+        start = time.perf_counter()
+        try:
+            with trace_span(hass, f"{call.domain}.{call.service}", SPAN_SERVICE,
+                            entity_ids=call.data.get(ATTR_ENTITY_ID, [])):
+                return await handler(call)
+        finally:
+            seconds = time.perf_counter() - start
+            async_get_metrics(hass).async_record_service(call, seconds)
+            record_job(hass, f"{call.domain}.{call.service}", seconds)
+    return _async_timed_service
@@ -0,0 +1,198 @@
+"""
+Provides an event loop lag monitor.
+
+When `loop_monitor` is set in the component configuration we ask the loop to
+wake us at a fixed interval and measure how late it is. Virtual jobs, timer
+callbacks, service calls and group setup, record when they ran, so when the
+loop stalls we can say how much of the stall was ours and which jobs it was.
+
+If `backoff` is enabled and the loop stays laggy the monitor raises a back
+off factor. Cover and valve movement, light animations, route replay and
+rate limited publishing stretch their intervals by that factor, and shrink
+them again when the loop recovers.
+"""
+
+import logging
+from collections import deque
+
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_MONITOR_BACKOFF = "backoff"
+CONF_MONITOR_INTERVAL = "interval"
+CONF_MONITOR_THRESHOLD = "threshold"
+
+DEFAULT_MONITOR_INTERVAL = 0.5
+DEFAULT_MONITOR_THRESHOLD = 100
+
+LOOP_MONITOR_SCHEMA = vol.Schema({
+    vol.Optional(CONF_MONITOR_INTERVAL, default=DEFAULT_MONITOR_INTERVAL):
+        vol.All(vol.Coerce(float), vol.Range(min=0.05, max=60)),
+    # In milliseconds.
+    vol.Optional(CONF_MONITOR_THRESHOLD, default=DEFAULT_MONITOR_THRESHOLD):
+        vol.All(vol.Coerce(float), vol.Range(min=1)),
+    vol.Optional(CONF_MONITOR_BACKOFF, default=False): cv.boolean,
+})
+
+# How many lag samples we keep for the percentiles.
+SAMPLE_WINDOW = 240
+# How many recent samples decide the back off, and how often we decide.
+BACKOFF_WINDOW = 20
+MAX_BACKOFF = 8
+# How many stalls, and how many seconds and jobs, we remember.
+STALL_HISTORY = 20
+JOB_HISTORY = 5.0
+JOB_LIMIT = 10000
+
+
+def _percentile(ordered: list[float], point: float) -> float | None:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(point / 100 * len(ordered)) - 1))]
+
+
+class VirtualLoopMonitor(object):
+    """Sample loop lag and blame virtual jobs for stalls."""
+
+    def __init__(self, hass: HomeAssistant, config: dict):
+        self._hass = hass
+        self._interval = config[CONF_MONITOR_INTERVAL]
+        self._threshold = config[CONF_MONITOR_THRESHOLD] / 1e3
+        self._backoff_enabled = config[CONF_MONITOR_BACKOFF]
+
+        self._samples = deque(maxlen=SAMPLE_WINDOW)
+        self._jobs = deque(maxlen=JOB_LIMIT)
+        self._stalls = deque(maxlen=STALL_HISTORY)
+        self._blame: dict[str, float] = {}
+        self._since_backoff = 0
+
+        self.backoff = 1
+        self._expected = None
+        self._handle = None
+
+    @callback
+    def async_start(self) -> None:
+        _LOGGER.info(f"monitoring loop lag every {self._interval}s")
+        self._expected = self._hass.loop.time() + self._interval
+        self._handle = self._hass.loop.call_at(self._expected, self._sample)
+
+    @callback
+    def async_stop(self, _event=None) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = None
+
+    @callback
+    def record(self, name: str, seconds: float) -> None:
+        """Note a virtual job that just finished after `seconds`.
+
+        Jobs that await are counted for their whole time, so treat them as
+        suspects for a stall rather than culprits.
+        """
+        end = self._hass.loop.time()
+        self._jobs.append((end - seconds, end, name))
+
+    @callback
+    def _sample(self) -> None:
+        # We don't use the timer wheel here, its slots would look like lag.
+        now = self._hass.loop.time()
+        lag = max(0.0, now - self._expected)
+        self._samples.append(lag)
+        if lag > self._threshold:
+            self._stall(self._expected, now, lag)
+
+        while self._jobs and self._jobs[0][1] < now - JOB_HISTORY:
+            self._jobs.popleft()
+
+        if self._backoff_enabled:
+            self._since_backoff += 1
+            if self._since_backoff >= BACKOFF_WINDOW:
+                self._since_backoff = 0
+                self._update_backoff()
+
+        self._expected = now + self._interval
+        self._handle = self._hass.loop.call_at(self._expected, self._sample)
+
+    def _stall(self, start: float, end: float, lag: float) -> None:
+        """Share out a stall between the virtual jobs that overlap it."""
+        jobs = {}
+        for job_start, job_end, name in self._jobs:
+            overlap = min(end, job_end) - max(start, job_start)
+            if overlap > 0:
+                jobs[name] = jobs.get(name, 0.0) + overlap
+        ours = min(lag, sum(jobs.values()))
+        for name, seconds in jobs.items():
+            self._blame[name] = self._blame.get(name, 0.0) + seconds
+
+        self._stalls.append({
+            "lag_ms": lag * 1e3,
+            "virtual_ms": ours * 1e3,
+            "jobs_ms": {name: seconds * 1e3 for name, seconds in sorted(jobs.items(), key=lambda job: -job[1])},
+        })
+        _LOGGER.debug(f"loop stalled for {lag * 1e3:.0f}ms, virtual jobs {ours * 1e3:.0f}ms")
+
+    def _update_backoff(self) -> None:
+        recent = sorted(list(self._samples)[-BACKOFF_WINDOW:])
+        lag = _percentile(recent, 95)
+        backoff = self.backoff
+        if lag > self._threshold:
+            backoff = min(MAX_BACKOFF, backoff * 2)
+        elif lag < self._threshold / 2:
+            backoff = max(1, backoff // 2)
+        if backoff != self.backoff:
+            _LOGGER.info(f"loop lag {lag * 1e3:.0f}ms, virtual back off now {backoff}x")
+            self.backoff = backoff
+
+    def lag(self) -> dict:
+        """Lag percentiles, in milliseconds."""
+        ordered = sorted(self._samples)
+        return {
+            point: value * 1e3 if value is not None else None
+            for point, value in (
+                ("p50", _percentile(ordered, 50)),
+                ("p95", _percentile(ordered, 95)),
+                ("p99", _percentile(ordered, 99)),
+                ("max", ordered[-1] if ordered else None),
+            )
+        }
+
+    def as_dict(self) -> dict:
+        return {
+            "lag_ms": self.lag(),
+            "samples": len(self._samples),
+            "backoff": self.backoff,
+            "stalls": list(self._stalls),
+            "blame_ms": {
+                name: seconds * 1e3 for name, seconds in sorted(self._blame.items(), key=lambda job: -job[1])
+            },
+        }
+
+
+@callback
+def async_start_loop_monitor(hass: HomeAssistant, config: dict) -> None:
+    """Start monitoring, it runs until Home Assistant stops."""
+    if COMPONENT_MONITOR not in hass.data:
+        monitor = hass.data[COMPONENT_MONITOR] = VirtualLoopMonitor(hass, config)
+        monitor.async_start()
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, monitor.async_stop)
+
+
+def record_job(hass: HomeAssistant, name: str, seconds: float) -> None:
+    """Tell the monitor, if there is one, about a virtual job."""
+    monitor = hass.data.get(COMPONENT_MONITOR)
+    if monitor is not None:
+        monitor.record(name, seconds)
+
+
+def loop_backoff(hass: HomeAssistant) -> int:
+    """How much timed behaviour should stretch its intervals."""
+    monitor = hass.data.get(COMPONENT_MONITOR)
+    return monitor.backoff if monitor is not None else 1
@@ -4,94 +4,66 @@ This component provides support for a virtual number.
 """
 
 import logging
+import math
 import voluptuous as vol
 from collections.abc import Callable
 
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components.number import (
-    ATTR_MAX, ATTR_MIN, DOMAIN as PLATFORM_DOMAIN,
-    NumberDeviceClass
+    DOMAIN as PLATFORM_DOMAIN,
+    NumberEntity,
+    NumberMode,
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     ATTR_DEVICE_CLASS,
-    ATTR_UNIT_OF_MEASUREMENT,
-    CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
-    CONCENTRATION_PARTS_PER_MILLION,
     CONF_UNIT_OF_MEASUREMENT,
-    LIGHT_LUX,
-    PERCENTAGE,
-    SIGNAL_STRENGTH_DECIBELS,
-    UnitOfApparentPower,
-    UnitOfElectricCurrent,
-    UnitOfElectricPotential,
-    UnitOfEnergy,
-    UnitOfFrequency,
-    UnitOfPower,
-    UnitOfPressure,
-    UnitOfReactivePower,
-    UnitOfVolume,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
-from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from . import get_entity_from_domain, get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .scheduler import async_get_timer_wheel
+from .tracing import traced_operation
+from .units import default_unit_of_measurement
 
 
 _LOGGER = logging.getLogger(__name__)
 
 DEPENDENCIES = [COMPONENT_DOMAIN]
 
+CONF_MODE = "mode"
+CONF_RAMP_RATE = "ramp_rate"
+CONF_STEP = "step"
+
 DEFAULT_NUMBER_VALUE = "0"
+DEFAULT_MODE = NumberMode.AUTO
+DEFAULT_STEP = 1.0
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_NUMBER_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Required(CONF_MIN): vol.Coerce(float),
     vol.Required(CONF_MAX): vol.Coerce(float),
     vol.Optional(CONF_UNIT_OF_MEASUREMENT, default=""): cv.string,
+    vol.Optional(CONF_STEP, default=DEFAULT_STEP): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
+    vol.Optional(CONF_MODE, default=DEFAULT_MODE): vol.Coerce(NumberMode),
+    vol.Optional(CONF_RAMP_RATE): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
 }))
 NUMBER_SCHEMA = vol.Schema(virtual_schema(DEFAULT_NUMBER_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Required(CONF_MIN): vol.Coerce(float),
     vol.Required(CONF_MAX): vol.Coerce(float),
     vol.Optional(CONF_UNIT_OF_MEASUREMENT, default=""): cv.string,
+    vol.Optional(CONF_STEP, default=DEFAULT_STEP): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
+    vol.Optional(CONF_MODE, default=DEFAULT_MODE): vol.Coerce(NumberMode),
+    vol.Optional(CONF_RAMP_RATE): vol.All(vol.Coerce(float), vol.Range(min=0, min_included=False)),
 }))
 
-UNITS_OF_MEASUREMENT = {
-    NumberDeviceClass.APPARENT_POWER: UnitOfApparentPower.VOLT_AMPERE,  # apparent power (VA)
-    NumberDeviceClass.BATTERY: PERCENTAGE,  # % of battery that is left
-    NumberDeviceClass.CO: CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO concentration
-    NumberDeviceClass.CO2: CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO2 concentration
-    NumberDeviceClass.HUMIDITY: PERCENTAGE,  # % of humidity in the air
-    NumberDeviceClass.ILLUMINANCE: LIGHT_LUX,  # current light level (lx/lm)
-    NumberDeviceClass.NITROGEN_DIOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen dioxide
-    NumberDeviceClass.NITROGEN_MONOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen monoxide
-    NumberDeviceClass.NITROUS_OXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen oxide
-    NumberDeviceClass.OZONE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of ozone
-    NumberDeviceClass.PM1: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM1
-    NumberDeviceClass.PM10: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM10
-    NumberDeviceClass.PM25: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM2.5
-    NumberDeviceClass.SIGNAL_STRENGTH: SIGNAL_STRENGTH_DECIBELS,  # signal strength (dB/dBm)
-    NumberDeviceClass.SULPHUR_DIOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of sulphur dioxide
-    NumberDeviceClass.TEMPERATURE: "C",  # temperature (C/F)
-    NumberDeviceClass.PRESSURE: UnitOfPressure.HPA,  # pressure (hPa/mbar)
-    NumberDeviceClass.POWER: UnitOfPower.KILO_WATT,  # power (W/kW)
-    NumberDeviceClass.CURRENT: UnitOfElectricCurrent.AMPERE,  # current (A)
-    NumberDeviceClass.ENERGY: UnitOfEnergy.KILO_WATT_HOUR,  # energy (Wh/kWh/MWh)
-    NumberDeviceClass.FREQUENCY: UnitOfFrequency.GIGAHERTZ,  # energy (Hz/kHz/MHz/GHz)
-    NumberDeviceClass.POWER_FACTOR: PERCENTAGE,  # power factor (no unit, min: -1.0, max: 1.0)
-    NumberDeviceClass.REACTIVE_POWER: UnitOfReactivePower.VOLT_AMPERE_REACTIVE,  # reactive power (var)
-    NumberDeviceClass.VOLATILE_ORGANIC_COMPOUNDS: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of vocs
-    NumberDeviceClass.VOLTAGE: UnitOfElectricPotential.VOLT,  # voltage (V)
-    NumberDeviceClass.GAS: UnitOfVolume.CUBIC_METERS,  # gas (m³)
-}
-
 
 async def async_setup_platform(
         hass: HomeAssistant,
@@ -120,8 +92,17 @@ async def async_setup_entry(
     async_add_entities(entities)
 
 
-class VirtualNumber(VirtualEntity, Entity):
-    """An implementation of a Virtual Number."""
+class VirtualNumber(VirtualEntity, NumberEntity):
+    """An implementation of a Virtual Number.
+
+    Values are set on the event loop and the entity publishes its own state
+    so there is no need to poll it. If a `ramp_rate` is given the number moves
+    to a new value a `step` at a time at `ramp_rate` units per second.
+    """
+
+    _attr_should_poll = False
+
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_native_value",)
 
     def __init__(self, config, old_style: bool):
         """Initialize an Virtual Number."""
@@ -129,53 +110,115 @@ class VirtualNumber(VirtualEntity, Entity):
 
         self._attr_device_class = config.get(CONF_CLASS)
 
-        self.min_value = config.get(CONF_MIN)
-        self.max_value = config.get(CONF_MAX)
+        self._attr_native_min_value = config.get(CONF_MIN)
+        self._attr_native_max_value = config.get(CONF_MAX)
+        self._attr_native_step = config.get(CONF_STEP, DEFAULT_STEP)
+        self._attr_mode = config.get(CONF_MODE, DEFAULT_MODE)
+        self._ramp_rate = config.get(CONF_RAMP_RATE, None)
+        self._ramp_target = None
+        self._ramp_start_value = None
+        self._ramp_start_time = None
+        self._ramp_handle = None
 
         # Set unit of measurement
-        self._attr_unit_of_measurement = config.get(CONF_UNIT_OF_MEASUREMENT)
-        if not self._attr_unit_of_measurement and self._attr_device_class in UNITS_OF_MEASUREMENT.keys():
-            self._attr_unit_of_measurement = UNITS_OF_MEASUREMENT[self._attr_device_class]
+        self._attr_native_unit_of_measurement = config.get(CONF_UNIT_OF_MEASUREMENT)
+        if not self._attr_native_unit_of_measurement:
+            self._attr_native_unit_of_measurement = default_unit_of_measurement(self._attr_device_class)
+        if not self._attr_native_unit_of_measurement:
+            self._attr_native_unit_of_measurement = None
 
-        _LOGGER.info(f"VirtualSensor: {self.name} created")
+        _LOGGER.info(f"VirtualNumber: {self.name} created")
 
-    def convert_to_native_value(self, value: float) -> float:
-        return value
-
-    @property
-    def native_min_value(self):
-        return self.min_value
-
-    @property
-    def native_max_value(self):
-        return self.max_value
+    def _parse_value(self, value, default=None) -> float | None:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return default
 
     def _create_state(self, config):
         super()._create_state(config)
 
-        self._attr_state = config.get(CONF_INITIAL_VALUE)
+        self._attr_native_value = self._parse_value(config.get(CONF_INITIAL_VALUE))
 
     def _restore_state(self, state, config):
         super()._restore_state(state, config)
 
-        self._attr_state = state.state
+        self._attr_native_value = self._parse_value(
+            state.state, self._parse_value(config.get(CONF_INITIAL_VALUE))
+        )
 
     def _update_attributes(self):
         super()._update_attributes()
         self._attr_extra_state_attributes.update({
             name: value for name, value in (
                 (ATTR_DEVICE_CLASS, self._attr_device_class),
-                (ATTR_UNIT_OF_MEASUREMENT, self._attr_unit_of_measurement),
-                (ATTR_MIN, self.min_value),
-                (ATTR_MAX, self.max_value)
             ) if value is not None
         })
 
+    def _apply_snapshot(self, snapshot) -> None:
+        self._cancel_ramp()
+        super()._apply_snapshot(snapshot)
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Stop any ramp in progress."""
+        self._cancel_ramp()
+        await super().async_will_remove_from_hass()
+
+    @traced_operation
     async def async_set_native_value(self, value: float) -> None:
         """Set new value."""
-        await self.hass.async_add_executor_job(self.set, value)
+        if self._ramp_rate is None or self._attr_native_value is None:
+            self.set(value)
+        else:
+            self._start_ramp(value)
 
+    @traced_operation
+    @callback
     def set(self, value) -> None:
         _LOGGER.debug(f"set {self.name} to {value}")
-        self._attr_state = value
-        #self.async_schedule_update_ha_state()
\ No newline at end of file
+        self._cancel_ramp()
+        self._attr_native_value = value
+        self.async_write_ha_state()
+
+    def _cancel_ramp(self) -> None:
+        if self._ramp_handle is not None:
+            self._ramp_handle()
+            self._ramp_handle = None
+        self._ramp_target = None
+
+    def _start_ramp(self, value: float) -> None:
+        _LOGGER.debug(f"ramping {self.name} to {value}")
+        self._cancel_ramp()
+        self._ramp_target = value
+        self._ramp_start_value = self._attr_native_value
+        self._ramp_start_time = self.hass.loop.time()
+        self._ramp_step()
+
+    @callback
+    def _ramp_step(self, _now=None) -> None:
+        """Move to where the ramp should be by now and schedule the next step.
+
+        The value comes from how long the ramp has run, not how many ticks
+        we've had, so a coarse timer can't slow it down.
+        """
+        self._ramp_handle = None
+        if self._ramp_target is None:
+            return
+
+        step = self._attr_native_step
+        distance = self._ramp_target - self._ramp_start_value
+        elapsed = self.hass.loop.time() - self._ramp_start_time
+        steps = math.floor(elapsed * self._ramp_rate / step)
+        if steps * step >= abs(distance):
+            self._attr_native_value = self._ramp_target
+            self._ramp_target = None
+            self.async_write_ha_state()
+            return
+
+        value = self._ramp_start_value + math.copysign(steps * step, distance)
+        if value != self._attr_native_value:
+            self._attr_native_value = value
+            self.async_write_ha_state()
+        self._ramp_handle = async_get_timer_wheel(self.hass).async_call_later(
+            (steps + 1) * step / self._ramp_rate - elapsed, self._ramp_step
+        )
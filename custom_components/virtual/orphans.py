@@ -0,0 +1,94 @@
+"""
+Provides clean up of orphaned virtual entities.
+
+Entities dropped from a group's file are left in the meta data, the entity
+and device registries and the restore state data. Once the group's entities
+are up they are all removed in one go, as a background job, so a big change
+to the file doesn't slow down setting the group up.
+"""
+
+import logging
+import time
+
+import homeassistant.helpers.device_registry as dr
+import homeassistant.helpers.entity_registry as er
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.restore_state import async_get as async_get_restore_state
+
+from .const import *
+from .metrics import async_get_metrics
+from .monitor import record_job
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_clean_orphans(hass: HomeAssistant, entry: ConfigEntry, orphans: dict, devices: list) -> dict[str, int]:
+    """Remove the orphaned entities, and any devices nothing uses now, returns
+    how many of each were removed.
+
+    Run as a background task of the entry. Nothing here yields so the
+    registries are changed in one go and saved once.
+    """
+    group_name = entry.data[ATTR_GROUP_NAME]
+    started = time.monotonic()
+
+    entity_registry = er.async_get(hass)
+    device_registry = dr.async_get(hass)
+    last_states = async_get_restore_state(hass).last_states
+
+    # Entities first, their ids may have been changed in the registry.
+    entity_ids = set()
+    orphaned_devices = set()
+    removed_entities = 0
+    for unique_id, orphan in orphans.items():
+        entity_id = orphan[ATTR_ENTITY_ID]
+        entity_ids.add(entity_id)
+        orphaned_devices.add(orphan[ATTR_DEVICE_ID])
+        registered = entity_registry.async_get_entity_id(entity_id.split(".", 1)[0], COMPONENT_DOMAIN, unique_id)
+        if registered is not None:
+            _LOGGER.debug(f"removing {registered}")
+            entity_ids.add(registered)
+            entity_registry.async_remove(registered)
+            removed_entities += 1
+
+    # Only devices the group no longer has.
+    removed_devices = 0
+    orphaned_devices -= {device[ATTR_DEVICE_ID] for device in devices}
+    for device_id in orphaned_devices:
+        device = device_registry.async_get_device(identifiers={(COMPONENT_DOMAIN, device_id)})
+        if device is None or entry.entry_id not in device.config_entries:
+            _LOGGER.info(f"have orphaned device in meta {device_id}")
+            continue
+        if device.config_entries == {entry.entry_id}:
+            _LOGGER.debug(f"removing device {device.id}")
+            device_registry.async_remove_device(device.id)
+            removed_devices += 1
+        else:
+            # Someone else uses it, just stop using it ourselves.
+            _LOGGER.debug(f"leaving device {device.id}")
+            device_registry.async_update_device(device.id, remove_config_entry_id=entry.entry_id)
+
+    # And what would have been restored.
+    removed_states = 0
+    for entity_id in entity_ids:
+        if last_states.pop(entity_id, None) is not None:
+            removed_states += 1
+
+    reclaimed = {
+        "entities": removed_entities,
+        "devices": removed_devices,
+        "restore_states": removed_states,
+    }
+    seconds = time.monotonic() - started
+    metrics = async_get_metrics(hass).group(group_name)
+    metrics.orphans = reclaimed
+    metrics.setup_phases["orphans"] = seconds
+    record_job(hass, f"setup {group_name} orphans", seconds)
+    _LOGGER.info(
+        f"{group_name}: removed {removed_entities} orphaned entities, {removed_devices} devices "
+        f"and {removed_states} saved states"
+    )
+    return reclaimed
+
@@ -0,0 +1,142 @@
+"""
+Provides on demand profiling of the event loop.
+
+`virtual.profile_start` turns on `cProfile` for the event loop thread and
+`virtual.profile_stop`, or the duration running out, turns it off again.
+The raw profile is saved to the config directory, where `snakeviz` or
+`pstats` can read it, along with a summary of how much time was spent in
+each virtual module and in its busiest functions.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import *
+from .scheduler import async_get_timer_wheel
+
+
+_LOGGER = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUMMARY_TOP_FUNCTIONS = 25
+
+
+def _summarise(profile: cProfile.Profile, wall_time: float) -> str:
+    """Total up the time spent in our own modules."""
+    import pstats
+
+    stats = pstats.Stats(profile)
+    total_time = stats.total_tt
+
+    modules = {}
+    functions = []
+    for (file_name, line, function), (_cc, calls, own_time, cumulative_time, _callers) in stats.stats.items():
+        if not os.path.abspath(file_name).startswith(PACKAGE_DIR):
+            continue
+        module = os.path.relpath(file_name, PACKAGE_DIR)
+        module_calls, module_time = modules.get(module, (0, 0.0))
+        modules[module] = (module_calls + calls, module_time + own_time)
+        functions.append((cumulative_time, own_time, calls, f"{module}:{line}({function})"))
+
+    virtual_time = sum(module_time for _calls, module_time in modules.values())
+    lines = [
+        f"wall time       {wall_time:10.3f}s",
+        f"loop cpu time   {total_time:10.3f}s",
+        f"virtual time    {virtual_time:10.3f}s ({virtual_time / total_time * 100 if total_time else 0:.1f}%)",
+        "",
+        f"{'module':<24} {'calls':>10} {'own time':>10}",
+    ]
+    for module, (calls, own_time) in sorted(modules.items(), key=lambda item: item[1][1], reverse=True):
+        lines.append(f"{module:<24} {calls:10d} {own_time:9.3f}s")
+    lines += [
+        "",
+        f"{'function':<56} {'calls':>10} {'own time':>10} {'cumulative':>10}",
+    ]
+    for cumulative_time, own_time, calls, name in sorted(functions, reverse=True)[:SUMMARY_TOP_FUNCTIONS]:
+        lines.append(f"{name:<56} {calls:10d} {own_time:9.3f}s {cumulative_time:9.3f}s")
+    return "\n".join(lines) + "\n"
+
+
+def _write_profile(profile: cProfile.Profile, base_name: str, wall_time: float) -> str:
+    """Save the profile and its summary, run this in the executor."""
+    profile.dump_stats(f"{base_name}.prof")
+    summary = _summarise(profile, wall_time)
+    with open(f"{base_name}.txt", "w") as summary_file:
+        summary_file.write(summary)
+    return summary
+
+
+class VirtualProfiler(object):
+    """Profile the event loop for a while."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._profile = None
+        self._started = None
+        self._stop_handle = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    @callback
+    def async_start(self, duration: float) -> None:
+        if self.running:
+            raise HomeAssistantError("virtual profiler is already running")
+
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            raise HomeAssistantError(f"can't start virtual profiler: {e}")
+
+        _LOGGER.info(f"profiling for {duration}s")
+        self._profile = profile
+        self._started = time.monotonic()
+        self._stop_handle = async_get_timer_wheel(self._hass).async_call_later(duration, self._async_timed_out)
+
+    async def _async_timed_out(self, _now) -> None:
+        self._stop_handle = None
+        await self.async_stop()
+
+    async def async_stop(self) -> str | None:
+        """Stop profiling and save the results, returns the summary file."""
+        if not self.running:
+            return None
+        self._profile.disable()
+        profile, self._profile = self._profile, None
+        if self._stop_handle is not None:
+            self._stop_handle()
+            self._stop_handle = None
+
+        base_name = self._hass.config.path(f"virtual-profile-{time.strftime('%Y%m%d-%H%M%S')}")
+        summary = await self._hass.async_add_executor_job(
+            _write_profile, profile, base_name, time.monotonic() - self._started
+        )
+        _LOGGER.info(f"profile saved to {base_name}.prof\n{summary}")
+        return f"{base_name}.txt"
+
+
+@callback
+def async_get_profiler(hass: HomeAssistant) -> VirtualProfiler:
+    """Return the shared profiler, creating it if needed."""
+    profiler = hass.data.get(COMPONENT_PROFILER)
+    if profiler is None:
+        profiler = hass.data[COMPONENT_PROFILER] = VirtualProfiler(hass)
+    return profiler
+
+
+async def async_stop_profiler(hass: HomeAssistant) -> None:
+    """Stop any profile in progress, it still gets saved."""
+    profiler = hass.data.pop(COMPONENT_PROFILER, None)
+    if profiler is not None:
+        await profiler.async_stop()
@@ -0,0 +1,162 @@
+"""
+Provides publish policies for virtual entities.
+
+A policy sits between an entity changing and the entity writing its state.
+It can drop repeated values, drop numeric changes inside a deadband and
+limit how often the entity writes. When writes are limited the latest value
+is held back and written when the interval ends, so the final value is never
+lost.
+"""
+
+import logging
+
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.core import callback
+
+from .const import *
+from .monitor import loop_backoff
+from .scheduler import async_get_timer_wheel
+
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_COALESCED_UPDATES = "coalesced_updates"
+ATTR_PUBLISHED_UPDATES = "published_updates"
+ATTR_SUPPRESSED_UPDATES = "suppressed_updates"
+
+CONF_PUBLISH_DEADBAND = "publish_deadband"
+CONF_PUBLISH_RELATIVE_DEADBAND = "publish_relative_deadband"
+CONF_PUBLISH_SUPPRESS_IDENTICAL = "publish_suppress_identical"
+CONF_PUBLISH_MIN_INTERVAL = "publish_min_interval"
+
+PUBLISH_POLICY_SCHEMA = {
+    vol.Optional(CONF_PUBLISH_DEADBAND): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_PUBLISH_RELATIVE_DEADBAND): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    vol.Optional(CONF_PUBLISH_SUPPRESS_IDENTICAL): cv.boolean,
+    vol.Optional(CONF_PUBLISH_MIN_INTERVAL): vol.All(cv.time_period, cv.positive_timedelta),
+}
+
+_UNSET = object()
+
+
+def _as_float(value) -> float | None:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class VirtualPublishPolicy(object):
+    """Decide when an entity really needs to write its state."""
+
+    def __init__(self, entity, deadband: float | None, relative_deadband: float | None,
+                 suppress_identical: bool, min_interval: float | None):
+        self._entity = entity
+        self._deadband = deadband
+        self._relative_deadband = relative_deadband
+        self._suppress_identical = suppress_identical
+        self._min_interval = min_interval
+
+        self._last_value = _UNSET
+        self._last_time = None
+        self._pending = False
+        self._pending_value = None
+        self._flush_handle = None
+
+        self.published = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def from_config(entity, config):
+        """Build a policy from entity config, `None` if nothing is set."""
+        min_interval = config.get(CONF_PUBLISH_MIN_INTERVAL, None)
+        policy = (
+            config.get(CONF_PUBLISH_DEADBAND, None),
+            config.get(CONF_PUBLISH_RELATIVE_DEADBAND, None),
+            config.get(CONF_PUBLISH_SUPPRESS_IDENTICAL, False),
+            min_interval.total_seconds() if min_interval is not None else None,
+        )
+        if policy == (None, None, False, None):
+            return None
+        return VirtualPublishPolicy(entity, *policy)
+
+    def attributes(self) -> dict:
+        return {
+            ATTR_PUBLISHED_UPDATES: self.published,
+            ATTR_SUPPRESSED_UPDATES: self.suppressed,
+            ATTR_COALESCED_UPDATES: self.coalesced,
+        }
+
+    def _inside_deadband(self, value) -> bool:
+        if self._last_value is _UNSET:
+            return False
+        if self._suppress_identical and value == self._last_value:
+            return True
+
+        new_value = _as_float(value)
+        old_value = _as_float(self._last_value)
+        if new_value is None or old_value is None:
+            return False
+        change = abs(new_value - old_value)
+        if self._deadband is not None and change <= self._deadband:
+            return True
+        if self._relative_deadband is not None and change <= self._relative_deadband * abs(old_value):
+            return True
+        return False
+
+    @callback
+    def async_publish(self, value, force: bool = False) -> None:
+        """Offer a new value, `force` always writes it now."""
+        if force:
+            self._write(value)
+            return
+
+        # Something is already waiting, this replaces it.
+        if self._pending:
+            self.coalesced += 1
+            self._pending_value = value
+            return
+
+        if self._inside_deadband(value):
+            self.suppressed += 1
+            return
+
+        if self._min_interval is not None and self._last_time is not None:
+            min_interval = self._min_interval * loop_backoff(self._entity.hass)
+            wait = self._last_time + min_interval - self._entity.hass.loop.time()
+            if wait > 0:
+                self._pending = True
+                self._pending_value = value
+                self._flush_handle = async_get_timer_wheel(self._entity.hass).async_call_later(
+                    wait, self._flush
+                )
+                return
+
+        self._write(value)
+
+    @callback
+    def async_cancel(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle()
+        self._flush_handle = None
+        self._pending = False
+        self._pending_value = None
+
+    @callback
+    def _flush(self, _now) -> None:
+        self._flush_handle = None
+        if self._pending:
+            self._write(self._pending_value)
+
+    def _write(self, value) -> None:
+        self.async_cancel()
+        self._last_value = value
+        self._last_time = self._entity.hass.loop.time()
+        self.published += 1
+        self._entity._attr_extra_state_attributes.update(self.attributes())
+        self._entity.async_write_ha_state()
@@ -0,0 +1,216 @@
+"""
+Provides route replay for virtual device trackers.
+
+A tracker given a route, a list of waypoints or a GPX file, follows it at a
+fixed speed. Positions are interpolated along the great circle between
+waypoints and published through `move_to_coords`.
+
+One manager drives every moving tracker. Each route is precomputed into unit
+vectors and cumulative distances so a tick only has to find the current
+segment and interpolate, and all trackers due on a tick are worked out
+together before any of them publish.
+"""
+
+import bisect
+import logging
+import math
+
+from homeassistant.const import ATTR_LATITUDE, ATTR_LONGITUDE
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+
+from .const import *
+from .monitor import loop_backoff
+from .scheduler import async_get_timer_wheel
+
+
+_LOGGER = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8
+
+GPX_POINT_TAGS = ("trkpt", "rtept", "wpt")
+
+# Closer than this, in radians, to the other side of the world and the
+# great circle between two waypoints isn't defined.
+ANTIPODAL_TOLERANCE = 1e-6
+
+
+def _to_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def _angle(v1, v2) -> float:
+    """Angle between two unit vectors, stable for short distances."""
+    cross = (
+        v1[1] * v2[2] - v1[2] * v2[1],
+        v1[2] * v2[0] - v1[0] * v2[2],
+        v1[0] * v2[1] - v1[1] * v2[0],
+    )
+    dot = v1[0] * v2[0] + v1[1] * v2[1] + v1[2] * v2[2]
+    return math.atan2(math.sqrt(cross[0] ** 2 + cross[1] ** 2 + cross[2] ** 2), dot)
+
+
+def parse_gpx(file_name: str) -> list[tuple[float, float]]:
+    """Read the points from a GPX file, run this in the executor.
+
+    We use track points if there are any, then route points, then waypoints.
+    """
+    import xml.etree.ElementTree as ElementTree
+
+    points = {tag: [] for tag in GPX_POINT_TAGS}
+    try:
+        for _event, element in ElementTree.iterparse(file_name):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag in points:
+                points[tag].append((float(element.get("lat")), float(element.get("lon"))))
+            element.clear()
+    except (OSError, ElementTree.ParseError, TypeError, ValueError) as e:
+        raise HomeAssistantError(f"can't read route from {file_name}: {e}")
+    for tag in GPX_POINT_TAGS:
+        if points[tag]:
+            return points[tag]
+    raise HomeAssistantError(f"no points found in {file_name}")
+
+
+class _Route(object):
+
+    __slots__ = ("vectors", "angles", "distances", "speed", "interval", "accuracy", "start", "next_publish")
+
+    def __init__(self, waypoints, speed, interval, accuracy, start):
+        self.vectors = [_to_vector(latitude, longitude) for latitude, longitude in waypoints]
+        self.angles = [_angle(v1, v2) for v1, v2 in zip(self.vectors, self.vectors[1:])]
+
+        # Distance from the start to each waypoint.
+        self.distances = [0.0]
+        for angle in self.angles:
+            self.distances.append(self.distances[-1] + angle * EARTH_RADIUS)
+
+        self.speed = speed
+        self.interval = interval
+        self.accuracy = accuracy
+        self.start = start
+        self.next_publish = start
+
+    @property
+    def length(self) -> float:
+        return self.distances[-1]
+
+    def position(self, distance: float) -> tuple[float, float]:
+        """Where we are after travelling `distance` metres."""
+        segment = min(bisect.bisect_right(self.distances, distance), len(self.vectors) - 1)
+        v1 = self.vectors[segment - 1] if segment > 0 else self.vectors[0]
+        v2 = self.vectors[segment]
+        angle = self.angles[segment - 1] if segment > 0 else 0.0
+
+        if angle > 0:
+            fraction = (distance - self.distances[segment - 1]) / (angle * EARTH_RADIUS)
+            fraction = max(0.0, min(1.0, fraction))
+            a = math.sin((1 - fraction) * angle) / math.sin(angle)
+            b = math.sin(fraction * angle) / math.sin(angle)
+            x, y, z = (a * v1[0] + b * v2[0], a * v1[1] + b * v2[1], a * v1[2] + b * v2[2])
+        else:
+            x, y, z = v2
+
+        return math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x))
+
+
+class VirtualRouteManager(object):
+    """Move every tracker that is following a route."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._routes: dict = {}
+        self._handle = None
+
+    @property
+    def active_routes(self) -> int:
+        return len(self._routes)
+
+    @callback
+    def async_follow(self, tracker, waypoints: list[tuple[float, float]], speed: float,
+                     interval: float, accuracy: int = 0) -> None:
+        """Start `tracker` along `waypoints` at `speed` metres per second."""
+        if not waypoints:
+            raise HomeAssistantError("a route needs at least one waypoint")
+        route = _Route(waypoints, speed, interval, accuracy, self._hass.loop.time())
+        for i, angle in enumerate(route.angles):
+            if math.pi - angle < ANTIPODAL_TOLERANCE:
+                raise HomeAssistantError(
+                    f"waypoints {waypoints[i]} and {waypoints[i + 1]} are on opposite sides of the world, "
+                    f"add a waypoint between them"
+                )
+        _LOGGER.debug(f"{tracker.entity_id} following {len(waypoints)} waypoints at {speed}m/s")
+        self._routes[tracker] = route
+        self._schedule()
+
+    @callback
+    def async_stop(self, tracker) -> None:
+        if self._routes.pop(tracker, None) is not None:
+            _LOGGER.debug(f"{tracker.entity_id} stopped following route")
+
+    @callback
+    def async_stop_all(self) -> None:
+        if self._handle is not None:
+            self._handle()
+        self._handle = None
+        self._routes = {}
+
+    def _schedule(self) -> None:
+        if self._handle is not None:
+            self._handle()
+            self._handle = None
+        if not self._routes:
+            return
+        next_publish = min(route.next_publish for route in self._routes.values())
+        self._handle = async_get_timer_wheel(self._hass).async_call_later(
+            max(0.0, next_publish - self._hass.loop.time()), self._tick
+        )
+
+    @callback
+    def _tick(self, _now) -> None:
+        self._handle = None
+        now = self._hass.loop.time()
+
+        # Work out where everybody is...
+        moves = []
+        finished = []
+        backoff = loop_backoff(self._hass)
+        for tracker, route in self._routes.items():
+            if route.next_publish > now:
+                continue
+            distance = (now - route.start) * route.speed
+            if distance >= route.length:
+                distance = route.length
+                finished.append(tracker)
+            route.next_publish = now + route.interval * backoff
+            moves.append((tracker, route.position(distance), route.accuracy))
+
+        # ... then move them.
+        for tracker in finished:
+            self._routes.pop(tracker)
+        for tracker, (latitude, longitude), accuracy in moves:
+            tracker.move_to_coords({
+                ATTR_LATITUDE: latitude,
+                ATTR_LONGITUDE: longitude,
+            }, accuracy)
+
+        self._schedule()
+
+
+@callback
+def async_get_route_manager(hass: HomeAssistant) -> VirtualRouteManager:
+    """Return the shared route manager, creating it if needed."""
+    manager = hass.data.get(COMPONENT_ROUTES)
+    if manager is None:
+        manager = hass.data[COMPONENT_ROUTES] = VirtualRouteManager(hass)
+    return manager
+
+
+@callback
+def async_stop_route_manager(hass: HomeAssistant) -> None:
+    """Stop every route and forget the manager."""
+    manager = hass.data.pop(COMPONENT_ROUTES, None)
+    if manager is not None:
+        manager.async_stop_all()
@@ -0,0 +1,149 @@
+"""
+Provides a shared timer wheel for the virtual component.
+
+Rather than every moving cover or changing lock owning its own loop timer we
+keep one integration wide wheel. Timers are bucketed into slots of
+`timer_resolution` seconds and everything due in a slot is run from a single
+loop callback.
+"""
+
+import heapq
+import logging
+import math
+from collections.abc import Callable
+from datetime import timedelta
+from typing import Any
+
+from homeassistant.core import CALLBACK_TYPE, HassJob, HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class VirtualTimerWheel(object):
+    """Run timed callbacks for all virtual entities from one loop timer.
+
+    Callbacks follow the `async_call_later` convention; they are passed the
+    current time and the value returned by `async_call_later` cancels them.
+    """
+
+    def __init__(self, hass: HomeAssistant, resolution: float = DEFAULT_TIMER_RESOLUTION):
+        self._hass = hass
+        self._resolution = resolution
+
+        self._slots: dict[int, dict[int, HassJob]] = {}
+        self._slot_heap: list[int] = []
+        self._next_id = 0
+
+        self._handle = None
+        self._armed_slot = None
+
+    @property
+    def resolution(self) -> float:
+        return self._resolution
+
+    @property
+    def active_timers(self) -> int:
+        return sum(len(timers) for timers in self._slots.values())
+
+    @callback
+    def async_call_later(self, delay: float | timedelta, action: Callable[..., Any]) -> CALLBACK_TYPE:
+        """Run `action` after `delay`, rounded up to the wheel resolution."""
+        if isinstance(delay, timedelta):
+            delay = delay.total_seconds()
+
+        # Round up so we never fire early.
+        slot = math.ceil((self._hass.loop.time() + delay) / self._resolution)
+        timer_id = self._next_id
+        self._next_id += 1
+
+        timers = self._slots.get(slot)
+        if timers is None:
+            timers = self._slots[slot] = {}
+            heapq.heappush(self._slot_heap, slot)
+        timers[timer_id] = HassJob(action, "virtual timer")
+        self._arm()
+
+        @callback
+        def _cancel() -> None:
+            slot_timers = self._slots.get(slot)
+            if slot_timers is not None:
+                slot_timers.pop(timer_id, None)
+
+        return _cancel
+
+    @callback
+    def async_stop(self) -> None:
+        """Cancel everything outstanding, used when the last group unloads."""
+        _LOGGER.debug(f"stopping timer wheel with {self.active_timers} timers")
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = None
+        self._armed_slot = None
+        self._slots = {}
+        self._slot_heap = []
+
+    def _arm(self) -> None:
+        # Throw away cancelled slots at the front of the heap.
+        while self._slot_heap and not self._slots.get(self._slot_heap[0]):
+            self._slots.pop(heapq.heappop(self._slot_heap), None)
+
+        if not self._slot_heap:
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = None
+            self._armed_slot = None
+            return
+
+        slot = self._slot_heap[0]
+        if slot == self._armed_slot:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+        self._armed_slot = slot
+        self._handle = self._hass.loop.call_at(slot * self._resolution, self._run)
+
+    @callback
+    def _run(self) -> None:
+        current = max(self._armed_slot, math.floor(self._hass.loop.time() / self._resolution))
+        self._handle = None
+        self._armed_slot = None
+
+        due = []
+        while self._slot_heap and self._slot_heap[0] <= current:
+            due.extend(self._slots.pop(heapq.heappop(self._slot_heap), {}).values())
+
+        now = dt_util.utcnow()
+        monitor = self._hass.data.get(COMPONENT_MONITOR)
+        for job in due:
+            started = self._hass.loop.time()
+            try:
+                self._hass.async_run_hass_job(job, now)
+            except Exception:
+                _LOGGER.exception("error running virtual timer")
+            if monitor is not None:
+                monitor.record(getattr(job.target, "__qualname__", "timer"), self._hass.loop.time() - started)
+
+        self._arm()
+
+
+@callback
+def async_get_timer_wheel(hass: HomeAssistant) -> VirtualTimerWheel:
+    """Return the shared timer wheel, creating it if needed."""
+    wheel = hass.data.get(COMPONENT_TIMER)
+    if wheel is None:
+        resolution = hass.data.get(COMPONENT_CONFIG, {}).get(CONF_TIMER_RESOLUTION, DEFAULT_TIMER_RESOLUTION)
+        _LOGGER.debug(f"creating timer wheel, resolution={resolution}")
+        wheel = hass.data[COMPONENT_TIMER] = VirtualTimerWheel(hass, resolution)
+    return wheel
+
+
+@callback
+def async_stop_timer_wheel(hass: HomeAssistant) -> None:
+    """Stop and forget the shared timer wheel."""
+    wheel = hass.data.pop(COMPONENT_TIMER, None)
+    if wheel is not None:
+        wheel.async_stop()
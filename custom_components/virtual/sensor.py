@@ -10,53 +10,75 @@ from collections.abc import Callable
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components.sensor import (
     DOMAIN as PLATFORM_DOMAIN,
-    SensorDeviceClass
+    RestoreSensor,
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     ATTR_DEVICE_CLASS,
     ATTR_UNIT_OF_MEASUREMENT,
-    CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
-    CONCENTRATION_PARTS_PER_MILLION,
     CONF_UNIT_OF_MEASUREMENT,
-    LIGHT_LUX,
-    PERCENTAGE,
-    SIGNAL_STRENGTH_DECIBELS,
-    UnitOfApparentPower,
-    UnitOfElectricCurrent,
-    UnitOfElectricPotential,
-    UnitOfEnergy,
-    UnitOfFrequency,
-    UnitOfPower,
-    UnitOfPressure,
-    UnitOfReactivePower,
-    UnitOfVolume,
+    UnitOfTemperature,
+    UnitOfTime,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.config_validation import PLATFORM_SCHEMA
-from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.entity import Entity, EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
 from . import get_entity_from_domain, get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .metrics import (
+    METRIC_COALESCED_UPDATES,
+    METRIC_ENTITIES,
+    METRIC_META_WRITES,
+    METRIC_SERVICE_CALLS,
+    METRIC_STATE_WRITES,
+    METRIC_SUPPRESSED_UPDATES,
+    async_get_metrics,
+)
+from .publish import PUBLISH_POLICY_SCHEMA
+from .scheduler import async_get_timer_wheel
+from .services import async_get_services
+from .stats import WindowedStatistics
+from .tracing import traced_operation
+from .units import default_unit_of_measurement
 
 
 _LOGGER = logging.getLogger(__name__)
 
 DEPENDENCIES = [COMPONENT_DOMAIN]
 
+CONF_STATISTICS_WINDOW = "statistics_window"
+CONF_STATISTICS_MAX_AGE = "statistics_max_age"
+CONF_STATE_CLASS = "state_class"
+CONF_PRECISION = "precision"
+
 DEFAULT_SENSOR_VALUE = "0"
+DEFAULT_STATISTICS_WINDOW = 1000
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_SENSOR_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_UNIT_OF_MEASUREMENT, default=""): cv.string,
+    vol.Optional(CONF_STATISTICS_WINDOW): cv.positive_int,
+    vol.Optional(CONF_STATISTICS_MAX_AGE): vol.All(cv.time_period, cv.positive_timedelta),
+    vol.Optional(CONF_STATE_CLASS): vol.Coerce(SensorStateClass),
+    vol.Optional(CONF_PRECISION): cv.positive_int,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 SENSOR_SCHEMA = vol.Schema(virtual_schema(DEFAULT_SENSOR_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_UNIT_OF_MEASUREMENT, default=""): cv.string,
+    vol.Optional(CONF_STATISTICS_WINDOW): cv.positive_int,
+    vol.Optional(CONF_STATISTICS_MAX_AGE): vol.All(cv.time_period, cv.positive_timedelta),
+    vol.Optional(CONF_STATE_CLASS): vol.Coerce(SensorStateClass),
+    vol.Optional(CONF_PRECISION): cv.positive_int,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 
 SERVICE_SET = "set"
@@ -65,50 +87,27 @@ SERVICE_SCHEMA = vol.Schema({
     vol.Required(ATTR_VALUE): cv.string,
 })
 
-UNITS_OF_MEASUREMENT = {
-    SensorDeviceClass.APPARENT_POWER: UnitOfApparentPower.VOLT_AMPERE,  # apparent power (VA)
-    SensorDeviceClass.BATTERY: PERCENTAGE,  # % of battery that is left
-    SensorDeviceClass.CO: CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO concentration
-    SensorDeviceClass.CO2: CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO2 concentration
-    SensorDeviceClass.HUMIDITY: PERCENTAGE,  # % of humidity in the air
-    SensorDeviceClass.ILLUMINANCE: LIGHT_LUX,  # current light level (lx/lm)
-    SensorDeviceClass.NITROGEN_DIOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen dioxide
-    SensorDeviceClass.NITROGEN_MONOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen monoxide
-    SensorDeviceClass.NITROUS_OXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen oxide
-    SensorDeviceClass.OZONE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of ozone
-    SensorDeviceClass.PM1: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM1
-    SensorDeviceClass.PM10: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM10
-    SensorDeviceClass.PM25: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM2.5
-    SensorDeviceClass.SIGNAL_STRENGTH: SIGNAL_STRENGTH_DECIBELS,  # signal strength (dB/dBm)
-    SensorDeviceClass.SULPHUR_DIOXIDE: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of sulphur dioxide
-    SensorDeviceClass.TEMPERATURE: "C",  # temperature (C/F)
-    SensorDeviceClass.PRESSURE: UnitOfPressure.HPA,  # pressure (hPa/mbar)
-    SensorDeviceClass.POWER: UnitOfPower.KILO_WATT,  # power (W/kW)
-    SensorDeviceClass.CURRENT: UnitOfElectricCurrent.AMPERE,  # current (A)
-    SensorDeviceClass.ENERGY: UnitOfEnergy.KILO_WATT_HOUR,  # energy (Wh/kWh/MWh)
-    SensorDeviceClass.FREQUENCY: UnitOfFrequency.GIGAHERTZ,  # energy (Hz/kHz/MHz/GHz)
-    SensorDeviceClass.POWER_FACTOR: PERCENTAGE,  # power factor (no unit, min: -1.0, max: 1.0)
-    SensorDeviceClass.REACTIVE_POWER: UnitOfReactivePower.VOLT_AMPERE_REACTIVE,  # reactive power (var)
-    SensorDeviceClass.VOLATILE_ORGANIC_COMPOUNDS: CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of vocs
-    SensorDeviceClass.VOLTAGE: UnitOfElectricPotential.VOLT,  # voltage (V)
-    SensorDeviceClass.GAS: UnitOfVolume.CUBIC_METERS,  # gas (m³)
+# Counters shown by the metrics sensors.
+METRICS_SENSORS = {
+    METRIC_ENTITIES: ("Entities", SensorStateClass.MEASUREMENT),
+    METRIC_STATE_WRITES: ("State Writes", SensorStateClass.TOTAL_INCREASING),
+    METRIC_SERVICE_CALLS: ("Service Calls", SensorStateClass.TOTAL_INCREASING),
+    METRIC_COALESCED_UPDATES: ("Coalesced Updates", SensorStateClass.TOTAL_INCREASING),
+    METRIC_SUPPRESSED_UPDATES: ("Suppressed Updates", SensorStateClass.TOTAL_INCREASING),
+    METRIC_META_WRITES: ("Meta Writes", SensorStateClass.TOTAL_INCREASING),
 }
 
+# Typed sensors need real temperature units.
+TEMPERATURE_UNITS = {
+    "C": UnitOfTemperature.CELSIUS,
+    "F": UnitOfTemperature.FAHRENHEIT,
+}
 
-def setup_services(hass: HomeAssistant) -> None:
-
-    async def async_virtual_service(call):
-        """Call virtual service handler."""
-        _LOGGER.debug(f"{call.service} service called")
-        await async_virtual_set_service(hass, call)
 
-    # Build up services...
-    if not hasattr(hass.data[COMPONENT_SERVICES], PLATFORM_DOMAIN):
-        _LOGGER.debug("installing handlers")
-        hass.data[COMPONENT_SERVICES][PLATFORM_DOMAIN] = "installed"
-        hass.services.async_register(
-            COMPONENT_DOMAIN, SERVICE_SET, async_virtual_service, schema=SERVICE_SCHEMA,
-        )
+def setup_services(hass: HomeAssistant) -> None:
+    async_get_services(hass).async_register_entity_service(
+        SERVICE_SET, PLATFORM_DOMAIN, async_virtual_set_service, SERVICE_SCHEMA
+    )
 
 
 async def async_setup_platform(
@@ -120,7 +119,7 @@ async def async_setup_platform(
     if hass.data[COMPONENT_CONFIG].get(CONF_YAML_CONFIG, False):
         _LOGGER.debug("setting up old config...")
 
-        sensors = [VirtualSensor(config, True)]
+        sensors = [_make_sensor(config, True)]
         async_add_entities(sensors, True)
         setup_services(hass)
 
@@ -135,14 +134,33 @@ async def async_setup_entry(
     entities = []
     for entity in get_entity_configs(hass, entry.data[ATTR_GROUP_NAME], PLATFORM_DOMAIN):
         entity = SENSOR_SCHEMA(entity)
-        entities.append(VirtualSensor(entity, False))
+        entities.append(_make_sensor(entity, False))
+    if hass.data[COMPONENT_CONFIG].get(CONF_METRICS_SENSORS, False):
+        metrics = async_get_metrics(hass).group(entry.data[ATTR_GROUP_NAME])
+        for counter in METRICS_SENSORS:
+            entities.append(VirtualMetricsSensor(entry, metrics, counter))
+    monitor = hass.data.get(COMPONENT_MONITOR)
+    if monitor is not None:
+        entities.append(VirtualLoopLagSensor(entry, monitor))
     async_add_entities(entities)
     setup_services(hass)
 
 
+def _make_sensor(config, old_style: bool):
+    """Sensors with a state class are typed, everything else is a string."""
+    if config.get(CONF_STATE_CLASS, None) is not None:
+        return VirtualNumericSensor(config, old_style)
+    return VirtualSensor(config, old_style)
+
+
 class VirtualSensor(VirtualEntity, Entity):
     """An implementation of a Virtual Sensor."""
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_state",)
+
+    # We only change through the services and they write the state.
+    _attr_should_poll = False
+
     def __init__(self, config, old_style: bool):
         """Initialize an Virtual Sensor."""
         super().__init__(config, PLATFORM_DOMAIN, old_style)
@@ -151,20 +169,39 @@ class VirtualSensor(VirtualEntity, Entity):
 
         # Set unit of measurement
         self._attr_unit_of_measurement = config.get(CONF_UNIT_OF_MEASUREMENT)
-        if not self._attr_unit_of_measurement and self._attr_device_class in UNITS_OF_MEASUREMENT.keys():
-            self._attr_unit_of_measurement = UNITS_OF_MEASUREMENT[self._attr_device_class]
+        if not self._attr_unit_of_measurement:
+            self._attr_unit_of_measurement = default_unit_of_measurement(self._attr_device_class)
+
+        # Optional rolling statistics, by count, age or both.
+        self._statistics = None
+        self._statistics_handle = None
+        window = config.get(CONF_STATISTICS_WINDOW, None)
+        max_age = config.get(CONF_STATISTICS_MAX_AGE, None)
+        if window is not None or max_age is not None:
+            self._statistics = WindowedStatistics(
+                window or DEFAULT_STATISTICS_WINDOW,
+                max_age.total_seconds() if max_age is not None else None
+            )
 
         _LOGGER.info(f"VirtualSensor: {self.name} created")
 
     def _create_state(self, config):
         super()._create_state(config)
 
-        self._attr_state = config.get(CONF_INITIAL_VALUE)
+        self._store_value(config.get(CONF_INITIAL_VALUE))
 
     def _restore_state(self, state, config):
         super()._restore_state(state, config)
 
-        self._attr_state = state.state
+        self._restore_value(state, config)
+
+    def _restore_value(self, state, config):
+        self._store_value(state.state)
+
+    def _store_value(self, value):
+        """Save a new value and return it as it is stored."""
+        self._attr_state = value
+        return value
 
     def _update_attributes(self):
         super()._update_attributes()
@@ -174,15 +211,165 @@ class VirtualSensor(VirtualEntity, Entity):
                 (ATTR_UNIT_OF_MEASUREMENT, self._attr_unit_of_measurement),
             ) if value is not None
         })
-
+        if self._statistics is not None:
+            self._attr_extra_state_attributes.update(self._statistics.attributes(self.hass.loop.time()))
+
+    async def async_will_remove_from_hass(self) -> None:
+        self._cancel_statistics_expiry()
+        await super().async_will_remove_from_hass()
+
+    def _update_statistics(self, value) -> None:
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            _LOGGER.debug(f"{self.name}: not adding {value} to statistics")
+            return
+        now = self.hass.loop.time()
+        self._statistics.add(now, value)
+        self._attr_extra_state_attributes.update(self._statistics.attributes(now))
+        self._schedule_statistics_expiry(now)
+
+    def _cancel_statistics_expiry(self) -> None:
+        if self._statistics_handle is not None:
+            self._statistics_handle()
+            self._statistics_handle = None
+
+    def _schedule_statistics_expiry(self, now: float) -> None:
+        """Wake up when the oldest sample ages out so the attributes don't go stale."""
+        self._cancel_statistics_expiry()
+        expiry = self._statistics.next_expiry()
+        if expiry is not None:
+            self._statistics_handle = async_get_timer_wheel(self.hass).async_call_later(
+                max(0.0, expiry - now), self._expire_statistics
+            )
+
+    @callback
+    def _expire_statistics(self, _now) -> None:
+        self._statistics_handle = None
+        now = self.hass.loop.time()
+        self._attr_extra_state_attributes.update(self._statistics.attributes(now))
+        self.async_write_ha_state()
+        self._schedule_statistics_expiry(now)
+
+    @traced_operation
     def set(self, value) -> None:
         _LOGGER.debug(f"set {self.name} to {value}")
-        self._attr_state = value
-        self.async_schedule_update_ha_state()
+        value = self._store_value(value)
+        if self._statistics is not None:
+            self._update_statistics(value)
+        self._publish(value)
 
 
-async def async_virtual_set_service(hass, call):
-    for entity_id in call.data[ATTR_ENTITY_ID]:
+class VirtualNumericSensor(VirtualSensor, RestoreSensor):
+    """A Virtual Sensor holding a native number.
+
+    Values are parsed once when they are set. With a `state_class` Home
+    Assistant can build long term statistics and convert units for us, so
+    we restore from the saved sensor data, which is in our unit, and not
+    from the state, which is in whatever unit the user picked.
+    """
+
+    _last_sensor_data = None
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_native_value",)
+
+    def __init__(self, config, old_style: bool):
+        """Initialize a numeric Virtual Sensor."""
+        super().__init__(config, old_style)
+
+        # Let SensorEntity handle the unit.
+        unit = self._attr_unit_of_measurement or None
+        if self._attr_device_class == SensorDeviceClass.TEMPERATURE:
+            unit = TEMPERATURE_UNITS.get(unit, unit)
+        self._attr_native_unit_of_measurement = unit
+        self._attr_unit_of_measurement = None
+
+        self._attr_state_class = config.get(CONF_STATE_CLASS)
+        self._attr_suggested_display_precision = config.get(CONF_PRECISION, None)
+
+    async def async_added_to_hass(self) -> None:
+        self._last_sensor_data = await self.async_get_last_sensor_data()
+        await super().async_added_to_hass()
+
+    def _restore_value(self, state, config):
+        value = None
+        data = self._last_sensor_data
+        if data is not None and data.native_unit_of_measurement == self._attr_native_unit_of_measurement:
+            value = data.native_value
+        if value is None:
+            value = config.get(CONF_INITIAL_VALUE)
+        self._store_value(value)
+
+    def _store_value(self, value):
+        if isinstance(value, str):
+            try:
+                value = int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    _LOGGER.debug(f"{self.name}: {value} is not a number")
+                    value = None
+        self._attr_native_value = value
+        return value
+
+
+class VirtualMetricsSensor(SensorEntity):
+    """Show one of a group's counters.
+
+    These aren't virtual entities, they don't persist and their own writes
+    aren't counted. They are polled so a busy group doesn't make them busier.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, entry: ConfigEntry, metrics, counter: str):
+        name, state_class = METRICS_SENSORS[counter]
+        self._metrics = metrics
+        self._counter = counter
+        self._attr_name = f"Virtual {entry.data[ATTR_GROUP_NAME]} {name}"
+        self._attr_unique_id = f"{entry.entry_id}-metrics-{counter}"
+        self._attr_state_class = state_class
+
+    @property
+    def native_value(self) -> int:
+        return self._metrics.counters()[self._counter]
+
+
+class VirtualLoopLagSensor(SensorEntity):
+    """Show how late the event loop is running.
+
+    Every group gets one so it outlives any single group. The state is the
+    95th percentile lag, the other percentiles and the back off are
+    attributes.
+    """
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_suggested_display_precision = 1
+
+    def __init__(self, entry: ConfigEntry, monitor):
+        self._monitor = monitor
+        self._attr_name = f"Virtual {entry.data[ATTR_GROUP_NAME]} Loop Lag"
+        self._attr_unique_id = f"{entry.entry_id}-loop-lag"
+
+    @property
+    def native_value(self) -> float | None:
+        return self._monitor.lag()["p95"]
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        lag = self._monitor.lag()
+        return {
+            "p50": lag["p50"],
+            "p99": lag["p99"],
+            "max": lag["max"],
+            "backoff": self._monitor.backoff,
+        }
+
+
+async def async_virtual_set_service(hass, call, entity_ids):
+    for entity_id in entity_ids:
         value = call.data[ATTR_VALUE]
         _LOGGER.debug(f"setting {entity_id} to {value})")
         get_entity_from_domain(hass, PLATFORM_DOMAIN, entity_id).set(value)
@@ -0,0 +1,114 @@
+"""
+Provides the virtual services.
+
+Every virtual service is registered once, through one dispatcher. Platforms
+add handlers for their own domain as they load. A call is split by entity
+domain in a single pass over its entity ids and each domain's handler gets
+just its own entities. The services are removed when the last group unloads.
+"""
+
+import logging
+from collections.abc import Awaitable, Callable
+
+import voluptuous as vol
+
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.service import verify_domain_control
+
+from .const import *
+from .metrics import timed_service
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Entity handlers are called with the entity ids of their domain.
+EntityServiceHandler = Callable[[HomeAssistant, ServiceCall, list[str]], Awaitable[None]]
+
+
+class VirtualServices(object):
+    """Register the virtual services and route their calls."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._services: set[str] = set()
+        self._handlers: dict[str, dict[str | None, EntityServiceHandler]] = {}
+
+    def _register(self, service: str, handler, schema: vol.Schema,
+                  supports_response: SupportsResponse = SupportsResponse.NONE) -> None:
+        _LOGGER.debug(f"installing {service} handler")
+        self._services.add(service)
+        self._hass.services.async_register(
+            COMPONENT_DOMAIN, service,
+            timed_service(self._hass, verify_domain_control(self._hass, COMPONENT_DOMAIN)(handler)),
+            schema=schema, supports_response=supports_response,
+        )
+
+    @callback
+    def async_register(self, service: str, handler, schema: vol.Schema,
+                       supports_response: SupportsResponse = SupportsResponse.NONE) -> None:
+        """Add a service that isn't aimed at entities, it's called as
+        `handler(hass, call)`.
+        """
+        if service in self._services:
+            return
+
+        async def _async_call(call: ServiceCall):
+            return await handler(self._hass, call)
+        self._register(service, _async_call, schema, supports_response)
+
+    @callback
+    def async_register_entity_service(self, service: str, domain: str | None,
+                                      handler: EntityServiceHandler, schema: vol.Schema) -> None:
+        """Handle `service` for the entities in `domain`, `None` handles any
+        domain without its own handler.
+        """
+        handlers = self._handlers.get(service)
+        if handlers is None:
+            handlers = self._handlers[service] = {}
+
+            async def _async_service(call: ServiceCall) -> None:
+                await self._async_dispatch(call, handlers)
+            self._register(service, _async_service, schema)
+        handlers[domain] = handler
+
+    async def _async_dispatch(self, call: ServiceCall, handlers: dict) -> None:
+        # Check everything first so a bad entity doesn't leave a call half done.
+        targets = {}
+        for entity_id in call.data[ATTR_ENTITY_ID]:
+            domain = entity_id.split(".", 1)[0]
+            target = targets.get(domain)
+            if target is None:
+                handler = handlers.get(domain, handlers.get(None))
+                if handler is None:
+                    raise HomeAssistantError(f"{call.domain}.{call.service} doesn't support {entity_id}")
+                target = targets[domain] = (handler, [])
+            target[1].append(entity_id)
+
+        for handler, entity_ids in targets.values():
+            await handler(self._hass, call, entity_ids)
+
+    @callback
+    def async_remove(self) -> None:
+        for service in self._services:
+            _LOGGER.debug(f"removing {service} handler")
+            self._hass.services.async_remove(COMPONENT_DOMAIN, service)
+        self._services.clear()
+        self._handlers.clear()
+
+
+@callback
+def async_get_services(hass: HomeAssistant) -> VirtualServices:
+    """Return the service dispatcher, creating it if needed."""
+    services = hass.data.get(COMPONENT_SERVICES)
+    if services is None:
+        services = hass.data[COMPONENT_SERVICES] = VirtualServices(hass)
+    return services
+
+
+@callback
+def async_stop_services(hass: HomeAssistant) -> None:
+    services = hass.data.pop(COMPONENT_SERVICES, None)
+    if services is not None:
+        services.async_remove()
@@ -0,0 +1,100 @@
+"""
+Provides group snapshots.
+
+`virtual.snapshot` saves the state of every entity in a group, either in
+memory under a name or to a file, and `virtual.restore_snapshot` puts them
+all back. Entities are saved as the values they hold, not as the state they
+write, so nothing is parsed back and units aren't converted twice. Every
+entity is changed before any of them write so the restore reaches the state
+machine as a single burst.
+
+Snapshots in memory are kept until Home Assistant stops, they survive a
+group being reloaded.
+"""
+
+import json
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.json import JSONEncoder
+
+from .const import *
+from .metrics import async_get_metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+def _write_snapshot(file_name: str, states: dict[str, dict]) -> None:
+    with open(file_name, "w") as snapshot_file:
+        json.dump(states, snapshot_file, cls=JSONEncoder, indent=2)
+
+
+def _read_snapshot(file_name: str) -> dict[str, dict]:
+    with open(file_name) as snapshot_file:
+        return json.load(snapshot_file)
+
+
+class VirtualSnapshots(object):
+    """Named snapshots of groups."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._snapshots: dict[tuple[str, str], dict[str, dict]] = {}
+
+    def _file_name(self, file_name: str) -> str:
+        file_name = self._hass.config.path(file_name)
+        if not self._hass.config.is_allowed_path(file_name):
+            raise HomeAssistantError(f"{file_name} is not an allowed path")
+        return file_name
+
+    async def async_snapshot(self, group_name: str, name: str, file_name: str | None = None) -> int:
+        """Save the group's entities, returns how many were saved."""
+        entities = async_get_metrics(self._hass).entities(group_name)
+        if not entities:
+            raise HomeAssistantError(f"no virtual group called {group_name}")
+
+        states = {entity.entity_id: entity._snapshot() for entity in entities}
+        if file_name is not None:
+            file_name = self._file_name(file_name)
+            await self._hass.async_add_executor_job(_write_snapshot, file_name, states)
+        else:
+            self._snapshots[(group_name, name)] = states
+        _LOGGER.debug(f"saved {len(states)} entities from {group_name} to {file_name or name}")
+        return len(states)
+
+    async def async_restore(self, group_name: str, name: str, file_name: str | None = None) -> int:
+        """Put the group's entities back, returns how many were restored.
+
+        Entities added since the snapshot are left alone.
+        """
+        if file_name is not None:
+            file_name = self._file_name(file_name)
+            try:
+                states = await self._hass.async_add_executor_job(_read_snapshot, file_name)
+            except (OSError, ValueError) as e:
+                raise HomeAssistantError(f"can't read snapshot {file_name}: {e}")
+        else:
+            states = self._snapshots.get((group_name, name))
+            if states is None:
+                raise HomeAssistantError(f"no snapshot called {name} for {group_name}")
+
+        restored = []
+        for entity in async_get_metrics(self._hass).entities(group_name):
+            state = states.get(entity.entity_id)
+            if state is not None:
+                entity._apply_snapshot(state)
+                restored.append(entity)
+        for entity in restored:
+            entity.async_write_ha_state()
+        _LOGGER.debug(f"restored {len(restored)} entities in {group_name} from {file_name or name}")
+        return len(restored)
+
+
+@callback
+def async_get_snapshots(hass: HomeAssistant) -> VirtualSnapshots:
+    """Return the shared snapshots, creating them if needed."""
+    snapshots = hass.data.get(COMPONENT_SNAPSHOTS)
+    if snapshots is None:
+        snapshots = hass.data[COMPONENT_SNAPSHOTS] = VirtualSnapshots(hass)
+    return snapshots
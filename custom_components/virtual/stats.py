@@ -0,0 +1,116 @@
+"""
+Provides rolling statistics for virtual sensors.
+
+Samples are kept in a fixed size ring buffer. The mean is kept as a running
+sum and min and max are tracked with monotonic queues, so adding a sample is
+O(1), amortised, whatever the window size.
+"""
+
+import logging
+from collections import deque
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_STATISTICS_COUNT = "statistics_count"
+ATTR_STATISTICS_MAX = "statistics_max"
+ATTR_STATISTICS_MEAN = "statistics_mean"
+ATTR_STATISTICS_MIN = "statistics_min"
+ATTR_STATISTICS_RATE = "statistics_rate"
+
+
+class WindowedStatistics(object):
+    """Rolling min, max, mean and rate of change.
+
+    The window holds at most `size` samples. If `max_age` is given samples
+    older than `max_age` seconds are dropped as well.
+    """
+
+    def __init__(self, size: int, max_age: float | None = None):
+        self._size = size
+        self._max_age = max_age
+
+        self._times = [0.0] * size
+        self._values = [0.0] * size
+        self._first = 0
+        self._next = 0
+        self._sum = 0.0
+
+        # (sequence, value) pairs, values increasing for min and decreasing
+        # for max.
+        self._min = deque()
+        self._max = deque()
+
+    @property
+    def count(self) -> int:
+        return self._next - self._first
+
+    def _expire_one(self) -> None:
+        index = self._first % self._size
+        self._sum -= self._values[index]
+        if self._min and self._min[0][0] == self._first:
+            self._min.popleft()
+        if self._max and self._max[0][0] == self._first:
+            self._max.popleft()
+        self._first += 1
+
+    def expire(self, now: float) -> None:
+        """Drop samples that have aged out of the window."""
+        if self._max_age is None:
+            return
+        while self.count and self._times[self._first % self._size] < now - self._max_age:
+            self._expire_one()
+
+    def next_expiry(self) -> float | None:
+        """When the oldest sample ages out, `None` if nothing will."""
+        if self._max_age is None or not self.count:
+            return None
+        return self._times[self._first % self._size] + self._max_age
+
+    def add(self, now: float, value: float) -> None:
+        if self.count == self._size:
+            self._expire_one()
+
+        index = self._next % self._size
+        self._times[index] = now
+        self._values[index] = value
+        self._sum += value
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((self._next, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((self._next, value))
+
+        self._next += 1
+        self.expire(now)
+
+    def attributes(self, now: float) -> dict:
+        self.expire(now)
+        count = self.count
+        if count == 0:
+            return {
+                ATTR_STATISTICS_COUNT: 0,
+                ATTR_STATISTICS_MIN: None,
+                ATTR_STATISTICS_MAX: None,
+                ATTR_STATISTICS_MEAN: None,
+                ATTR_STATISTICS_RATE: None,
+            }
+
+        first = self._first % self._size
+        last = (self._next - 1) % self._size
+        elapsed = self._times[last] - self._times[first]
+        rate = None
+        if elapsed > 0:
+            rate = (self._values[last] - self._values[first]) / elapsed
+
+        return {
+            ATTR_STATISTICS_COUNT: count,
+            ATTR_STATISTICS_MIN: self._min[0][1],
+            ATTR_STATISTICS_MAX: self._max[0][1],
+            ATTR_STATISTICS_MEAN: self._sum / count,
+            ATTR_STATISTICS_RATE: rate,
+        }
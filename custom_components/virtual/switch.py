@@ -26,6 +26,7 @@ from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from . import get_entity_configs
 from .const import *
 from .entity import VirtualEntity, virtual_schema
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -72,6 +73,8 @@ async def async_setup_entry(
 class VirtualSwitch(VirtualEntity, SwitchEntity):
     """Representation of a Virtual switch."""
 
+    _snapshot_attrs = VirtualEntity._snapshot_attrs + ("_attr_is_on",)
+
     def __init__(self, config, old_style : bool):
         """Initialize the Virtual switch device."""
         super().__init__(config, PLATFORM_DOMAIN, old_style)
@@ -98,10 +101,12 @@ class VirtualSwitch(VirtualEntity, SwitchEntity):
             ) if value is not None
         })
 
+    @traced_operation
     async def async_turn_on(self, **kwargs: Any) -> None:
         _LOGGER.debug(f"turning {self.name} on")
         self._attr_is_on = True
 
+    @traced_operation
     async def async_turn_off(self, **kwargs: Any) -> None:
         _LOGGER.debug(f"turning {self.name} off")
         self._attr_is_on = False
@@ -0,0 +1,202 @@
+"""
+Provides opt-in span tracing for virtual entities.
+
+When `trace` is set in the component configuration we record a span for
+every virtual service call, every entity lookup, every entity operation and
+every state write. Spans nest, a state write made by an operation made by a
+service call shares its trace, so you can see where the time went.
+
+Spans are written, one JSON object per line, in the shape OpenTelemetry uses
+for spans. They are buffered and written from the executor, and the file is
+rotated when it gets too big. Entity operations slower than the budget are
+flagged in the span and logged.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import time
+
+import voluptuous as vol
+
+import homeassistant.helpers.config_validation as cv
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_TRACE_BACKUPS = "backups"
+CONF_TRACE_BUDGET = "budget"
+CONF_TRACE_FILE = "file"
+CONF_TRACE_MAX_BYTES = "max_bytes"
+
+DEFAULT_TRACE_BACKUPS = 3
+DEFAULT_TRACE_BUDGET = 50
+DEFAULT_TRACE_FILE = "virtual-trace.jsonl"
+DEFAULT_TRACE_MAX_BYTES = 10 * 1024 * 1024
+
+TRACE_SCHEMA = vol.Schema({
+    vol.Optional(CONF_TRACE_FILE, default=DEFAULT_TRACE_FILE): cv.string,
+    vol.Optional(CONF_TRACE_MAX_BYTES, default=DEFAULT_TRACE_MAX_BYTES): cv.positive_int,
+    vol.Optional(CONF_TRACE_BACKUPS, default=DEFAULT_TRACE_BACKUPS): cv.positive_int,
+    # In milliseconds.
+    vol.Optional(CONF_TRACE_BUDGET, default=DEFAULT_TRACE_BUDGET): vol.All(vol.Coerce(float), vol.Range(min=0)),
+})
+
+# How long spans wait in memory before being written.
+FLUSH_DELAY = 1
+
+SPAN_LOOKUP = "lookup"
+SPAN_OPERATION = "operation"
+SPAN_SERVICE = "service"
+SPAN_STATE_WRITE = "state_write"
+
+_current_span = contextvars.ContextVar("virtual_span", default=None)
+
+
+def _write_spans(file_name: str, spans: list[dict], max_bytes: int, backups: int) -> None:
+    """Append spans to the trace file, rotating it first if needed."""
+    if os.path.exists(file_name) and os.path.getsize(file_name) >= max_bytes:
+        for backup in range(backups - 1, 0, -1):
+            if os.path.exists(f"{file_name}.{backup}"):
+                os.replace(f"{file_name}.{backup}", f"{file_name}.{backup + 1}")
+        if backups:
+            os.replace(file_name, f"{file_name}.1")
+        else:
+            os.remove(file_name)
+    with open(file_name, "a") as trace_file:
+        trace_file.write("".join(json.dumps(span, default=str) + "\n" for span in spans))
+
+
+class _Span(object):
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes", "start")
+
+    def __init__(self, parent, ids, name: str, kind: str, attributes: dict):
+        self.trace_id = parent.trace_id if parent is not None else f"{ids.getrandbits(128):032x}"
+        self.span_id = f"{ids.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+
+
+class VirtualTracer(object):
+    """Record spans and write them out in batches."""
+
+    def __init__(self, hass: HomeAssistant, config: dict):
+        # Only needed when we trace.
+        import random
+
+        self._hass = hass
+        self._ids = random.Random()
+        self._file_name = hass.config.path(config[CONF_TRACE_FILE])
+        self._max_bytes = config[CONF_TRACE_MAX_BYTES]
+        self._backups = config[CONF_TRACE_BACKUPS]
+        self._budget_ns = config[CONF_TRACE_BUDGET] * 1e6
+
+        self._spans = []
+        self._flush_handle = None
+        self._write_lock = asyncio.Lock()
+        self._unsub = hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, self._async_shutting_down)
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str, **attributes):
+        span = _Span(_current_span.get(), self._ids, name, kind, attributes)
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            _current_span.reset(token)
+            self._finish(span, time.time_ns(), error)
+
+    def _finish(self, span: _Span, end: int, error) -> None:
+        attributes = {f"virtual.{name}": value for name, value in span.attributes.items()}
+        if span.kind == SPAN_OPERATION and end - span.start > self._budget_ns:
+            attributes["virtual.over_budget"] = True
+            _LOGGER.warning(f"{span.name} took {(end - span.start) / 1e6:.1f}ms")
+
+        self._spans.append({
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "parentSpanId": span.parent_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": span.start,
+            "endTimeUnixNano": end,
+            "attributes": attributes,
+            "status": {"code": "ERROR", "message": str(error)} if error is not None else {"code": "OK"},
+        })
+        # Not on the timer wheel, it stops when the last group unloads and we
+        # carry on until Home Assistant stops.
+        if self._flush_handle is None:
+            self._flush_handle = async_call_later(self._hass, FLUSH_DELAY, self._async_flush)
+
+    async def _async_flush(self, _now=None) -> None:
+        self._flush_handle = None
+        spans, self._spans = self._spans, []
+        if not spans:
+            return
+        async with self._write_lock:
+            try:
+                await self._hass.async_add_executor_job(
+                    _write_spans, self._file_name, spans, self._max_bytes, self._backups
+                )
+            except OSError as e:
+                _LOGGER.warning(f"failed to write spans to {self._file_name}: {e}")
+
+    async def _async_shutting_down(self, _event) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle()
+        await self._async_flush()
+
+
+@callback
+def async_start_tracer(hass: HomeAssistant, config: dict) -> None:
+    """Start tracing, it runs until Home Assistant stops."""
+    if COMPONENT_TRACER not in hass.data:
+        _LOGGER.info(f"tracing virtual entities to {config[CONF_TRACE_FILE]}")
+        hass.data[COMPONENT_TRACER] = VirtualTracer(hass, config)
+
+
+def trace_span(hass: HomeAssistant, name: str, kind: str, **attributes):
+    """A span if we are tracing, otherwise nothing."""
+    tracer = hass.data.get(COMPONENT_TRACER)
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, kind, **attributes)
+
+
+def traced_operation(method):
+    """Trace an entity operation, it costs a lookup when tracing is off."""
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def _async_traced(self, *args, **kwargs):
+            tracer = self.hass.data.get(COMPONENT_TRACER) if self.hass is not None else None
+            if tracer is None:
+                return await method(self, *args, **kwargs)
+            with tracer.span(f"{self.entity_id}.{method.__name__}", SPAN_OPERATION, entity_id=self.entity_id):
+                return await method(self, *args, **kwargs)
+        return _async_traced
+
+    @functools.wraps(method)
+    def _traced(self, *args, **kwargs):
+        tracer = self.hass.data.get(COMPONENT_TRACER) if self.hass is not None else None
+        if tracer is None:
+            return method(self, *args, **kwargs)
+        with tracer.span(f"{self.entity_id}.{method.__name__}", SPAN_OPERATION, entity_id=self.entity_id):
+            return method(self, *args, **kwargs)
+    return _traced
@@ -0,0 +1,70 @@
+"""
+Provides default units of measurement for sensors and numbers.
+
+Sensor and number device classes share their names so one table, keyed by
+name, serves both. It is built the first time it's needed.
+"""
+
+import functools
+import logging
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@functools.cache
+def _units_of_measurement() -> dict[str, str]:
+    from homeassistant.const import (
+        CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,
+        CONCENTRATION_PARTS_PER_MILLION,
+        LIGHT_LUX,
+        PERCENTAGE,
+        SIGNAL_STRENGTH_DECIBELS,
+        UnitOfApparentPower,
+        UnitOfElectricCurrent,
+        UnitOfElectricPotential,
+        UnitOfEnergy,
+        UnitOfFrequency,
+        UnitOfPower,
+        UnitOfPressure,
+        UnitOfReactivePower,
+        UnitOfVolume,
+    )
+
+    return {
+        "apparent_power": UnitOfApparentPower.VOLT_AMPERE,  # apparent power (VA)
+        "battery": PERCENTAGE,  # % of battery that is left
+        "carbon_monoxide": CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO concentration
+        "carbon_dioxide": CONCENTRATION_PARTS_PER_MILLION,  # ppm of CO2 concentration
+        "humidity": PERCENTAGE,  # % of humidity in the air
+        "illuminance": LIGHT_LUX,  # current light level (lx/lm)
+        "nitrogen_dioxide": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen dioxide
+        "nitrogen_monoxide": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen monoxide
+        "nitrous_oxide": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of nitrogen oxide
+        "ozone": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of ozone
+        "pm1": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM1
+        "pm10": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM10
+        "pm25": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of PM2.5
+        "signal_strength": SIGNAL_STRENGTH_DECIBELS,  # signal strength (dB/dBm)
+        "sulphur_dioxide": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of sulphur dioxide
+        "temperature": "C",  # temperature (C/F)
+        "pressure": UnitOfPressure.HPA,  # pressure (hPa/mbar)
+        "power": UnitOfPower.KILO_WATT,  # power (W/kW)
+        "current": UnitOfElectricCurrent.AMPERE,  # current (A)
+        "energy": UnitOfEnergy.KILO_WATT_HOUR,  # energy (Wh/kWh/MWh)
+        "frequency": UnitOfFrequency.GIGAHERTZ,  # energy (Hz/kHz/MHz/GHz)
+        "power_factor": PERCENTAGE,  # power factor (no unit, min: -1.0, max: 1.0)
+        "reactive_power": UnitOfReactivePower.VOLT_AMPERE_REACTIVE,  # reactive power (var)
+        "volatile_organic_compounds": CONCENTRATION_MICROGRAMS_PER_CUBIC_METER,  # µg/m³ of vocs
+        "voltage": UnitOfElectricPotential.VOLT,  # voltage (V)
+        "gas": UnitOfVolume.CUBIC_METERS,  # gas (m³)
+    }
+
+
+def default_unit_of_measurement(device_class: str | None) -> str | None:
+    """The unit we use for `device_class` if the user didn't give one."""
+    if device_class is None:
+        return None
+    return _units_of_measurement().get(str(device_class))
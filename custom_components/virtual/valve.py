@@ -24,7 +24,10 @@ from .const import *
 from .entity import (
     VirtualOpenableEntity,
     virtual_schema, positive_tick,
+    open_close_mode, publish_interval,
 )
+from .publish import PUBLISH_POLICY_SCHEMA
+from .tracing import traced_operation
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -37,11 +40,17 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(virtual_schema(DEFAULT_VALVE_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_OPEN_CLOSE_DURATION, default=10): cv.positive_int,
     vol.Optional(CONF_OPEN_CLOSE_TICK, default=1): positive_tick,
+    vol.Optional(CONF_OPEN_CLOSE_MODE, default=OPEN_CLOSE_MODE_TICK): open_close_mode,
+    vol.Optional(CONF_OPEN_CLOSE_PUBLISH_INTERVAL): publish_interval,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 VALVE_SCHEMA = vol.Schema(virtual_schema(DEFAULT_VALVE_VALUE, {
     vol.Optional(CONF_CLASS): cv.string,
     vol.Optional(CONF_OPEN_CLOSE_DURATION, default=10): cv.positive_int,
     vol.Optional(CONF_OPEN_CLOSE_TICK, default=1): positive_tick,
+    vol.Optional(CONF_OPEN_CLOSE_MODE, default=OPEN_CLOSE_MODE_TICK): open_close_mode,
+    vol.Optional(CONF_OPEN_CLOSE_PUBLISH_INTERVAL): publish_interval,
+    **PUBLISH_POLICY_SCHEMA,
 }))
 
 
@@ -90,20 +99,24 @@ class VirtualValve(VirtualOpenableEntity, ValveEntity):
 
     @property
     def current_valve_position(self) -> int | None:
-        return round(self._current_position)
+        return round(self._position())
 
+    @traced_operation
     async def async_open_valve(self) -> None:
         _LOGGER.info(f"opening {self.name}")
         self._set_position(100)
 
+    @traced_operation
     async def async_close_valve(self) -> None:
         _LOGGER.info(f"closing {self.name}")
         self._set_position(0)
 
+    @traced_operation
     async def async_stop_valve(self) -> None:
         _LOGGER.info(f"stopping {self.name}")
         self._stop()
 
+    @traced_operation
     async def async_set_valve_position(self, position: int) -> None:
         _LOGGER.info(f"setting {self.name} position {position}")
         self._set_position(position)
@@ -0,0 +1,190 @@
+"""
+Provides fast zone lookups for virtual device trackers.
+
+Home Assistant finds the zone a GPS tracker is in by checking every zone.
+With lots of zones and lots of moves that adds up, so we keep a grid of
+zones instead. Each zone is added to every cell its circle touches and a
+lookup only checks the zones in the cells around the point.
+
+The choice of zone follows Home Assistant; passive and unavailable zones are
+ignored, the point, allowing for the GPS accuracy, must be inside the zone
+and the zone with the closest centre wins, the smaller zone on a tie.
+"""
+
+import logging
+import math
+
+from homeassistant.components.zone import (
+    ATTR_PASSIVE,
+    ATTR_RADIUS,
+    DOMAIN as ZONE_DOMAIN,
+    ENTITY_ID_HOME,
+)
+from homeassistant.const import (
+    ATTR_LATITUDE,
+    ATTR_LONGITUDE,
+    EVENT_STATE_CHANGED,
+    STATE_HOME,
+    STATE_NOT_HOME,
+    STATE_UNAVAILABLE,
+)
+from homeassistant.core import HomeAssistant, callback
+
+from .const import *
+
+
+_LOGGER = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6371008.8
+METRES_PER_DEGREE = EARTH_RADIUS * math.pi / 180.0
+
+DEFAULT_CELL_SIZE = 0.05
+
+
+def _distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in metres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _degrees(latitude: float, metres: float) -> tuple[float, float]:
+    """How many degrees of latitude and longitude `metres` covers."""
+    lat_degrees = metres / METRES_PER_DEGREE
+    lon_degrees = metres / (METRES_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+    return lat_degrees, min(lon_degrees, 180.0)
+
+
+class ZoneIndex(object):
+    """A grid of zones.
+
+    Zones are `(key, latitude, longitude, radius)` tuples, lookups return the
+    key of the zone a point is in.
+    """
+
+    def __init__(self, zones=(), cell_size: float = DEFAULT_CELL_SIZE):
+        self._cell_size = cell_size
+        self._cells: dict[tuple[int, int], list] = {}
+        self._zones = []
+        for zone in zones:
+            self.add(*zone)
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    def _cell_range(self, latitude: float, longitude: float, metres: float):
+        lat_degrees, lon_degrees = _degrees(latitude, metres)
+        lat_cells = range(
+            math.floor((latitude - lat_degrees) / self._cell_size),
+            math.floor((latitude + lat_degrees) / self._cell_size) + 1
+        )
+        lon_cells = range(
+            math.floor((longitude - lon_degrees) / self._cell_size),
+            math.floor((longitude + lon_degrees) / self._cell_size) + 1
+        )
+        return lat_cells, lon_cells
+
+    def add(self, key, latitude: float, longitude: float, radius: float) -> None:
+        zone = (key, latitude, longitude, radius)
+        self._zones.append(zone)
+        lat_cells, lon_cells = self._cell_range(latitude, longitude, radius)
+        for lat_cell in lat_cells:
+            for lon_cell in lon_cells:
+                self._cells.setdefault((lat_cell, lon_cell), []).append(zone)
+
+    def resolve(self, latitude: float, longitude: float, accuracy: float = 0):
+        """Return the key of the zone containing the point, or `None`."""
+        if accuracy > 0:
+            lat_cells, lon_cells = self._cell_range(latitude, longitude, accuracy)
+            candidates = set()
+            for lat_cell in lat_cells:
+                for lon_cell in lon_cells:
+                    candidates.update(self._cells.get((lat_cell, lon_cell), ()))
+        else:
+            candidates = self._cells.get((
+                math.floor(latitude / self._cell_size),
+                math.floor(longitude / self._cell_size)
+            ), ())
+
+        closest = None
+        closest_distance = None
+        for zone in candidates:
+            distance = _distance(latitude, longitude, zone[1], zone[2])
+            if distance - accuracy >= zone[3]:
+                continue
+            if (closest is None or distance < closest_distance or
+                    (distance == closest_distance and zone[3] < closest[3])):
+                closest = zone
+                closest_distance = distance
+        return closest[0] if closest is not None else None
+
+
+class VirtualZoneResolver(object):
+    """Keep a zone index in step with Home Assistant's zones."""
+
+    def __init__(self, hass: HomeAssistant):
+        self._hass = hass
+        self._index = None
+        self._names = {}
+        self._unsub = hass.bus.async_listen(
+            EVENT_STATE_CHANGED, self._async_zone_changed, event_filter=self._is_zone_event
+        )
+
+    @callback
+    def _is_zone_event(self, event_data) -> bool:
+        return event_data["entity_id"].startswith(f"{ZONE_DOMAIN}.")
+
+    @callback
+    def _async_zone_changed(self, _event) -> None:
+        # Rebuild on the next lookup, zones tend to change in bursts.
+        self._index = None
+
+    def _build(self) -> ZoneIndex:
+        index = ZoneIndex()
+        self._names = {}
+        for state in self._hass.states.async_all(ZONE_DOMAIN):
+            if state.state == STATE_UNAVAILABLE or state.attributes.get(ATTR_PASSIVE):
+                continue
+            try:
+                index.add(
+                    state.entity_id,
+                    float(state.attributes[ATTR_LATITUDE]),
+                    float(state.attributes[ATTR_LONGITUDE]),
+                    float(state.attributes[ATTR_RADIUS])
+                )
+            except (KeyError, TypeError, ValueError):
+                continue
+            self._names[state.entity_id] = STATE_HOME if state.entity_id == ENTITY_ID_HOME else state.name
+        _LOGGER.debug(f"indexed {len(index)} zones")
+        return index
+
+    @callback
+    def async_location_name(self, latitude: float, longitude: float, accuracy: float = 0) -> str:
+        """Return the tracker state for a point, as Home Assistant would."""
+        if self._index is None:
+            self._index = self._build()
+        zone = self._index.resolve(latitude, longitude, accuracy)
+        if zone is None:
+            return STATE_NOT_HOME
+        return self._names[zone]
+
+    @callback
+    def async_stop(self) -> None:
+        self._unsub()
+
+
+@callback
+def async_get_zone_resolver(hass: HomeAssistant) -> VirtualZoneResolver:
+    """Return the shared zone resolver, creating it if needed."""
+    resolver = hass.data.get(COMPONENT_ZONES)
+    if resolver is None:
+        resolver = hass.data[COMPONENT_ZONES] = VirtualZoneResolver(hass)
+    return resolver
+
+
+@callback
+def async_stop_zone_resolver(hass: HomeAssistant) -> None:
+    """Stop tracking zones."""
+    resolver = hass.data.pop(COMPONENT_ZONES, None)
+    if resolver is not None:
+        resolver.async_stop()